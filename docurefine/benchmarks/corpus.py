@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import cv2
+import numpy as np
+from src.pdf_utils import StreamingPdfWriter
+
+# Page kinds, in the order the corpus cycles through them
+PAGE_KINDS = ('text', 'columns', 'figures', 'scan')
+
+VOCABULARY = (
+    'the', 'revenue', 'quarter', 'region', 'growth', 'compared', 'with', 'previous', 'results', 'model',
+    'analysis', 'page', 'document', 'layout', 'table', 'figure', 'section', 'data', 'value', 'report',
+    'increase', 'decrease', 'annual', 'summary', 'customer', 'product', 'market', 'share', 'cost', 'margin',
+)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+INK = (20, 20, 20)
+
+def page_size(dpi):
+    """
+    Return the (width, height) in pixels of a letter-size page.
+    """
+    return int(8.5 * dpi), int(11 * dpi)
+
+def draw_words(page, left, top, right, rng, scale, lines):
+    """
+    Draw lines of random words into a column and return the word boxes.
+
+    :return: List of OCR-style word dictionaries (text, left, top, width, height, conf)
+    """
+    thickness = max(1, int(round(scale * 2)))
+    (_, line_height), _ = cv2.getTextSize('Hg', FONT, scale, thickness)
+    line_step = int(line_height * 1.8)
+    space, _ = cv2.getTextSize(' ', FONT, scale, thickness)
+
+    boxes = []
+    for line in range(lines):
+        baseline = top + line_height + line * line_step
+        x = left
+        while True:
+            text = VOCABULARY[rng.integers(len(VOCABULARY))]
+            (width, height), _ = cv2.getTextSize(text, FONT, scale, thickness)
+            if x + width > right:
+                break
+            cv2.putText(page, text, (x, baseline), FONT, scale, INK, thickness, cv2.LINE_AA)
+            boxes.append({'text': text, 'left': x, 'top': baseline - height, 'width': width, 'height': height,
+                          'conf': 95.0})
+            x += width + space[0]
+    return boxes
+
+def block(element_type, words, coordinates=None):
+    """
+    Build a ground-truth layout element around its words.
+    """
+    if coordinates is None:
+        coordinates = (min(word['left'] for word in words), min(word['top'] for word in words),
+                       max(word['left'] + word['width'] for word in words),
+                       max(word['top'] + word['height'] for word in words))
+    return {'type': element_type, 'coordinates': tuple(int(value) for value in coordinates), 'score': 1.0}
+
+def draw_figure(page, left, top, right, bottom, rng):
+    """
+    Draw a chart-like figure: axes, bars and a curve.
+    """
+    cv2.rectangle(page, (left, top), (right, bottom), (90, 90, 90), 2)
+    bars = int(rng.integers(4, 9))
+    bar_width = (right - left) // (bars * 2)
+    for i in range(bars):
+        height = int(rng.uniform(0.2, 0.9) * (bottom - top))
+        x = left + bar_width // 2 + i * 2 * bar_width
+        color = tuple(int(value) for value in rng.integers(40, 200, 3))
+        cv2.rectangle(page, (x, bottom - height), (x + bar_width, bottom - 2), color, -1)
+    xs = np.linspace(left, right, 64)
+    ys = top + (bottom - top) * (0.5 + 0.35 * np.sin(np.linspace(0, rng.uniform(2, 6) * np.pi, 64)))
+    cv2.polylines(page, [np.stack([xs, ys], axis=1).astype(np.int32)], False, (200, 40, 40), 3, cv2.LINE_AA)
+
+def text_page(rng, dpi):
+    width, height = page_size(dpi)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = dpi
+    scale = dpi / 100
+
+    title = draw_words(page, margin, margin, width - margin, rng, scale * 1.6, 1)
+    body = draw_words(page, margin, margin + 2 * dpi // 3, width - margin, rng, scale, 16)
+    return page, {'words': title + body, 'layout': [block('Title', title), block('Text', body)]}
+
+def columns_page(rng, dpi):
+    width, height = page_size(dpi)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = dpi * 3 // 4
+    gutter = dpi // 3
+    column_width = (width - 2 * margin - gutter) // 2
+    scale = dpi / 120
+
+    title = draw_words(page, margin, margin, width - margin, rng, scale * 1.8, 1)
+    words, layout = list(title), [block('Title', title)]
+    for column in range(2):
+        left = margin + column * (column_width + gutter)
+        top = margin + dpi // 2
+        for _ in range(3):
+            paragraph = draw_words(page, left, top, left + column_width, rng, scale, 6)
+            words.extend(paragraph)
+            layout.append(block('Text', paragraph))
+            top = layout[-1]['coordinates'][3] + dpi // 4
+    return page, {'words': words, 'layout': layout}
+
+def figures_page(rng, dpi):
+    width, height = page_size(dpi)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = dpi
+    scale = dpi / 100
+
+    title = draw_words(page, margin, margin, width - margin, rng, scale * 1.6, 1)
+    above = draw_words(page, margin, margin + dpi // 2, width - margin, rng, scale, 6)
+    figure = (margin, above[-1]['top'] + dpi // 2, width - margin, above[-1]['top'] + dpi // 2 + 3 * dpi)
+    draw_figure(page, *figure, rng)
+    below = draw_words(page, margin, figure[3] + dpi // 3, width - margin, rng, scale, 4)
+    layout = [block('Title', title), block('Text', above), block('Figure', [], figure), block('Text', below)]
+    return page, {'words': title + above + below, 'layout': layout}
+
+def scan_page(rng, dpi):
+    """
+    A text page degraded like a scan: tinted paper, a slight skew, blur, noise and JPEG artifacts.
+    """
+    page, truth = text_page(rng, dpi)
+    height, width = page.shape[:2]
+    page = (page.astype(np.float32) * np.array([0.93, 0.91, 0.86], dtype=np.float32)).astype(np.uint8)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-1.5, 1.5), 1.0)
+    page = cv2.warpAffine(page, rotation, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    page = cv2.GaussianBlur(page, (3, 3), 0)
+    noise = rng.normal(0, 8, page.shape)
+    page = np.clip(page + noise, 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED), truth
+
+GENERATORS = {'text': text_page, 'columns': columns_page, 'figures': figures_page, 'scan': scan_page}
+
+def synthetic_page(kind, seed, dpi=150):
+    """
+    Generate one synthetic page.
+
+    The page is a pure function of (kind, seed, dpi), so every run and every
+    commit benchmarks the same pixels.
+
+    :param kind: One of PAGE_KINDS
+    :param seed: Random seed
+    :param dpi: Page resolution
+    :return: Tuple of (RGB numpy array, ground truth with 'words' and 'layout')
+    """
+    return GENERATORS[kind](np.random.default_rng([seed, PAGE_KINDS.index(kind)]), dpi)
+
+def generate_corpus(output_directory, pages=8, seed=0, dpi=150, kinds=PAGE_KINDS):
+    """
+    Write a synthetic corpus of page images, their ground truth and a PDF of them.
+
+    Pages cycle through the given kinds. The corpus is written as
+    page_<N>.png files, truth.json and corpus.pdf.
+
+    :param output_directory: Directory to write the corpus to
+    :param pages: Number of pages
+    :param seed: Random seed; the same seed always gives the same corpus
+    :param dpi: Page resolution
+    :param kinds: Page kinds to cycle through
+    :return: Dictionary with 'pages' (page number, kind, image path and ground truth of each page),
+             'pdf_path' and 'digest', a hash of every page's pixels and ground truth
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    digest = hashlib.sha256(f"{seed}:{dpi}".encode())
+    corpus_pages = []
+    pdf_path = os.path.join(output_directory, 'corpus.pdf')
+    with StreamingPdfWriter(pdf_path, dpi=dpi) as pdf_writer:
+        for page_number in range(1, pages + 1):
+            kind = kinds[(page_number - 1) % len(kinds)]
+            image, truth = synthetic_page(kind, seed + page_number, dpi)
+            image_path = os.path.join(output_directory, f"page_{page_number}.png")
+            cv2.imwrite(image_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            pdf_writer.add_page(image)
+
+            digest.update(image.tobytes())
+            digest.update(json.dumps(truth, sort_keys=True).encode())
+            corpus_pages.append({'page_number': page_number, 'kind': kind, 'image_path': image_path, 'truth': truth})
+
+    with open(os.path.join(output_directory, 'truth.json'), 'w') as f:
+        json.dump({page['page_number']: page['truth'] for page in corpus_pages}, f)
+    return {'pages': corpus_pages, 'pdf_path': pdf_path, 'digest': digest.hexdigest()}
@@ -0,0 +1,131 @@
+import importlib.util
+import shutil
+import sys
+import types
+from contextlib import ExitStack
+from unittest.mock import patch
+from page_context import as_page
+
+# Packages each model-backed stage needs
+ENGINE_PACKAGES = {
+    'layout': ('layoutparser', 'torch', 'detectron2'),
+    'ocr': ('pytesseract',),
+    'latex': ('transformers', 'torch'),
+}
+
+# Packages the pipeline modules import at load time
+IMPORTED_PACKAGES = ('layoutparser', 'torch', 'transformers', 'pytesseract')
+
+def installed(package):
+    return package in sys.modules or importlib.util.find_spec(package) is not None
+
+def engine_available(stage):
+    """
+    Check whether the real engine of a model-backed stage can run here.
+    """
+    if stage == 'ocr' and installed('tesserocr'):
+        return True
+    if stage == 'ocr' and shutil.which('tesseract') is None:
+        return False
+    return all(installed(package) for package in ENGINE_PACKAGES[stage])
+
+def select_engines(stubs=()):
+    """
+    Decide which model-backed stages run their real engine and which a stub.
+
+    :param stubs: Stages to stub even when their engine is installed
+    :return: Dictionary mapping 'layout', 'ocr' and 'latex' to 'real' or 'stub'
+    """
+    return {stage: 'stub' if stage in stubs or not engine_available(stage) else 'real' for stage in ENGINE_PACKAGES}
+
+class MissingPackage(types.ModuleType):
+    """
+    Stands in for a package that is not installed so the pipeline modules import.
+
+    Its attributes resolve to more stand-ins; calling one raises, so a stage
+    that was not stubbed fails loudly instead of benchmarking nothing.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return MissingPackage(f"{self.__name__}.{name}")
+
+    def __call__(self, *args, **kwargs):
+        raise RuntimeError(f"{self.__name__} is not installed")
+
+def install_missing_packages():
+    """
+    Register a MissingPackage for every package the pipeline imports that is not installed.
+
+    :return: Names of the missing packages
+    """
+    missing = [package for package in IMPORTED_PACKAGES if not installed(package)]
+    for package in missing:
+        sys.modules[package] = MissingPackage(package)
+    return missing
+
+class StubEngines:
+    """
+    Model stand-ins that answer from the corpus ground truth.
+
+    Layout returns the blocks the page was drawn with, OCR the words, and
+    LaTeX conversion passes text through. Downstream stages therefore see
+    realistic inputs at next to no cost of their own; reports mark the
+    stubbed stages so their timings are not mistaken for the engines'.
+
+    :param corpus_pages: Pages from generate_corpus
+    """
+
+    def __init__(self, corpus_pages):
+        self.truth = {as_page(page['image_path']).fingerprint: page['truth'] for page in corpus_pages}
+
+    def page_truth(self, image):
+        return self.truth.get(as_page(image).fingerprint, {'words': [], 'layout': []})
+
+    def analyze_layout(self, image_path):
+        return [dict(element) for element in self.page_truth(image_path)['layout']]
+
+    def analyze_layout_batch(self, images, batch_size=None):
+        return [self.analyze_layout(image) for image in images]
+
+    def perform_ocr_with_layout(self, image_path):
+        words = [dict(word) for word in self.page_truth(image_path)['words']]
+        return {'text': ' '.join(word['text'] for word in words), 'layout': words, 'lines': []}
+
+    def perform_region_ocr(self, image_path, layout_elements, max_workers=None):
+        words = self.page_truth(image_path)['words']
+        merged_layout = []
+        for element in layout_elements:
+            x1, y1, x2, y2 = element['coordinates']
+            inside = [dict(word) for word in words if element['type'] in ('Title', 'Text', 'List')
+                      and x1 <= word['left'] + word['width'] / 2 <= x2 and y1 <= word['top'] + word['height'] / 2 <= y2]
+            merged_layout.append({'type': element['type'], 'coordinates': element['coordinates'],
+                                  'text': ' '.join(word['text'] for word in inside), 'words': inside})
+        return merged_layout
+
+    @staticmethod
+    def texts_to_latex(texts, batch_size=None):
+        return list(texts)
+
+    def patches(self, engines):
+        """
+        Patch the stubbed stages into the pipeline modules for the duration of the block.
+
+        :param engines: Engine selection from select_engines
+        :return: ExitStack to use as a context manager
+        """
+        targets = {
+            'layout': {'src.celery_tasks.analyze_layout': self.analyze_layout,
+                       'src.celery_tasks.analyze_layout_batch': self.analyze_layout_batch},
+            'ocr': {'src.celery_tasks.perform_ocr_with_layout': self.perform_ocr_with_layout,
+                    'src.celery_tasks.perform_region_ocr': self.perform_region_ocr,
+                    'src.celery_tasks.ocr_engine_version': lambda: 'stub'},
+            'latex': {'latex_converter.texts_to_latex': self.texts_to_latex},
+        }
+        stack = ExitStack()
+        for stage, engine in engines.items():
+            if engine == 'stub':
+                for target, stub in targets[stage].items():
+                    stack.enter_context(patch(target, stub))
+        return stack
@@ -0,0 +1,91 @@
+import os
+import resource
+import threading
+import numpy as np
+
+def current_rss_bytes():
+    """
+    Return the resident set size of this process in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the lifetime peak, reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakRss:
+    """
+    Context manager tracking the peak resident set size over a block.
+
+    The RSS is sampled on a background thread, since the lifetime peak the
+    kernel keeps cannot be reset between stages.
+
+    :param interval: Seconds between samples
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+def summarize(latencies, peak_rss=None, engine=None):
+    """
+    Summarize the per-page latencies of a benchmark run.
+
+    :param latencies: Seconds spent on each page
+    :param peak_rss: Peak resident set size during the run, in bytes
+    :param engine: 'real' or 'stub' for model-backed stages
+    :return: Dictionary with the page count, pages/sec, p50/p95/mean latency in ms and peak RSS in MB
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = float(latencies.sum())
+    summary = {
+        'pages': int(latencies.size),
+        'pages_per_sec': round(latencies.size / total, 3) if total > 0 else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3) if latencies.size else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 3) if latencies.size else None,
+        'mean_ms': round(total / latencies.size * 1000, 3) if latencies.size else None,
+    }
+    if peak_rss is not None:
+        summary['peak_rss_mb'] = round(peak_rss / 1024 ** 2, 1)
+    if engine is not None:
+        summary['engine'] = engine
+    return summary
+
+def compare_reports(baseline, report):
+    """
+    Compare two benchmark reports, stage by stage.
+
+    :param baseline: Report of the reference commit
+    :param report: Report to compare with it
+    :return: List of (name, metric, baseline value, new value, relative change) tuples;
+             the change is None when either value is missing
+    """
+    rows = []
+    runs = [(f"stage:{name}", baseline.get('stages', {}).get(name), result)
+            for name, result in report.get('stages', {}).items()]
+    runs.append(('pipeline', baseline.get('pipeline'), report.get('pipeline')))
+    for name, old, new in runs:
+        if not old or not new:
+            continue
+        for metric in ('pages_per_sec', 'p50_ms', 'p95_ms', 'peak_rss_mb'):
+            before, after = old.get(metric), new.get(metric)
+            change = (after - before) / before if before and after is not None else None
+            rows.append((name, metric, before, after, change))
+    return rows
@@ -0,0 +1,249 @@
+"""
+Benchmark the pipeline on a deterministic synthetic corpus.
+
+Each stage is timed in isolation, page by page, then the whole process_page
+pipeline. Model-backed stages run their real engine where it is installed
+and a ground-truth stub otherwise. The report is JSON, meant to be diffed
+between commits:
+
+    python -m benchmarks.run --pages 16 --output benchmark.json
+    python -m benchmarks.run --pages 16 --baseline benchmark.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, 'src'), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from config.config import config
+from benchmarks.corpus import PAGE_KINDS, generate_corpus
+from benchmarks.engines import StubEngines, install_missing_packages, select_engines
+from benchmarks.report import PeakRss, compare_reports, current_rss_bytes, summarize
+
+def isolate(work_directory):
+    """
+    Point every cache and store the pipeline writes to at the work directory, and turn off Redis.
+
+    Runs start cold and leave nothing behind; the page cache is kept in memory only.
+    """
+    config.PAGE_CACHE_DIR = ''
+    config.ARTIFACT_DIR = os.path.join(work_directory, 'artifacts')
+    config.TEX_CACHE_DIR = os.path.join(work_directory, 'tex')
+    config.REDIS_URL = None
+    config.PAGE_DEDUP_SCOPE = 'document'
+
+def time_pages(items, function):
+    """
+    Call function on each item and time each call.
+
+    :return: Tuple of (results, latencies in seconds, peak RSS in bytes)
+    """
+    results = []
+    latencies = []
+    with PeakRss() as rss:
+        for item in items:
+            start = time.perf_counter()
+            results.append(function(item))
+            latencies.append(time.perf_counter() - start)
+    return results, latencies, rss.peak
+
+def run_stages(corpus, engines, work_directory, warmup=1):
+    """
+    Time each stage in isolation over the corpus.
+
+    Stages run one after another over every page, each fed the previous
+    stage's outputs, so a stage's timing covers that stage only. The first
+    warmup pages are run through every stage untimed first, to load models.
+
+    :return: Dictionary mapping stage names to summaries
+    """
+    from src import celery_tasks
+    from latex_converter import convert_layouts_to_latex
+    from page_context import PageContext
+    from page_dedup import is_blank, perceptual_hash
+    from pdf_utils import StreamingPdfWriter, rasterize_pdf
+
+    output_directory = os.path.join(work_directory, 'stages')
+    os.makedirs(output_directory, exist_ok=True)
+
+    def stage_functions(pdf_writer):
+        ocr = (lambda page: celery_tasks.perform_region_ocr(page['image'], page['layout'])) \
+            if config.OCR_MODE == 'region' else (lambda page: celery_tasks.perform_ocr_with_layout(page['image']))
+        merge = (lambda page: page['ocr']) if config.OCR_MODE == 'region' \
+            else (lambda page: celery_tasks.merge_ocr_and_layout(page['ocr'], page['layout']))
+
+        def render(page):
+            return celery_tasks.generate_image_from_latex(page['latex'], page['refined_path'])
+
+        def refine(page):
+            return celery_tasks.refine_image(page['image'], PageContext(rgb=page['render'], path=page['refined_path']))
+
+        def assemble(page):
+            words = page['ocr']['layout'] if 'layout' in page['ocr'] else \
+                [word for element in page['ocr'] for word in element['words']]
+            pdf_writer.add_page(page['refine'], words=words, source_size=page['image'].shape[::-1])
+
+        return [
+            ('screen', lambda page: (is_blank(page['image']), perceptual_hash(page['image']))),
+            ('layout', lambda page: celery_tasks.analyze_layout(page['image'])),
+            ('ocr', ocr),
+            ('merge', merge),
+            ('latex', lambda page: convert_layouts_to_latex([page['merge']])[0]),
+            ('render', render),
+            ('refine', refine),
+            ('assemble', assemble),
+        ]
+
+    def load_pages(corpus_pages):
+        pages = []
+        for page in corpus_pages:
+            image = PageContext.from_path(page['image_path'], page_number=page['page_number'])
+            image.rgb, image.fingerprint  # Decode and hash outside the timed stages
+            pages.append({'page_number': page['page_number'], 'image': image,
+                          'refined_path': os.path.join(output_directory, f"refined_page_{page['page_number']}.png")})
+        return pages
+
+    with StreamingPdfWriter(os.path.join(output_directory, 'warmup.pdf')) as pdf_writer:
+        for page in load_pages(corpus['pages'][:warmup]):
+            for stage, function in stage_functions(pdf_writer):
+                page[stage] = function(page)
+
+    summaries = {}
+    page_numbers = set(page['page_number'] for page in corpus['pages'])
+    rasterized = rasterize_pdf(corpus['pdf_path'], pages=page_numbers)
+    _, latencies, peak = time_pages(page_numbers, lambda _: next(rasterized))
+    summaries['rasterize'] = summarize(latencies, peak)
+
+    pages = load_pages(corpus['pages'])
+    with StreamingPdfWriter(os.path.join(output_directory, 'reconstructed.pdf')) as pdf_writer:
+        for stage, function in stage_functions(pdf_writer):
+            results, latencies, peak = time_pages(pages, function)
+            for page, result in zip(pages, results):
+                page[stage] = result
+            summaries[stage] = summarize(latencies, peak, engines.get(stage))
+    return summaries
+
+def run_pipeline(corpus, work_directory, warmup=1):
+    """
+    Time the whole process_page pipeline on each page of the corpus, from a cold page cache.
+
+    :return: Summary of the run
+    """
+    from src.celery_tasks import process_page
+    from page_cache import get_page_cache
+    from snippet_renderer import get_snippet_renderer
+
+    warmup_directory = os.path.join(work_directory, 'warmup')
+    os.makedirs(warmup_directory, exist_ok=True)
+    for page in corpus['pages'][:warmup]:
+        process_page(page['image_path'], warmup_directory, page_number=page['page_number'])
+    get_page_cache().clear()
+    get_snippet_renderer().clear()
+
+    output_directory = os.path.join(work_directory, 'pipeline')
+    os.makedirs(output_directory, exist_ok=True)
+    _, latencies, peak = time_pages(corpus['pages'], lambda page: process_page(
+        page['image_path'], output_directory, page_number=page['page_number']))
+    return summarize(latencies, peak)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(pages=8, seed=0, dpi=150, kinds=PAGE_KINDS, stubs=(), warmup=1, pipeline=True,
+                   work_directory=None):
+    """
+    Generate the corpus and benchmark the stages and the pipeline on it.
+
+    :param pages: Number of corpus pages
+    :param seed: Corpus seed
+    :param dpi: Corpus resolution
+    :param kinds: Page kinds to cycle through
+    :param stubs: Model-backed stages to stub even when their engine is installed
+    :param warmup: Pages run untimed first
+    :param pipeline: Whether to benchmark the whole pipeline too
+    :param work_directory: Where the corpus and outputs go; a temporary directory, removed afterwards, if not given
+    :return: Report dictionary
+    """
+    keep = work_directory is not None
+    work_directory = work_directory or tempfile.mkdtemp(prefix='docurefine-benchmark-')
+    try:
+        isolate(work_directory)
+        engines = select_engines(stubs)
+        missing = install_missing_packages()
+        corpus = generate_corpus(os.path.join(work_directory, 'corpus'), pages, seed, dpi, kinds)
+        start_rss = current_rss_bytes()
+
+        with StubEngines(corpus['pages']).patches(engines):
+            stages = run_stages(corpus, engines, work_directory, warmup)
+            pipeline_summary = run_pipeline(corpus, work_directory, warmup) if pipeline else None
+
+        return {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus': {'pages': pages, 'seed': seed, 'dpi': dpi, 'kinds': list(kinds), 'digest': corpus['digest']},
+            'engines': engines,
+            'missing_packages': missing,
+            'start_rss_mb': round(start_rss / 1024 ** 2, 1),
+            'stages': stages,
+            'pipeline': pipeline_summary,
+        }
+    finally:
+        if not keep:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+def print_comparison(baseline, report):
+    if baseline.get('corpus') != report.get('corpus'):
+        print("Warning: the reports were run on different corpora", file=sys.stderr)
+    for name, metric, before, after, change in compare_reports(baseline, report):
+        change = f"{change:+.1%}" if change is not None else 'n/a'
+        print(f"{name:<18} {metric:<14} {before!s:>10} -> {after!s:>10}  {change}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on a synthetic corpus.")
+    parser.add_argument('--pages', type=int, default=8, help="Number of corpus pages")
+    parser.add_argument('--seed', type=int, default=0, help="Corpus seed")
+    parser.add_argument('--dpi', type=int, default=150, help="Corpus resolution")
+    parser.add_argument('--kinds', default=','.join(PAGE_KINDS), help="Comma-separated page kinds to cycle through")
+    parser.add_argument('--stub', default='', help="Comma-separated model stages to stub: layout, ocr, latex")
+    parser.add_argument('--warmup', type=int, default=1, help="Pages run untimed first")
+    parser.add_argument('--stages-only', action='store_true', help="Skip the whole-pipeline run")
+    parser.add_argument('--work-dir', help="Keep the corpus and outputs in this directory")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Report to compare against")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+    report = run_benchmarks(args.pages, args.seed, args.dpi, tuple(args.kinds.split(',')),
+                            tuple(stage for stage in args.stub.split(',') if stage), args.warmup,
+                            not args.stages_only, args.work_dir)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
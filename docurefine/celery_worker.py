@@ -1,4 +1,10 @@
-from config.celery_config import app
+import sys
+from config.celery_config import app, worker_argv
+from config.config import config
 
 if __name__ == '__main__':
-    app.start()
\ No newline at end of file
+    # `python celery_worker.py <queue>` starts a worker for one pipeline stage queue
+    if len(sys.argv) > 1 and sys.argv[1] in config.WORKER_POOLS:
+        app.worker_main(worker_argv(sys.argv[1]) + sys.argv[2:])
+    else:
+        app.start()
\ No newline at end of file
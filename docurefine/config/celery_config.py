@@ -1,6 +1,11 @@
+import logging
+import os
 from celery import Celery
+from celery.signals import celeryd_init, worker_init, worker_process_init, worker_process_shutdown
 from config.config import config
 
+logger = logging.getLogger(__name__)
+
 app = Celery('docurefine',
              broker=config.CELERY_BROKER_URL,
              backend=config.CELERY_RESULT_BACKEND,
@@ -12,5 +17,100 @@ app.conf.update(
     task_acks_late=True,
 )
 
+# Stage tasks of the staged pipeline, by queue
+STAGE_ROUTES = {
+    '*.rasterize_stage': {'queue': 'rasterize'},
+    '*.layout_stage': {'queue': 'layout'},
+    '*.ocr_stage': {'queue': 'ocr'},
+    '*.latex_stage': {'queue': 'latex'},
+    '*.render_stage': {'queue': 'render'},
+    '*.reconstruct_pdf': {'queue': 'assemble'},
+    '*.merge_documents': {'queue': 'assemble'},
+}
+
+if config.PIPELINE_MODE == 'staged':
+    # Orchestration tasks stay on the default queue
+    app.conf.task_routes = STAGE_ROUTES
+
+def worker_argv(queue):
+    """
+    Build the worker command line for one stage queue from config.WORKER_POOLS.
+
+    :param queue: Queue name, e.g. 'ocr'
+    :return: Argument list for app.worker_main
+    """
+    pool = config.WORKER_POOLS[queue]
+    return [
+        'worker',
+        f'--queues={queue}',
+        f'--hostname={queue}@%h',
+        f'--concurrency={pool["concurrency"]}',
+        f'--prefetch-multiplier={pool["prefetch_multiplier"]}',
+        f'--max-memory-per-child={pool["max_memory_per_child"]}',
+        f'--loglevel={config.LOG_LEVEL}',
+    ]
+
+# Queues consumed by this worker, recorded before the pool processes are forked
+worker_queues = set()
+
+@celeryd_init.connect
+def record_worker_queues(sender=None, conf=None, options=None, **kwargs):
+    queues = (options or {}).get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    worker_queues.update(queue.strip() for queue in queues)
+
+@worker_process_init.connect
+def preload_worker_models(**kwargs):
+    """
+    Load the pipeline models once in each worker process before it takes tasks.
+
+    Stage workers only load the models their queues use.
+    """
+    if not config.PRELOAD_MODELS:
+        return
+    from model_registry import preload_models
+    stages = worker_queues & set(config.WORKER_POOLS) or None
+    try:
+        metrics = preload_models(stages)
+        logger.info(f"Preloaded models: {metrics}")
+    except Exception as e:
+        # Tasks fall back to loading on first use
+        logger.error(f"Model preload failed: {str(e)}")
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """
+    Serve the Prometheus metrics of every pool process of this worker on WORKER_METRICS_PORT.
+
+    Pool processes record their metrics in prometheus_client's multiprocess
+    mode, as files under PROMETHEUS_MULTIPROC_DIR, which the server in the
+    main worker process aggregates on each scrape.
+    """
+    if not config.WORKER_METRICS_PORT:
+        return
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        logger.error("WORKER_METRICS_PORT is set but PROMETHEUS_MULTIPROC_DIR is not; worker metrics are off")
+        return
+    from prometheus_client import CollectorRegistry, start_http_server
+    from prometheus_client.multiprocess import MultiProcessCollector
+
+    # Files left by an earlier run of the worker would be counted again
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.db'):
+            os.remove(os.path.join(directory, name))
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    start_http_server(config.WORKER_METRICS_PORT, registry=registry)
+    logger.info(f"Serving worker metrics on port {config.WORKER_METRICS_PORT}")
+
+@worker_process_shutdown.connect
+def remove_process_metrics(pid=None, **kwargs):
+    if config.WORKER_METRICS_PORT and os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 if __name__ == '__main__':
     app.start()
\ No newline at end of file
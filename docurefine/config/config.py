@@ -4,6 +4,18 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def worker_pool(queue, concurrency, prefetch_multiplier, max_memory_mb):
+    """
+    Worker settings for one pipeline stage queue, overridable as <QUEUE>_CONCURRENCY,
+    <QUEUE>_PREFETCH and <QUEUE>_MAX_MEMORY_MB.
+    """
+    prefix = queue.upper()
+    return {
+        'concurrency': int(os.getenv(f'{prefix}_CONCURRENCY', concurrency)) or os.cpu_count() or 1,
+        'prefetch_multiplier': int(os.getenv(f'{prefix}_PREFETCH', prefetch_multiplier)),
+        'max_memory_per_child': int(os.getenv(f'{prefix}_MAX_MEMORY_MB', max_memory_mb)) * 1024,  # KiB, as Celery expects
+    }
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
@@ -11,6 +23,116 @@ class Config:
     REDIS_URL = os.getenv('REDIS_URL')
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     UPLOAD_FOLDER = 'uploads'
     OUTPUT_FOLDER = 'output'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max request body, and max file size for single-request uploads
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # Must fit in MAX_CONTENT_LENGTH
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 512 * 1024 * 1024))  # Max file size for resumable uploads
+
+    # Models
+    LAYOUT_MODEL = os.getenv('LAYOUT_MODEL', 'lp://PubLayNet/mask_rcnn_X_101_32x8d_FPN_3x/config')
+    LATEX_MODEL = os.getenv('LATEX_MODEL', 't5-base')
+    PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+    # Batching
+    LAYOUT_BATCH_SIZE = int(os.getenv('LAYOUT_BATCH_SIZE', 4))  # Pages per layout forward pass
+    LATEX_BATCH_SIZE = int(os.getenv('LATEX_BATCH_SIZE', 16))  # Text segments per T5 generate call
+    PAGE_BATCH_SIZE = int(os.getenv('PAGE_BATCH_SIZE', 8))  # Pages per Celery task
+
+    # Rasterization
+    RASTER_DPI = int(os.getenv('RASTER_DPI', 300))
+
+    # Born-digital PDF pages: pages whose native text layer passes these checks skip OCR and layout analysis
+    NATIVE_TEXT_DETECTION = os.getenv('NATIVE_TEXT_DETECTION', 'true').lower() == 'true'
+    NATIVE_TEXT_MIN_CHARS = int(os.getenv('NATIVE_TEXT_MIN_CHARS', 50))
+    NATIVE_TEXT_MIN_COVERAGE = float(os.getenv('NATIVE_TEXT_MIN_COVERAGE', 0.01))  # Share of the page area under word boxes
+    NATIVE_TEXT_MIN_QUALITY = float(os.getenv('NATIVE_TEXT_MIN_QUALITY', 0.95))  # Share of cleanly decoded characters
+    NATIVE_TEXT_MAX_IMAGE_AREA = float(os.getenv('NATIVE_TEXT_MAX_IMAGE_AREA', 0.5))  # Larger images mark a scan
+
+    # Repeated pages: blank pages are skipped, near-identical pages reuse a canonical result
+    PAGE_DEDUP = os.getenv('PAGE_DEDUP', 'true').lower() == 'true'
+    PAGE_DEDUP_SCOPE = os.getenv('PAGE_DEDUP_SCOPE', 'document')  # 'document', 'user' or 'global'
+    PAGE_DEDUP_TTL = int(os.getenv('PAGE_DEDUP_TTL', 7 * 24 * 3600))  # Seconds index entries are kept in Redis
+    PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', 3))  # Differing hash bits for a page to be a candidate
+    PAGE_DEDUP_MAX_DIFFERENCE = float(os.getenv('PAGE_DEDUP_MAX_DIFFERENCE', 0.15))  # Thumbnail difference to confirm it
+    BLANK_MAX_INK = float(os.getenv('BLANK_MAX_INK', 0.001))  # Share of ink pixels a blank page may have
+    BLANK_INK_CONTRAST = int(os.getenv('BLANK_INK_CONTRAST', 64))  # How much darker than the background ink is
+
+    # OCR engines: 'auto' uses the Tesseract C API (tesserocr) when installed, else pytesseract
+    OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')
+    OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', 0))  # Engines per worker process; 0 means one per core
+    OCR_LANG = os.getenv('OCR_LANG', 'eng')
+    # Version keying cached OCR results, e.g. 'tesseract-5.3.0'; detected from the local engine if unset,
+    # so it must be set where workers without Tesseract share a cache with the OCR workers
+    OCR_ENGINE_VERSION = os.getenv('OCR_ENGINE_VERSION', '')
+    # 'page' OCRs the whole page and merges with layout; 'region' runs layout first and OCRs text blocks only
+    OCR_MODE = os.getenv('OCR_MODE', 'page')
+    REGION_OCR_PADDING = int(os.getenv('REGION_OCR_PADDING', 4))  # Pixels added around each block crop
+    REGION_OCR_WORKERS = int(os.getenv('REGION_OCR_WORKERS', 0))  # 0 means the OCR pool size
+
+    # OCR/layout merge: 'any', 'majority' or 'centroid' word assignment
+    MERGE_POLICY = os.getenv('MERGE_POLICY', 'any')
+
+    # LaTeX snippet rendering
+    SNIPPET_CACHE_MAX_BYTES = int(os.getenv('SNIPPET_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # Rendered bitmaps kept per worker thread
+
+    # pdflatex rendering
+    TEX_MAX_PROCESSES = int(os.getenv('TEX_MAX_PROCESSES', 0))  # Concurrent compilers per worker; 0 means one per core
+    TEX_CACHE_DIR = os.getenv('TEX_CACHE_DIR', 'cache/tex')
+    TEX_TIMEOUT = int(os.getenv('TEX_TIMEOUT', 60))  # Seconds per compile
+    TEX_PREAMBLE = os.getenv('TEX_PREAMBLE', '\\documentclass{article}\n\\usepackage{amsmath}\n\\usepackage{amssymb}\n\\usepackage{graphicx}')
+
+    # Image comparison: 'full' computes the SSIM map in one pass; 'multiscale' tries a
+    # downsampled early accept first and otherwise computes the map in float32 strips
+    SSIM_MODE = os.getenv('SSIM_MODE', 'multiscale')
+    SSIM_PYRAMID_LEVELS = int(os.getenv('SSIM_PYRAMID_LEVELS', 2))  # Each level halves the resolution
+    SSIM_EARLY_EXIT_MARGIN = float(os.getenv('SSIM_EARLY_EXIT_MARGIN', 0.02))  # Coarse score must clear the threshold by this
+    SSIM_STRIP_ROWS = int(os.getenv('SSIM_STRIP_ROWS', 512))
+
+    # Tile-parallel refinement of oversized scans
+    TILE_MIN_PIXELS = int(os.getenv('TILE_MIN_PIXELS', 40_000_000))  # Smaller pages are refined in one process
+    TILE_ROWS = int(os.getenv('TILE_ROWS', 1024))
+    TILE_HALO = int(os.getenv('TILE_HALO', 16))  # Overlap rows read around each tile
+    TILE_PROCESSES = int(os.getenv('TILE_PROCESSES', 0))  # 0 means one per core
+
+    # Pipeline execution: 'monolithic' runs each page range in one task; 'staged' chains
+    # per-stage tasks routed to the queues below, each served by its own worker pool
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'monolithic')
+    WORKER_POOLS = {
+        # queue: concurrency (0 means one per core), prefetch multiplier, max memory per child in MB
+        'rasterize': worker_pool('rasterize', 2, 2, 2048),
+        'layout': worker_pool('layout', 1, 1, 6144),
+        'ocr': worker_pool('ocr', 0, 4, 1536),
+        'latex': worker_pool('latex', 1, 1, 4096),
+        'render': worker_pool('render', 0, 1, 2048),
+        'assemble': worker_pool('assemble', 2, 1, 2048),
+    }
+
+    # Worker metrics: each worker serves its pool processes' Prometheus metrics on this port (0 disables);
+    # needs PROMETHEUS_MULTIPROC_DIR set in the worker's environment
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))
+
+    # Progress events
+    PROGRESS_TTL = int(os.getenv('PROGRESS_TTL', 24 * 3600))  # Seconds progress counters are kept in Redis
+    PROGRESS_HEARTBEAT = int(os.getenv('PROGRESS_HEARTBEAT', 15))  # Seconds between SSE keep-alives
+
+    # Upload deduplication
+    DEDUP_INFLIGHT_TIMEOUT = int(os.getenv('DEDUP_INFLIGHT_TIMEOUT', 6 * 3600))  # Seconds before an unfinished job is presumed lost
+    DEDUP_POLL_INTERVAL = int(os.getenv('DEDUP_POLL_INTERVAL', 10))  # Seconds between checks on a duplicate's job
+
+    # Artifact store: task results carry references to artifacts kept here instead of the payloads
+    ARTIFACT_STORE = os.getenv('ARTIFACT_STORE', 'local')  # 'local' or 's3'
+    ARTIFACT_DIR = os.getenv('ARTIFACT_DIR', 'artifacts')
+    ARTIFACT_S3_BUCKET = os.getenv('ARTIFACT_S3_BUCKET', 'docurefine-artifacts')
+    ARTIFACT_S3_PREFIX = os.getenv('ARTIFACT_S3_PREFIX', '')
+    ARTIFACT_S3_ENDPOINT = os.getenv('ARTIFACT_S3_ENDPOINT')  # e.g. a MinIO server; AWS S3 if unset
+    ARTIFACT_COMPRESSION_LEVEL = int(os.getenv('ARTIFACT_COMPRESSION_LEVEL', 6))  # zlib level for JSON artifacts
+
+    # Page artifact cache
+    PIPELINE_VERSION = os.getenv('PIPELINE_VERSION', '1')  # Bump to invalidate cached artifacts
+    PAGE_CACHE_DIR = os.getenv('PAGE_CACHE_DIR', 'cache/pages')  # Empty for an in-process cache only
+    PAGE_CACHE_MEMORY_ENTRIES = int(os.getenv('PAGE_CACHE_MEMORY_ENTRIES', 256))
+    PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+config = Config()
@@ -1,8 +1,12 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from celery_tasks import process_document, process_multiple_documents, process_file
 from werkzeug.utils import secure_filename
 from user_management import db, User
+from progress import stream_progress, progress_snapshot
+from artifact_store import get_artifact_store
+from uploads import ChunkedUploadStore, UploadError, file_chain_hash
+from document_registry import pipeline_version, job_key, find_running_job, plan_documents, record_uploads
 import os
 import logging
 from flask_limiter import Limiter
@@ -99,12 +103,137 @@ def delete_file(filename):
         flash(f'File {filename} not found.')
     return redirect(url_for('list_files'))
 
+def user_upload_store():
+    return ChunkedUploadStore(os.path.join(app.config['UPLOAD_FOLDER'], str(current_user.id)))
+
+def upload_error_response(error):
+    response = {'error': str(error)}
+    if error.offset is not None:
+        response['offset'] = error.offset
+    return jsonify(response), error.status
+
+def upload_response(state):
+    return {key: state[key] for key in ('upload_id', 'size', 'chunk_size', 'offset', 'committed')}
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    """
+    Start a resumable upload; the body is JSON with 'filename' and 'size'.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': f'File type not allowed: {filename}'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Upload size is required'}), 400
+    
+    try:
+        state = user_upload_store().create(bleach.clean(secure_filename(filename)), size)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(upload_response(state)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+@limiter.exempt  # Called on every resume
+def get_upload(upload_id):
+    """
+    Return an upload's offset, so an interrupted client knows where to resume.
+    """
+    try:
+        return jsonify(upload_response(user_upload_store().get(upload_id)))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+@limiter.exempt  # Called once per chunk
+def upload_chunk(upload_id):
+    """
+    Write one chunk; the body is the raw bytes and the 'offset' query parameter says where they start.
+    """
+    try:
+        offset = int(request.args['offset'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Chunk offset is required'}), 400
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+    
+    try:
+        state = user_upload_store().write_chunk(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(upload_response(state))
+
+@app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+@login_required
+def commit_upload(upload_id):
+    """
+    Finish an upload once every chunk is written.
+    """
+    try:
+        state = user_upload_store().commit(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(dict(upload_response(state), content_hash=state['content_hash']))
+
+def output_directory_for(filename):
+    user_output_folder = os.path.join(app.config['OUTPUT_FOLDER'], str(current_user.id))
+    os.makedirs(user_output_folder, exist_ok=True)
+    output_dir = os.path.join(user_output_folder, os.path.splitext(filename)[0])
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+def submit_documents(documents):
+    """
+    Process a submission, reusing the work of identical documents processed before.
+    
+    An identical submission still in flight is attached to rather than started again.
+    
+    :param documents: List of (input_path, output_directory, content_hash) tuples
+    :return: JSON response with the task to follow and each document's status
+    """
+    version = pipeline_version()
+    key = job_key([content_hash for _, _, content_hash in documents], version)
+    running = find_running_job(key, current_user.id)
+    if running is not None:
+        task_id = running.task_id
+        statuses = [running.status] * len(documents)
+    else:
+        file_list, statuses = plan_documents(documents, version)
+        task_id = process_multiple_documents.delay(file_list).id
+    record_uploads(current_user.id, documents, statuses, version, key, task_id)
+    
+    return jsonify({
+        'task_id': task_id,
+        'documents': [{'filename': os.path.basename(input_path), 'content_hash': content_hash, 'status': status}
+                      for (input_path, _, content_hash), status in zip(documents, statuses)]
+    }), 202
+
 @app.route('/process', methods=['POST'])
 @login_required
 @limiter.limit("10 per minute")
 @request_count.count_exceptions()
 @request_latency.time()
 def process():
+    upload_ids = (request.get_json(silent=True) or {}).get('upload_ids')
+    if upload_ids:
+        # Files already transferred through /api/uploads, hashed as they arrived
+        store = user_upload_store()
+        documents = []
+        for upload_id in upload_ids:
+            try:
+                state = store.get(upload_id)
+                file_path = store.committed_path(upload_id)
+            except UploadError as e:
+                return upload_error_response(e)
+            documents.append((file_path, output_directory_for(os.path.basename(file_path)), state['content_hash']))
+        
+        return submit_documents(documents)
+    
     if 'files[]' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -112,7 +241,7 @@ def process():
     if not files or files[0].filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    processed_files = []
+    documents = []
     for file in files:
         if file and allowed_file(file.filename):
             try:
@@ -123,20 +252,16 @@ def process():
                 file_path = os.path.join(user_upload_folder, sanitized_filename)
                 file.save(file_path)
                 
-                user_output_folder = os.path.join(app.config['OUTPUT_FOLDER'], str(current_user.id))
-                os.makedirs(user_output_folder, exist_ok=True)
-                output_dir = os.path.join(user_output_folder, os.path.splitext(filename)[0])
-                os.makedirs(output_dir, exist_ok=True)
+                output_dir = output_directory_for(filename)
                 
-                processed_files.append((file_path, output_dir))
+                documents.append((file_path, output_dir, file_chain_hash(file_path)))
             except Exception as e:
                 logger.error(f"Error processing file {filename}: {str(e)}")
                 return jsonify({'error': f'An error occurred while processing the file {filename}'}), 500
         else:
             return jsonify({'error': f'File type not allowed: {file.filename}'}), 400
     
-    task = process_multiple_documents.delay(processed_files)
-    return jsonify({'task_id': task.id}), 202
+    return submit_documents(documents)
 
 @app.route('/status/<task_id>')
 @login_required
@@ -148,19 +273,42 @@ def status(task_id):
             'status': 'Pending...'
         }
     elif task.state != 'FAILURE':
+        info = task.info if isinstance(task.info, dict) else {}  # A finished workflow's info is its result
         response = {
             'state': task.state,
-            'status': task.info.get('status', '')
+            'status': info.get('status', '')
         }
-        if 'result' in task.info:
-            response['result'] = task.info['result']
+        if 'result' in info:
+            response['result'] = info['result']
     else:
         response = {
             'state': task.state,
             'status': str(task.info)
         }
+    progress = progress_snapshot(task_id)
+    if progress is not None:
+        response['progress'] = progress
     return jsonify(response)
 
+@app.route('/stream/<task_id>')
+@login_required
+def stream(task_id):
+    """
+    Stream a processing task's progress as Server-Sent Events.
+    """
+    def final_event():
+        # Covers workflows that ended without publishing, e.g. after a worker crash
+        task = process_multiple_documents.AsyncResult(task_id)
+        if task.state == 'SUCCESS':
+            return {'type': 'complete', 'result': task.result}
+        if task.state == 'FAILURE':
+            return {'type': 'failed', 'result': str(task.info)}
+        return None
+    
+    return Response(stream_with_context(stream_progress(task_id, final_event)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/download/<task_id>')
 @login_required
 def download(task_id):
@@ -170,8 +318,12 @@ def download(task_id):
         output_path = task.result[-1].get('output_pdf_path')
         if output_path and os.path.exists(output_path):
             return send_file(output_path, as_attachment=True)
-        else:
-            return jsonify({'error': 'Output file not found'}), 404
+        artifact = task.result[-1].get('artifact')
+        if artifact and get_artifact_store().exists(artifact['key']):
+            # Produced on another host; serve the copy in the artifact store
+            with get_artifact_store().local_path(artifact, suffix='.pdf') as artifact_path:
+                return send_file(artifact_path, as_attachment=True, download_name=os.path.basename(output_path))
+        return jsonify({'error': 'Output file not found'}), 404
     else:
         return jsonify({'error': 'Task not completed'}), 400
 
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from config.config import config
+
+try:
+    import boto3
+except ImportError:  # Only the local backend is available
+    boto3 = None
+
+class ArtifactError(Exception):
+    """
+    An artifact that is missing or does not match its reference's checksum.
+    """
+
+def artifact_key(kind, fingerprint, version, extension):
+    """
+    Build the content-addressed key of a page artifact.
+
+    Identical pages processed with the same version share their artifacts,
+    whichever document they came from.
+
+    :param kind: Artifact kind, e.g. 'page' or 'image'
+    :param fingerprint: Page fingerprint
+    :param version: Version of the stage that produced the artifact
+    :param extension: File extension, e.g. 'json.z'
+    :return: Store key
+    """
+    version_hash = hashlib.sha256(version.encode()).hexdigest()[:16]
+    return f"{kind}/{fingerprint[:2]}/{fingerprint}-{version_hash}.{extension}"
+
+class ArtifactStore(ABC):
+    """
+    Base class for artifact storage backends.
+
+    Backends store opaque bytes under keys. Values put through put_json are
+    zlib-compressed JSON; files put through put_file are stored as they are,
+    since page images are already compressed. Either way the caller gets a
+    small reference, {'key', 'sha256', 'size'}, to pass between tasks in
+    place of the payload; the checksum covers the stored bytes and is
+    verified on every read.
+    """
+
+    @abstractmethod
+    def put_bytes(self, key, data):
+        """
+        Store bytes under a key, replacing any artifact already there.
+        """
+
+    @abstractmethod
+    def get_bytes(self, key):
+        """
+        Return the bytes stored under a key, raising ArtifactError if there are none.
+        """
+
+    @abstractmethod
+    def exists(self, key):
+        """
+        Check whether an artifact is stored under a key.
+        """
+
+    @staticmethod
+    def _reference(key, data):
+        return {'key': key, 'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data)}
+
+    @staticmethod
+    def _verify(ref, data):
+        if hashlib.sha256(data).hexdigest() != ref['sha256']:
+            raise ArtifactError(f"Checksum mismatch for artifact {ref['key']}")
+        return data
+
+    def put_json(self, key, value):
+        """
+        Store a JSON-serializable value, compressed.
+
+        :return: Artifact reference
+        """
+        data = zlib.compress(json.dumps(value).encode(), config.ARTIFACT_COMPRESSION_LEVEL)
+        self.put_bytes(key, data)
+        return self._reference(key, data)
+
+    def get_json(self, ref):
+        """
+        Load a value stored with put_json.
+        """
+        return json.loads(zlib.decompress(self._verify(ref, self.get_bytes(ref['key']))))
+
+    def put_file(self, key, path):
+        """
+        Store a file's bytes as they are.
+
+        :return: Artifact reference
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.put_bytes(key, data)
+        return self._reference(key, data)
+
+    @contextmanager
+    def local_path(self, ref, suffix=''):
+        """
+        Provide a stored file as a local path for the duration of the block.
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+            f.write(self._verify(ref, self.get_bytes(ref['key'])))
+            f.flush()
+            yield f.name
+
+class LocalArtifactStore(ArtifactStore):
+    """
+    Artifacts as files under a directory, shared by workers on one host or a shared volume.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def put_bytes(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)  # Atomic, so readers never see a partial artifact
+
+    def get_bytes(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ArtifactError(f"Artifact {key} not found")
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, path):
+        path_hash = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                path_hash.update(block)
+                size += len(block)
+        destination = self._path(key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, destination)
+        return {'key': key, 'sha256': path_hash.hexdigest(), 'size': size}
+
+    @contextmanager
+    def local_path(self, ref, suffix=''):
+        # Files are already local; only the size is checked, to avoid rereading large images
+        path = self._path(ref['key'])
+        if not os.path.exists(path) or os.path.getsize(path) != ref['size']:
+            raise ArtifactError(f"Artifact {ref['key']} is missing or truncated")
+        yield path
+
+class S3ArtifactStore(ArtifactStore):
+    """
+    Artifacts in an S3-compatible bucket, e.g. AWS S3 or a MinIO server.
+
+    :param client: boto3 S3 client or a compatible stand-in; created from the endpoint if not given
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("ARTIFACT_STORE is 's3' but boto3 is not installed")
+            client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def get_bytes(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            raise ArtifactError(f"Artifact {key} not found")
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_artifact_store():
+    """
+    Return the artifact store configured by ARTIFACT_STORE for this process.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.ARTIFACT_STORE == 's3':
+                    _store = S3ArtifactStore(config.ARTIFACT_S3_BUCKET, config.ARTIFACT_S3_PREFIX,
+                                             config.ARTIFACT_S3_ENDPOINT)
+                else:
+                    _store = LocalArtifactStore(config.ARTIFACT_DIR)
+    return _store
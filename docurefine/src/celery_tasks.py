@@ -1,21 +1,33 @@
+import hashlib
 import logging
 import os
-from celery import Celery, group
+import time
+from contextlib import contextmanager
+from celery import chain, group
 from celery.exceptions import MaxRetriesExceededError
-from pdf_utils import split_pdf, reconstruct_pdf
-from ocr import perform_ocr_with_layout, perform_ocr
-from layout_analysis import analyze_layout, merge_ocr_and_layout
-from latex_converter import convert_layout_to_latex
+from pdf_utils import count_pages, page_ranges, contiguous_ranges, rasterize_pdf, prefetch
+from pdf_utils import classify_pdf_pages
+from pdf_utils import reconstruct_pdf as write_reconstructed_pdf
+from ocr import perform_ocr_with_layout, perform_region_ocr, ocr_engine_version
+from layout_analysis import analyze_layout, analyze_layout_batch, merge_ocr_and_layout
+from latex_converter import convert_layouts_to_blocks, blocks_to_latex
 from image_comparison import refine_image
+from page_cache import get_page_cache, page_fingerprint
+from page_context import PageContext, as_page
+from snippet_renderer import escape_text, render_snippet, render_page
+from progress import start_progress, page_done, finish_progress
+from uploads import copy_output, file_sha256
+from manifest import PageManifest
+from artifact_store import get_artifact_store, artifact_key
+from page_dedup import PageIndex, dedup_scope, is_blank, perceptual_hash
 from config.config import config
+from config.celery_config import app
 import cv2
 import numpy as np
-from functools import lru_cache
-import matplotlib.pyplot as plt
-import io
-from PIL import Image
 from celery import chord
-from multiprocessing import Pool
+from multiprocessing import shared_memory
+# billiard's Pool can fork from Celery's daemonic prefork workers, unlike multiprocessing's
+from billiard import Pool
 import PyPDF2
 from .profiling import profile_function
 
@@ -23,52 +35,373 @@ from .profiling import profile_function
 logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Celery app
-app = Celery('docurefine', broker=config.CELERY_BROKER_URL, backend=config.CELERY_RESULT_BACKEND)
-
-@lru_cache(maxsize=100)
-def cached_perform_ocr(image_path):
-    return perform_ocr(image_path)
-
-@lru_cache(maxsize=100)
-def cached_analyze_layout(image_path):
-    return analyze_layout(image_path)
 
 def process_chunk(chunk_data):
-    chunk, latex_content = chunk_data
-    refined_chunk = refine_image_with_latex(chunk, latex_content)
-    return refined_chunk
-
-@app.task(bind=True, max_retries=3)
-def process_page(self, page_path, output_directory):
+    """
+    Refine one tile of a page held in shared memory.
+    
+    The tile is refined together with its halo, so filters near the tile
+    edge see the same neighbourhood as on the whole page, and only the core
+    rows are written to the shared output.
+    
+    :param chunk_data: Tuple of (input shm name, output shm name, page shape, dtype,
+                       (top, bottom) core rows, halo rows, latex_content, layout_elements)
+    :return: The (top, bottom) rows written
+    """
+    input_name, output_name, shape, dtype, (top, bottom), halo, latex_content, layout_elements = chunk_data
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
     try:
-        logger.info(f"Processing page: {page_path}")
+        page = np.ndarray(shape, dtype=dtype, buffer=input_shm.buf)
+        output = np.ndarray(shape, dtype=dtype, buffer=output_shm.buf)
         
-        # Perform OCR with layout
-        ocr_result = perform_ocr_with_layout(page_path)
+        halo_top = max(0, top - halo)
+        halo_bottom = min(shape[0], bottom + halo)
+        refined_chunk = refine_image_with_latex(page[halo_top:halo_bottom], latex_content, layout_elements,
+                                                origin=(0, halo_top))
+        output[top:bottom] = refined_chunk[top - halo_top:bottom - halo_top]
         
-        # Analyze layout
-        layout_elements = analyze_layout(page_path)
+        del page, output, refined_chunk  # Release the buffer views before closing
+    finally:
+        input_shm.close()
+        output_shm.close()
+    return top, bottom
+
+def stage_versions(native=False):
+    """
+    Return the version key of each cached pipeline stage.
+    
+    A stage's version covers every engine or model that feeds into it, so
+    upgrading any of them invalidates the downstream artifacts.
+    
+    :param native: Versions for a born-digital page, whose merged layout comes from its native text
+    :return: Dictionary mapping stage names to version strings
+    """
+    ocr_version = f"{config.PIPELINE_VERSION}:{ocr_engine_version()}"
+    layout_version = f"{config.PIPELINE_VERSION}:{config.LAYOUT_MODEL}"
+    if native:
+        merged_version = f"{config.PIPELINE_VERSION}|native"
+    elif config.OCR_MODE == 'region':
+        merged_version = f"{ocr_version}|{layout_version}|region"
+    else:
+        merged_version = f"{ocr_version}|{layout_version}|{config.MERGE_POLICY}"
+    return {
+        'ocr': ocr_version,
+        'layout': layout_version,
+        'merged': merged_version,
+        'latex': f"{merged_version}|{config.LATEX_MODEL}",
+    }
+
+def page_versions(state):
+    """
+    Return the stage versions keying a page's artifacts, from its page state.
+    """
+    return stage_versions(native=state.get('native_text', False))
+
+def _process_pages(pages, output_directory, native=None):
+    """
+    Run the full pipeline on a group of pages.
+    
+    Stage outputs are looked up in the page cache by page content first, so a
+    page that was already processed skips straight to image reconstruction.
+    Layout detection and LaTeX generation run batched across the pages that
+    miss the cache; the remaining stages run page by page. Each page is
+    decoded once and shared between stages through a PageContext.
+    
+    :param pages: List of (page_number, image) tuples, where image is a path or an RGB numpy array
+    :param output_directory: Directory to save the refined images
+    :param native: Born-digital page classifications by page number, from native_pages
+    :return: List of dictionaries describing the processed pages, in input order
+    """
+    pages, screened, hashes = screen_pages(pages, output_directory)
+    states, images = start_pages(pages, native, hashes)
+    run_layout_stage(states, images)
+    run_ocr_stage(states, images)
+    run_latex_stage(states)
+    results = run_render_stage(states, images, output_directory)
+    return sorted(screened + results, key=lambda page: page['page_number'])
+
+def page_index(output_directory):
+    """
+    Return the index of canonical page results that a document's pages are deduplicated against.
+    
+    Results are only shared between pages processed with the same pipeline version.
+    """
+    version_hash = hashlib.sha256(stage_versions()['latex'].encode()).hexdigest()[:16]
+    return PageIndex(f"{dedup_scope(output_directory)}:{version_hash}")
+
+def screen_pages(pages, output_directory):
+    """
+    Finish blank pages and near-duplicates of processed pages before any model runs.
+    
+    Blank pages are recorded as such and reconstructed as empty pages. Every
+    other page is hashed once; a page within PHASH_MAX_DISTANCE bits of an
+    indexed page whose thumbnail also matches reuses that page's result.
+    Screened pages are recorded in the document's manifest like processed
+    ones.
+    
+    :param pages: List of (page_number, image) tuples, where image is a path, RGB numpy array or PageContext
+    :param output_directory: Document output directory
+    :return: Tuple of (pages left to process, screened page results, perceptual hashes by page number)
+    """
+    if not config.PAGE_DEDUP:
+        return pages, [], {}
+    
+    manifest = PageManifest(output_directory)
+    index = page_index(output_directory)
+    remaining = []
+    screened = []
+    hashes = {}
+    for page_number, image in pages:
+        page = as_page(image)
+        if is_blank(page):
+            result = {'page_number': page_number, 'blank': True, 'page_size': list(page.shape[::-1])}
+        else:
+            hashes[page_number] = perceptual_hash(page)
+            canonical = index.lookup(hashes[page_number], page)
+            if canonical is None:
+                remaining.append((page_number, page))
+                continue
+            result = dict(canonical, page_number=page_number, duplicate=True)
         
-        # Merge OCR and layout results
-        merged_layout = merge_ocr_and_layout(ocr_result, layout_elements)
+        manifest.record(result)
+        logger.info(f"Page {page_number} is {'blank' if result.get('blank') else 'a duplicate'}; skipping it")
+        page_done(page_number)
+        screened.append(result)
+    return remaining, screened, hashes
+
+def start_pages(pages, native=None, hashes=None):
+    """
+    Fingerprint pages and pick up whatever stage outputs are already cached.
+    
+    Page states are plain dictionaries so they can travel between stage tasks.
+    A state holds the furthest cached output: 'latex_content', else
+    'merged_layout', else 'layout'; later stages only compute what is missing.
+    Born-digital pages start from the merged layout and words built from
+    their native text, so they skip layout analysis and OCR. They are marked
+    'native_text', which keys their artifacts under versions of their own
+    (see page_versions): LaTeX made from native text is not served to the
+    same page processed through OCR, e.g. once detection is turned off.
+    
+    :param pages: List of (page_number, image) tuples, where image is a path, RGB numpy array or PageContext
+    :param native: Born-digital page classifications by page number, from native_pages
+    :param hashes: Perceptual hashes by page number, from screen_pages; rendered pages are indexed under them
+    :return: Tuple of (page states, PageContexts), in input order
+    """
+    cache = get_page_cache()
+    images = [as_page(image) for _, image in pages]
+    
+    states = []
+    for (page_number, _), image in zip(pages, images):
+        fingerprint = page_fingerprint(image)
+        state = {'page_number': page_number, 'page_path': image.path, 'fingerprint': fingerprint}
+        if (hashes or {}).get(page_number):
+            state['phash'] = hashes[page_number]
+        classification = (native or {}).get(page_number)
+        if classification:
+            # Cached under versions of their own, so OCR results are not served for them or vice versa
+            state['native_text'] = True
+            state['merged_layout'] = classification['merged_layout']
+            state['words'] = classification['words']
+        
+        versions = page_versions(state)
+        stages = (('latex', 'latex_content'),) if classification else \
+            (('latex', 'latex_content'), ('merged', 'merged_layout'), ('layout', 'layout'))
+        for stage, field in stages:
+            value = cache.get(stage, fingerprint, versions[stage])
+            if value is not None:
+                state[field] = value
+                break
+        states.append(state)
+    return states, images
+
+def native_pages(input_path, page_numbers):
+    """
+    Classify PDF pages and return the born-digital ones.
+    
+    :param input_path: Path to the input PDF file
+    :param page_numbers: Page numbers about to be processed
+    :return: Dictionary mapping born-digital page numbers to their classification; empty when detection is off
+    """
+    if not config.NATIVE_TEXT_DETECTION or not input_path.lower().endswith('.pdf'):
+        return {}
+    classified = classify_pdf_pages(input_path, page_numbers)
+    native = {page_number: result for page_number, result in classified.items() if result['born_digital']}
+    if native:
+        logger.info(f"{len(native)} of {len(classified)} pages of {input_path} are born-digital; skipping OCR for them")
+    return native
+
+def _needs(state, field):
+    """
+    Check whether a page state still needs a stage output: it has neither the output nor a later one.
+    """
+    later = {'layout': ('layout', 'merged_layout', 'latex_content'),
+             'merged_layout': ('merged_layout', 'latex_content'),
+             'latex_content': ('latex_content',)}
+    return not any(key in state for key in later[field])
+
+@contextmanager
+def stage_timer(states, stage):
+    """
+    Record the time a stage spends on a group of pages, shared evenly, under each state's 'timings'.
+    """
+    start = time.perf_counter()
+    yield
+    seconds = (time.perf_counter() - start) / max(1, len(states))
+    for state in states:
+        state.setdefault('timings', {})[stage] = round(seconds, 3)
+
+def run_layout_stage(states, images):
+    """
+    Analyze layout, in batched forward passes, for the pages that need it.
+    """
+    cache = get_page_cache()
+    version = stage_versions()['layout']
+    need_layout = [i for i, state in enumerate(states) if _needs(state, 'layout')]
+    
+    with stage_timer([states[i] for i in need_layout], 'layout'):
+        if len(need_layout) > 1:
+            detected = analyze_layout_batch([images[i] for i in need_layout])
+        else:
+            detected = [analyze_layout(images[i]) for i in need_layout]
+    for i, layout_elements in zip(need_layout, detected):
+        states[i]['layout'] = layout_elements
+        cache.put('layout', states[i]['fingerprint'], version, layout_elements)
+    return states
+
+def run_ocr_stage(states, images):
+    """
+    OCR the pages that need it and merge the text into their layout.
+    
+    Also records each page's OCR words for the PDF text layer.
+    """
+    cache = get_page_cache()
+    versions = stage_versions()
+    
+    for state, image in zip(states, images):
+        if not _needs(state, 'merged_layout'):
+            continue
+        logger.info(f"Processing page: {state['page_number']}")
+        fingerprint = state['fingerprint']
         
-        # Convert to LaTeX
-        latex_content = convert_layout_to_latex(merged_layout)
+        with stage_timer([state], 'ocr'):
+            if config.OCR_MODE == 'region':
+                # OCR only the text blocks found by layout analysis; no merge needed
+                merged_layout = perform_region_ocr(image, state['layout'])
+                state['words'] = [word for element in merged_layout for word in element['words']]
+            else:
+                # Perform OCR with layout
+                ocr_result = cache.get_or_compute('ocr', fingerprint, versions['ocr'],
+                                                  lambda: perform_ocr_with_layout(image))
+                
+                # Merge OCR and layout results
+                merged_layout = merge_ocr_and_layout(ocr_result, state['layout'])
+                state['words'] = ocr_result['layout']
         
-        # Generate a refined image based on LaTeX content
-        refined_image_path = os.path.join(output_directory, f"refined_{os.path.basename(page_path)}")
-        generate_image_from_latex(latex_content, refined_image_path)
+        state['merged_layout'] = merged_layout
+        cache.put('merged', fingerprint, versions['merged'], merged_layout)
+    return states
+
+def run_latex_stage(states):
+    """
+    Convert merged layouts to LaTeX, batching text segments across pages.
+    
+    Besides the page's LaTeX, each page gets the snippet drawn over each of
+    its layout elements when the page is refined in tiles.
+    """
+    cache = get_page_cache()
+    need_latex = [state for state in states if _needs(state, 'latex_content')]
+    
+    with stage_timer(need_latex, 'latex'):
+        converted = convert_layouts_to_blocks([state['merged_layout'] for state in need_latex])
+    for state, blocks in zip(need_latex, converted):
+        state['latex_content'] = blocks_to_latex(blocks)
+        state['latex_snippets'] = [block['snippet'] for block in blocks]
+        version = page_versions(state)['latex']
+        cache.put('latex', state['fingerprint'], version, state['latex_content'])
+        cache.put('snippets', state['fingerprint'], version, state['latex_snippets'])
+    return states
+
+def run_render_stage(states, images, output_directory):
+    """
+    Render each page from its LaTeX and refine it against the original.
+    
+    Records each page in the document's manifest, indexes it as the
+    canonical result for its perceptual hash and publishes a progress event
+    as it finishes.
+    
+    :return: List of processed page dictionaries, in input order, each with the page number,
+             the refined image path and artifact references to the page data ('page') and image ('image')
+    """
+    manifest = PageManifest(output_directory)
+    store = get_artifact_store()
+    results = []
+    for state, image in zip(states, images):
+        page_number = state['page_number']
+        versions = page_versions(state)
         
-        # Further refine the image if necessary
-        final_refined_path = refine_image(page_path, refined_image_path)
+        with stage_timer([state], 'render'):
+            refined_image_path = os.path.join(output_directory, f"refined_page_{page_number}.png")
+            merged_layout = state.get('merged_layout') or \
+                get_page_cache().get('merged', state['fingerprint'], versions['merged'])
+            if image.shape[0] * image.shape[1] >= config.TILE_MIN_PIXELS and merged_layout is not None:
+                # Oversized scans are refined in place, block by block, in parallel tiles
+                latex_snippets = state.get('latex_snippets') or \
+                    get_page_cache().get('snippets', state['fingerprint'], versions['latex'])
+                snippets, elements = tile_elements(merged_layout, latex_snippets)
+                refined = refine_image_tiled(image.rgb, snippets, elements)
+                cv2.imwrite(refined_image_path, cv2.cvtColor(refined, cv2.COLOR_RGB2BGR))
+                final_refined_path = refined_image_path
+            else:
+                # Generate a refined image based on LaTeX content
+                rendered = generate_image_from_latex(state['latex_content'], refined_image_path)
+                
+                # Further refine the image if necessary, reusing the rendered pixels
+                final_refined_path = refine_image(image, PageContext(rgb=rendered, path=refined_image_path))
         
-        logger.info(f"Successfully processed page: {page_path}")
-        return {
-            'page_path': page_path,
-            'latex_content': latex_content,
-            'refined_image_path': final_refined_path
+        # The payloads go to the artifact store; the task result only carries references
+        fingerprint = state['fingerprint']
+        page = {
+            'page_path': image.path,
+            'latex_content': state['latex_content'],
+            'words': state['words'] if 'words' in state else text_layer_words(fingerprint, versions),
+            'page_size': image.shape[::-1]
         }
+        result = {
+            'page_number': page_number,
+            'refined_image_path': final_refined_path,
+            'page': store.put_json(artifact_key('page', fingerprint, versions['latex'], 'json.z'), page),
+            'image': store.put_file(artifact_key('image', fingerprint, versions['latex'], 'png'), final_refined_path),
+        }
+        manifest.record(result)  # Checkpoint, so a retry does not process the page again
+        if state.get('phash'):
+            page_index(output_directory).add(state['phash'], result, image)
+        
+        logger.info(f"Successfully processed page: {page_number}")
+        page_done(page_number, state['timings'])
+        results.append(result)
+    
+    return results
+
+def text_layer_words(fingerprint, versions):
+    """
+    Return the OCR words for a page's text layer from the page cache.
+    
+    :param fingerprint: Page fingerprint
+    :param versions: Stage versions from stage_versions
+    :return: List of OCR words in page coordinates, empty if none are cached
+    """
+    cache = get_page_cache()
+    if config.OCR_MODE == 'region':
+        merged_layout = cache.get('merged', fingerprint, versions['merged']) or []
+        return [word for element in merged_layout for word in element.get('words', [])]
+    ocr_result = cache.get('ocr', fingerprint, versions['ocr'])
+    return ocr_result['layout'] if ocr_result else []
+
+@app.task(bind=True, max_retries=3)
+def process_page(self, page_path, output_directory, page_number=1):
+    try:
+        return _process_pages([(page_number, page_path)], output_directory)[0]
     except Exception as e:
         logger.error(f"Error processing page {page_path}: {str(e)}")
         try:
@@ -77,32 +410,435 @@ def process_page(self, page_path, output_directory):
             logger.critical(f"Max retries exceeded for page {page_path}")
             raise
 
-def split_image(image, num_chunks):
-    height, width = image.shape[:2]
-    chunk_height = height // num_chunks
-    return [image[i:i+chunk_height] for i in range(0, height, chunk_height)]
+@app.task(bind=True, max_retries=3)
+def process_page_batch(self, page_paths, output_directory, first_page=1):
+    """
+    Process a group of pages, batching layout detection and LaTeX generation.
+    
+    :param page_paths: List of paths to page images
+    :param output_directory: Directory to save the refined images
+    :param first_page: Page number of the first image in the group
+    :return: List of processed page dictionaries, in input order
+    """
+    try:
+        logger.info(f"Processing batch of {len(page_paths)} pages")
+        
+        return _process_pages(list(enumerate(page_paths, start=first_page)), output_directory)
+    except Exception as e:
+        logger.error(f"Error processing page batch {page_paths}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical(f"Max retries exceeded for page batch {page_paths}")
+            raise
+
+@app.task(bind=True, max_retries=3)
+def process_page_range(self, input_path, first_page, last_page, output_directory):
+    """
+    Rasterize and process a range of PDF pages without writing per-page files.
+    
+    Pages are rasterized in memory on a background thread while the previous
+    mini-batch is in OCR, then processed LAYOUT_BATCH_SIZE pages at a time.
+    Born-digital pages take their text and layout from the PDF instead of
+    OCR and layout analysis. Pages already recorded in the document's
+    manifest, e.g. by an earlier attempt of this task, are skipped.
+    
+    :param input_path: Path to the input PDF file
+    :param first_page: First page of the range (1-based)
+    :param last_page: Last page of the range (inclusive)
+    :param output_directory: Directory to save the refined images
+    :return: List of processed page dictionaries, in page order; skipped pages are left out
+    """
+    try:
+        logger.info(f"Processing pages {first_page}-{last_page} of {input_path}")
+        
+        missing = PageManifest(output_directory).missing(range(first_page, last_page + 1))
+        native = native_pages(input_path, missing)
+        batch_size = max(1, config.LAYOUT_BATCH_SIZE)
+        pages = prefetch(rasterize_pdf(input_path, first_page, last_page, pages=set(missing)), depth=batch_size)
+        
+        results = []
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) == batch_size:
+                results.extend(_process_pages(batch, output_directory, native))
+                batch = []
+        if batch:
+            results.extend(_process_pages(batch, output_directory, native))
+        
+        return results
+    except Exception as e:
+        logger.error(f"Error processing pages {first_page}-{last_page} of {input_path}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical(f"Max retries exceeded for pages {first_page}-{last_page} of {input_path}")
+            raise
+
+def _stage_images(states):
+    return [PageContext.from_path(state['page_path'], page_number=state['page_number']) for state in states]
 
-def merge_chunks(chunks):
-    return np.vstack(chunks)
+# Page state fields moved to the artifact store between stage tasks, with the stage version that keys them
+STATE_ARTIFACTS = {'layout': 'layout', 'merged_layout': 'merged', 'latex_content': 'latex', 'latex_snippets': 'latex',
+                   'words': 'merged'}
+
+def pack_states(states):
+    """
+    Replace the bulky fields of page states with artifact references, before a state leaves a stage task.
+    """
+    store = get_artifact_store()
+    for state in states:
+        versions = page_versions(state)
+        for field, stage in STATE_ARTIFACTS.items():
+            if field in state:
+                key = artifact_key(field, state['fingerprint'], versions[stage], 'json.z')
+                state.setdefault('artifacts', {})[field] = store.put_json(key, state.pop(field))
+    return states
+
+def unpack_states(states):
+    """
+    Load the fields pack_states moved to the artifact store back into page states.
+    """
+    store = get_artifact_store()
+    for state in states:
+        for field, ref in state.pop('artifacts', {}).items():
+            state[field] = store.get_json(ref)
+    return states
 
 @app.task(bind=True, max_retries=3)
-def process_document(self, input_path, output_directory):
+def rasterize_stage(self, input_path, first_page, last_page, output_directory):
+    """
+    First task of the staged pipeline: rasterize pages and look up cached stage outputs.
+    
+    PDF pages are written as page images under output_directory/pages so
+    later stages, possibly on other hosts sharing the volume, can read them;
+    an image input is used as its own single page. Pages already recorded in
+    the document's manifest are left out, as are blank and duplicate pages,
+    which are recorded there right away.
+    
+    :param input_path: Path to the input document (PDF or image)
+    :param first_page: First page of the range (1-based)
+    :param last_page: Last page of the range (inclusive)
+    :param output_directory: Directory to save the page images
+    :return: List of page states
+    """
     try:
-        logger.info(f"Starting document processing: {input_path}")
+        missing = PageManifest(output_directory).missing(range(first_page, last_page + 1))
+        if not input_path.lower().endswith('.pdf'):
+            pages, _, hashes = screen_pages([(first_page, input_path)] if missing else [], output_directory)
+            states, _ = start_pages(pages, hashes=hashes)
+            return pack_states(states)
         
-        # Split PDF (if input is PDF)
-        if input_path.lower().endswith('.pdf'):
-            page_paths = split_pdf(input_path, output_directory)
+        pages_directory = os.path.join(output_directory, 'pages')
+        os.makedirs(pages_directory, exist_ok=True)
+        pages = []
+        for page_number, image in rasterize_pdf(input_path, first_page, last_page, pages=set(missing)):
+            page_path = os.path.join(pages_directory, f"page_{page_number}.png")
+            cv2.imwrite(page_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            pages.append((page_number, PageContext(rgb=image, path=page_path, page_number=page_number)))
+        
+        pages, _, hashes = screen_pages(pages, output_directory)
+        states, _ = start_pages(pages, native_pages(input_path, [page_number for page_number, _ in pages]), hashes)
+        return pack_states(states)
+    except Exception as e:
+        logger.error(f"Error rasterizing pages {first_page}-{last_page} of {input_path}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical(f"Max retries exceeded rasterizing pages {first_page}-{last_page} of {input_path}")
+            raise
+
+@app.task(bind=True, max_retries=3)
+def layout_stage(self, states):
+    try:
+        states = unpack_states(states)
+        return pack_states(run_layout_stage(states, _stage_images(states)))
+    except Exception as e:
+        logger.error(f"Error in layout stage for pages {[state['page_number'] for state in states]}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical("Max retries exceeded in layout stage")
+            raise
+
+@app.task(bind=True, max_retries=3)
+def ocr_stage(self, states):
+    try:
+        states = unpack_states(states)
+        return pack_states(run_ocr_stage(states, _stage_images(states)))
+    except Exception as e:
+        logger.error(f"Error in OCR stage for pages {[state['page_number'] for state in states]}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical("Max retries exceeded in OCR stage")
+            raise
+
+@app.task(bind=True, max_retries=3)
+def latex_stage(self, states):
+    try:
+        return pack_states(run_latex_stage(unpack_states(states)))
+    except Exception as e:
+        logger.error(f"Error in LaTeX stage for pages {[state['page_number'] for state in states]}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical("Max retries exceeded in LaTeX stage")
+            raise
+
+@app.task(bind=True, max_retries=3)
+def render_stage(self, states, output_directory):
+    try:
+        states = unpack_states(states)
+        return run_render_stage(states, _stage_images(states), output_directory)
+    except Exception as e:
+        logger.error(f"Error in render stage for pages {[state['page_number'] for state in states]}: {str(e)}")
+        try:
+            self.retry(countdown=60)  # Retry after 1 minute
+        except MaxRetriesExceededError:
+            logger.critical("Max retries exceeded in render stage")
+            raise
+
+def staged_signature(input_path, first_page, last_page, output_directory):
+    """
+    Build the stage chain for a page range; each stage is routed to its own queue.
+    
+    :return: Chain signature whose result is the list of processed page dictionaries
+    """
+    return chain(
+        rasterize_stage.s(input_path, first_page, last_page, output_directory),
+        layout_stage.s(),
+        ocr_stage.s(),
+        latex_stage.s(),
+        render_stage.s(output_directory),
+    )
+
+def document_page_count(input_path):
+    """
+    Return the number of pages a document will be processed as.
+    """
+    return count_pages(input_path) if input_path.lower().endswith('.pdf') else 1
+
+def pending_pages(input_path, output_directory):
+    """
+    Return the page numbers of a document that its manifest has no record of.
+    
+    Opening the manifest discards it if the document's content or the
+    pipeline version changed since it was written.
+    
+    :param input_path: Path to the input document (PDF or image)
+    :param output_directory: Document output directory
+    :return: Sorted list of page numbers still to process
+    """
+    manifest = PageManifest.open(input_path, output_directory, stage_versions()['latex'])
+    return manifest.missing(range(1, document_page_count(input_path) + 1))
+
+def page_signatures(input_path, output_directory, batch_size=None, pages=None):
+    """
+    Build the chord header for a document's pages.
+    
+    PDFs are dispatched as page ranges that each worker rasterizes in memory;
+    image inputs are processed as a single page. With PIPELINE_MODE 'staged'
+    each range is a chain of stage tasks instead of a single task.
+    
+    :param input_path: Path to the input document (PDF or image)
+    :param output_directory: Directory to save the refined images
+    :param batch_size: Pages per task; defaults to config.PAGE_BATCH_SIZE
+    :param pages: Page numbers to process, e.g. from pending_pages; defaults to every page
+    :return: List of task signatures, empty if there is nothing to process
+    """
+    staged = config.PIPELINE_MODE == 'staged'
+    if not input_path.lower().endswith('.pdf'):
+        if pages is not None and not pages:
+            return []
+        if staged:
+            return [staged_signature(input_path, 1, 1, output_directory)]
+        return [process_page.s(input_path, output_directory)]
+    
+    batch_size = batch_size or config.PAGE_BATCH_SIZE
+    range_signature = staged_signature if staged else process_page_range.s
+    if pages is None:
+        ranges = page_ranges(count_pages(input_path), batch_size)
+    else:
+        ranges = contiguous_ranges(pages, batch_size)
+    return [
+        range_signature(input_path, first_page, last_page, output_directory)
+        for first_page, last_page in ranges
+    ]
+
+def flatten_page_results(results):
+    """
+    Flatten chord results that mix single pages and page batches.
+    
+    :param results: List of page dictionaries or lists of page dictionaries
+    :return: Flat list of page dictionaries
+    """
+    pages = []
+    for result in results:
+        if isinstance(result, list):
+            pages.extend(result)
         else:
-            page_paths = [input_path]  # Single image input
+            pages.append(result)
+    return pages
+
+def tile_windows(height, tile_rows):
+    """
+    Split a page's rows into consecutive tiles.
+    
+    :param height: Page height in pixels
+    :param tile_rows: Rows per tile
+    :return: List of (top, bottom) row ranges covering the page
+    """
+    return [(top, min(height, top + tile_rows)) for top in range(0, height, tile_rows)]
+
+_tile_pool = None
+
+def get_tile_pool(processes=None):
+    """
+    Return this worker's tile refinement pool, starting it on first use.
+    
+    The pool is kept for the life of the worker so tasks do not pay for
+    starting and tearing down processes.
+    
+    :param processes: Pool size on first use; defaults to config.TILE_PROCESSES, or one per core
+    """
+    global _tile_pool
+    if _tile_pool is None:
+        _tile_pool = Pool(processes or config.TILE_PROCESSES or os.cpu_count() or 1)
+    return _tile_pool
+
+def refine_image_tiled(image, latex_content, layout_elements, tile_rows=None, processes=None):
+    """
+    Refine a large page in parallel tiles.
+    
+    The page is copied once into shared memory and each worker process
+    refines a band of rows in place, so no pixels are pickled. Bands
+    overlap by config.TILE_HALO rows; only each band's own rows are kept,
+    so the stitched page matches a single-process refinement. Pages below
+    config.TILE_MIN_PIXELS are refined in the calling process.
+    
+    :param image: Original image as a numpy array
+    :param latex_content: LaTeX snippets, indexed by the elements' 'text_index'
+    :param layout_elements: Layout elements with (x, y, w, h) coordinates
+    :param tile_rows: Rows per tile; defaults to config.TILE_ROWS
+    :param processes: Pool size if the pool is not running yet; see get_tile_pool
+    :return: Refined image as a numpy array
+    """
+    height, width = image.shape[:2]
+    if height * width < config.TILE_MIN_PIXELS:
+        return refine_image_with_latex(image, latex_content, layout_elements)
+    
+    windows = tile_windows(height, tile_rows or config.TILE_ROWS)
+    
+    input_shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    output_shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    try:
+        page = np.ndarray(image.shape, dtype=image.dtype, buffer=input_shm.buf)
+        page[:] = image
+        output = np.ndarray(image.shape, dtype=image.dtype, buffer=output_shm.buf)
         
-        # Process pages in parallel using a chord
-        header = [process_page.s(page_path, output_directory) for page_path in page_paths]
-        callback = reconstruct_pdf.s(output_directory)
-        result = chord(header)(callback)
+        chunks = [
+            (input_shm.name, output_shm.name, image.shape, image.dtype.str, window, config.TILE_HALO,
+             latex_content, layout_elements)
+            for window in windows
+        ]
+        get_tile_pool(processes).map(process_chunk, chunks)
         
-        logger.info(f"Document processing complete. Results saved in {output_directory}")
-        return result.get()
+        refined_image = output.copy()
+        del page, output
+    finally:
+        input_shm.close()
+        input_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
+    
+    return refined_image
+
+def tile_elements(merged_layout, latex_snippets=None):
+    """
+    Build the snippets and elements refine_image_tiled takes from a page's merged layout.
+    
+    Titles, text and lists are drawn from their snippets, as text with
+    inline math; figures are enhanced in place. Without snippets, e.g. for
+    LaTeX cached before they were, each element's plain text is drawn.
+    
+    :param merged_layout: Merged layout, with (x1, y1, x2, y2) coordinates
+    :param latex_snippets: Snippet per layout element, from run_latex_stage
+    :return: Tuple of (snippets, elements with (x, y, w, h) coordinates and a 'text_index' into snippets)
+    """
+    if latex_snippets is None or len(latex_snippets) != len(merged_layout):
+        latex_snippets = [escape_text(element.get('text', '')) for element in merged_layout]
+    
+    snippets = []
+    elements = []
+    for element, snippet in zip(merged_layout, latex_snippets):
+        if element['type'] not in ('Title', 'Text', 'List', 'Figure'):
+            continue
+        x1, y1, x2, y2 = element['coordinates']
+        elements.append({'type': 'Figure' if element['type'] == 'Figure' else 'Text',
+                         'coordinates': (x1, y1, x2 - x1, y2 - y1), 'text_index': len(snippets), 'math': False})
+        snippets.append(snippet or '')
+    return snippets, elements
+
+def document_workflow(input_path, output_directory, finish=False, pages=None):
+    """
+    Build the workflow for one document: its pending pages in parallel, then reconstruction.
+    
+    Pages recorded in the document's manifest are not dispatched again;
+    reconstruction picks them up from the manifest.
+    
+    :param input_path: Path to the input document (PDF or image)
+    :param output_directory: Directory to save the results
+    :param finish: Whether reconstruction ends the workflow and should publish the final progress event
+    :param pages: Pages to process, from pending_pages; looked up if not given
+    :return: Signature whose result is the reconstruct_pdf result
+    """
+    if pages is None:
+        pages = pending_pages(input_path, output_directory)
+    header = page_signatures(input_path, output_directory, pages=pages)
+    if not header:
+        return reconstruct_pdf.si([], output_directory, finish)  # Every page is checkpointed
+    return chord(header, reconstruct_pdf.s(output_directory, finish))
+
+def documents_workflow(file_list, pages=None):
+    """
+    Build the workflow for several documents.
+    
+    Every document's pages are dispatched at once; each document is
+    reconstructed as soon as its own pages finish, and the merged PDF is
+    built once every document is reconstructed.
+    
+    :param file_list: List of (input_path, output_directory) tuples; a third element, the source
+                      of a duplicate document's output, reuses that output instead (see reuse_document)
+    :param pages: Pages to process per document, from documents_pending_pages; looked up if not given
+    :return: Chord signature whose result is the merge_documents result
+    """
+    if pages is None:
+        pages = documents_pending_pages(file_list)
+    workflows = []
+    for (input_path, output_directory, *source), document_pages in zip(file_list, pages):
+        if source:
+            workflows.append(reuse_document.si(source[0], input_path, output_directory))
+        else:
+            workflows.append(document_workflow(input_path, output_directory, pages=document_pages))
+    return chord(workflows, merge_documents.s())
+
+def documents_pending_pages(file_list):
+    """
+    Return the pages still to process for each entry of a documents workflow; reused documents have none.
+    """
+    return [[] if len(entry) > 2 else pending_pages(entry[0], entry[1]) for entry in file_list]
+
+@app.task(bind=True, max_retries=3)
+def process_document(self, input_path, output_directory):
+    try:
+        logger.info(f"Starting document processing: {input_path}")
+        
+        # Process pages (or page ranges, for PDFs) in parallel using a chord
+        pages = pending_pages(input_path, output_directory)
+        workflow = document_workflow(input_path, output_directory, finish=True, pages=pages)
+        start_progress(self.request.root_id or self.request.id, len(pages))
     except Exception as e:
         logger.error(f"Error processing document {input_path}: {str(e)}")
         try:
@@ -110,61 +846,176 @@ def process_document(self, input_path, output_directory):
         except MaxRetriesExceededError:
             logger.critical(f"Max retries exceeded for document {input_path}")
             raise
+    
+    # Hand the task's result over to the workflow instead of waiting on it in this worker
+    return self.replace(workflow)
+
+@app.task(bind=True, max_retries=None)
+def reuse_document(self, source, input_path, output_directory, deadline=None):
+    """
+    Reuse the output of an identical document instead of processing it again.
+    
+    The source output is copied once its task finishes, checked against the
+    checksum in that task's result. If the task fails or has not finished
+    within DEDUP_INFLIGHT_TIMEOUT, or its output has been replaced since,
+    the document is processed after all.
+    
+    :param source: Dictionary with the source 'output_pdf_path' and, while the source
+                   is still being processed, the 'task_id' processing it
+    :param input_path: Path to the document, processed if the source output cannot be reused
+    :param output_directory: Directory to place the output in
+    :param deadline: Unix time to stop waiting at; DEDUP_INFLIGHT_TIMEOUT after the first attempt if not given
+    :return: Dictionary with 'output_pdf_path' and its 'sha256', like reconstruct_pdf
+    """
+    sha256 = None
+    reusable = True
+    if source['task_id']:
+        deadline = deadline or time.time() + config.DEDUP_INFLIGHT_TIMEOUT
+        source_task = app.AsyncResult(source['task_id'])
+        if source_task.failed() or (not source_task.successful() and time.time() >= deadline):
+            logger.warning(f"Task {source['task_id']} did not produce the duplicate of {input_path}")
+            reusable = False
+        elif not source_task.successful():
+            # Poll rather than block a worker until the duplicate finishes
+            raise self.retry(args=(source, input_path, output_directory, deadline),
+                             countdown=config.DEDUP_POLL_INTERVAL)
+        else:
+            sha256 = output_checksum(source_task.result, source['output_pdf_path'])
+    
+    if reusable:
+        try:
+            output_pdf_path = copy_output(source['output_pdf_path'],
+                                          os.path.join(output_directory, "reconstructed.pdf"), sha256)
+            return {'output_pdf_path': output_pdf_path, 'sha256': sha256 or file_sha256(output_pdf_path)}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not reuse the duplicate of {input_path}: {str(e)}")
+    
+    logger.info(f"Processing {input_path} itself")
+    pages = pending_pages(input_path, output_directory)
+    return self.replace(document_workflow(input_path, output_directory, pages=pages))
+
+def output_checksum(results, output_pdf_path):
+    """
+    Find the sha256 of a document's output in a finished task's result.
+    
+    :param results: Result of process_document or process_multiple_documents
+    :param output_pdf_path: The document's output path
+    :return: Hex digest, or None if the result does not record one
+    """
+    for result in results if isinstance(results, list) else [results]:
+        if isinstance(result, dict) and result.get('output_pdf_path') == output_pdf_path:
+            return result.get('artifact', {}).get('sha256') or result.get('sha256')
+    return None
 
 @app.task
-def reconstruct_pdf(processed_pages, output_directory):
+def reconstruct_pdf(processed_pages, output_directory, finish=False):
+    """
+    Write a document's reconstructed PDF from its processed pages.
+    
+    Pages processed by earlier attempts are taken from the document's
+    manifest. Page data and images are loaded from the artifact store one
+    page at a time, and the PDF is stored there too.
+    
+    :param processed_pages: Chord results of the page tasks
+    :param output_directory: Document output directory
+    :param finish: Whether to publish the final progress event
+    :return: Dictionary with 'output_pdf_path' and the PDF's artifact reference under 'artifact'
+    """
+    manifest = PageManifest(output_directory)
+    pages = {page['page_number']: page for page in manifest.pages()}
+    pages.update((page['page_number'], page) for page in flatten_page_results(processed_pages))
     output_pdf_path = os.path.join(output_directory, "reconstructed.pdf")
-    # ... (existing reconstruct_pdf logic)
-    return {'output_pdf_path': output_pdf_path}
+    write_reconstructed_pdf(load_page_artifacts(pages[page_number] for page_number in sorted(pages)), output_pdf_path)
+    
+    document_key = manifest.fingerprint() or hashlib.sha256(os.path.abspath(output_directory).encode()).hexdigest()
+    result = {
+        'output_pdf_path': output_pdf_path,
+        'artifact': get_artifact_store().put_file(f"document/{document_key}.pdf", output_pdf_path)
+    }
+    if finish:
+        finish_progress(result)
+    return result
 
-def refine_image_with_latex(image, latex_content, layout_elements):
+def load_page_artifacts(pages):
+    """
+    Resolve processed page references into the page data PDF reconstruction needs.
+    
+    :param pages: Iterable of processed page dictionaries from run_render_stage
+    :return: Generator of page dictionaries with 'refined_image_path', 'words' and 'page_size';
+             each image path is only valid until the next page is requested. Blank pages are yielded as they are.
+    """
+    store = get_artifact_store()
+    for page in pages:
+        if page.get('blank'):
+            yield page
+            continue
+        data = store.get_json(page['page'])
+        with store.local_path(page['image'], suffix='.png') as image_path:
+            yield dict(data, page_number=page['page_number'], refined_image_path=image_path)
+
+def refine_image_with_latex(image, latex_content, layout_elements, origin=(0, 0)):
     """
     Refine the image using LaTeX content and layout information.
     
-    :param image: Original image as a numpy array
+    The image may be a crop of the page: elements are given in page
+    coordinates and only their part inside the crop is refined.
+    
+    :param image: Original image (or a crop of it) as a numpy array
     :param latex_content: LaTeX content extracted from the image
     :param layout_elements: Layout information extracted from the image
+    :param origin: Page coordinates (x, y) of the image's top-left pixel
     :return: Refined image as a numpy array
     """
     # Create a copy of the original image
     refined_image = image.copy()
+    height, width = image.shape[:2]
+    origin_x, origin_y = origin
     
     # Iterate through layout elements and apply refinements
     for element in layout_elements:
-        if element['type'] == 'text':
-            # Replace text areas with rendered LaTeX
-            x, y, w, h = element['coordinates']
+        element_type = element['type'].lower()
+        if element_type not in ('text', 'figure'):
+            continue
+        
+        # Clip the element to the image, in image coordinates
+        x, y, w, h = (int(value) for value in element['coordinates'])
+        left, top = max(0, x - origin_x), max(0, y - origin_y)
+        right, bottom = min(width, x + w - origin_x), min(height, y + h - origin_y)
+        if right <= left or bottom <= top:
+            continue
+        
+        if element_type == 'text':
+            # Replace text areas with rendered LaTeX, rendered at full size so crops line up
             latex_snippet = latex_content[element['text_index']]
-            rendered_text = render_latex(latex_snippet, (w, h))
-            refined_image[y:y+h, x:x+w] = rendered_text
-        elif element['type'] == 'figure':
+            rendered_text = render_latex(latex_snippet, (w, h), math=element.get('math', True))
+            offset_x, offset_y = left + origin_x - x, top + origin_y - y
+            refined_image[top:bottom, left:right] = rendered_text[offset_y:offset_y + bottom - top,
+                                                                  offset_x:offset_x + right - left]
+        else:
             # Enhance figure areas (e.g., increase contrast, remove noise)
-            x, y, w, h = element['coordinates']
-            figure_area = refined_image[y:y+h, x:x+w]
+            figure_area = refined_image[top:bottom, left:right]
             enhanced_figure = enhance_figure(figure_area)
-            refined_image[y:y+h, x:x+w] = enhanced_figure
+            refined_image[top:bottom, left:right] = enhanced_figure
     
     return refined_image
 
-def render_latex(latex_snippet, size):
+def render_latex(latex_snippet, size, math=True):
     """
-    Render LaTeX snippet to an image using matplotlib.
+    Render LaTeX snippet to an image on the worker's reusable canvas.
+    
+    Snippets mathtext cannot parse, such as model output using unsupported
+    commands, are drawn as literal text instead.
     
     :param latex_snippet: LaTeX content to render
     :param size: Size of the output image (width, height)
-    :return: Rendered LaTeX as a numpy array
+    :param math: Whether the snippet is math; if not, it is text with inline $math$
+    :return: Rendered LaTeX as a read-only RGB numpy array of exactly that size
     """
-    fig = plt.figure(figsize=(size[0]/100, size[1]/100), dpi=100)
-    plt.text(0.5, 0.5, f'${latex_snippet}$', size=12, ha='center', va='center')
-    plt.axis('off')
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0)
-    plt.close(fig)
-    
-    buf.seek(0)
-    img = Image.open(buf)
-    return np.array(img)
+    try:
+        return render_snippet(latex_snippet, size, math=math)
+    except ValueError as e:
+        logger.warning(f"Drawing unparsable snippet as text: {str(e)}")
+        return render_snippet(escape_text(latex_snippet), size, math=False)
 
 def enhance_figure(figure):
     """
@@ -187,29 +1038,20 @@ def generate_image_from_latex(latex_content, output_path):
     
     :param latex_content: LaTeX content to render
     :param output_path: Path to save the generated image
+    :return: The rendered image as an RGB numpy array
     """
-    fig = plt.figure(figsize=(8.5, 11))  # Standard letter size
-    plt.axis('off')
-    plt.text(0.5, 0.5, f'${latex_content}$', size=12, ha='center', va='center', wrap=True)
-    
-    plt.savefig(output_path, dpi=300, bbox_inches='tight', pad_inches=0.1)
-    plt.close(fig)
+    image = render_page(latex_content)
+    cv2.imwrite(output_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    return image
 
 @app.task(bind=True, max_retries=3)
 def process_multiple_documents(self, file_list):
     try:
         logger.info(f"Starting processing of multiple documents: {len(file_list)} files")
         
-        results = []
-        for input_path, output_directory in file_list:
-            result = process_document(input_path, output_directory)
-            results.append(result)
-        
-        # Merge all processed PDFs into a single file
-        merged_pdf_path = merge_pdfs([result['output_pdf_path'] for result in results])
-        
-        logger.info(f"All documents processed. Results saved in respective output directories.")
-        return results + [{'output_pdf_path': merged_pdf_path}]
+        pages = documents_pending_pages(file_list)
+        workflow = documents_workflow(file_list, pages)
+        start_progress(self.request.root_id or self.request.id, sum(len(document_pages) for document_pages in pages))
     except Exception as e:
         logger.error(f"Error processing multiple documents: {str(e)}")
         try:
@@ -217,6 +1059,34 @@ def process_multiple_documents(self, file_list):
         except MaxRetriesExceededError:
             logger.critical(f"Max retries exceeded for processing multiple documents")
             raise
+    
+    # The task's result becomes the merge_documents result once every document is done
+    return self.replace(workflow)
+
+@app.task
+def merge_documents(results):
+    """
+    Merge the reconstructed documents into a single PDF.
+    
+    :param results: reconstruct_pdf results, one per document, in submission order
+    :return: The per-document results followed by the merged PDF result
+    """
+    if not results:
+        finish_progress([])
+        return []
+    
+    # Merge all processed PDFs into a single file
+    merged_pdf_path = merge_pdfs([result['output_pdf_path'] for result in results])
+    merged_key = hashlib.sha256(''.join(result.get('artifact', {}).get('sha256', result['output_pdf_path'])
+                                        for result in results).encode()).hexdigest()
+    
+    logger.info(f"All documents processed. Results saved in respective output directories.")
+    results = results + [{
+        'output_pdf_path': merged_pdf_path,
+        'artifact': get_artifact_store().put_file(f"merged/{merged_key}.pdf", merged_pdf_path)
+    }]
+    finish_progress(results)
+    return results
 
 def merge_pdfs(pdf_paths):
     merged_pdf = PyPDF2.PdfMerger()
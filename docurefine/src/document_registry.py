@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from config.config import config
+from config.celery_config import app as celery_app
+from progress import progress_snapshot
+from uploads import copy_output, file_sha256
+from user_management import db, Upload
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'processing')
+
+# Settings that change a document's output; settings that only change how fast it is produced are left out
+OUTPUT_SETTINGS = (
+    'LAYOUT_MODEL', 'LATEX_MODEL', 'RASTER_DPI',
+    'NATIVE_TEXT_DETECTION', 'NATIVE_TEXT_MIN_CHARS', 'NATIVE_TEXT_MIN_COVERAGE', 'NATIVE_TEXT_MIN_QUALITY',
+    'NATIVE_TEXT_MAX_IMAGE_AREA',
+    'PAGE_DEDUP', 'PAGE_DEDUP_SCOPE', 'PHASH_MAX_DISTANCE', 'PAGE_DEDUP_MAX_DIFFERENCE', 'BLANK_MAX_INK',
+    'BLANK_INK_CONTRAST',
+    'OCR_LANG', 'OCR_MODE', 'REGION_OCR_PADDING', 'MERGE_POLICY', 'TEX_PREAMBLE',
+    'SSIM_MODE', 'SSIM_PYRAMID_LEVELS', 'SSIM_EARLY_EXIT_MARGIN', 'TILE_MIN_PIXELS',
+)
+
+def pipeline_version():
+    """
+    Return the version an output was produced with.
+
+    Outputs are only reused between uploads with the same version, so it
+    covers the pipeline version and every setting in OUTPUT_SETTINGS. The
+    settings are hashed to keep the version short enough to store.
+    """
+    settings = '\0'.join(f"{name}={getattr(config, name)}" for name in OUTPUT_SETTINGS)
+    return f"{config.PIPELINE_VERSION}:{hashlib.sha256(settings.encode()).hexdigest()[:16]}"
+
+def job_key(content_hashes, version):
+    """
+    Return the key identifying a submission: its documents, in order, and the pipeline version.
+    """
+    digest = hashlib.sha256(version.encode())
+    for content_hash in content_hashes:
+        digest.update(b'\0' + content_hash.encode())
+    return digest.hexdigest()
+
+def reconcile(upload):
+    """
+    Bring an upload's status up to date with its task.
+
+    Statuses are not pushed by the workers; they are refreshed here whenever
+    an upload is considered for reuse.
+
+    :param upload: Upload row
+    :return: The upload's current status
+    """
+    if upload.status in ACTIVE_STATUSES:
+        state = celery_app.AsyncResult(upload.task_id).state
+        status = upload.status
+        if state == 'SUCCESS':
+            status = 'complete'
+        elif state in ('FAILURE', 'REVOKED'):
+            status = 'failed'
+        elif datetime.utcnow() - upload.created_at > timedelta(seconds=config.DEDUP_INFLIGHT_TIMEOUT):
+            status = 'failed'  # The job was lost, e.g. with a broker restart
+        elif upload.status == 'queued' and progress_snapshot(upload.task_id) is not None:
+            status = 'processing'
+        if status != upload.status:
+            # Every upload the job is processing shares its fate
+            for row in Upload.query.filter(Upload.task_id == upload.task_id, Upload.status.in_(ACTIVE_STATUSES)):
+                row.status = status
+                if status == 'complete' and os.path.exists(row.output_pdf_path):
+                    row.output_sha256 = file_sha256(row.output_pdf_path)
+            db.session.commit()
+
+    if upload.status == 'complete' and not output_intact(upload):
+        upload.status = 'failed'  # The output was deleted or overwritten, e.g. by a later upload of the same name
+        db.session.commit()
+    return upload.status
+
+def output_intact(upload):
+    """
+    Check that a finished upload's output is still the one its job produced.
+    """
+    if not os.path.exists(upload.output_pdf_path):
+        return False
+    if upload.output_sha256 is None:
+        upload.output_sha256 = file_sha256(upload.output_pdf_path)  # Finished before checksums were recorded
+        db.session.commit()
+        return True
+    return file_sha256(upload.output_pdf_path) == upload.output_sha256
+
+def find_running_job(key, user_id):
+    """
+    Return the newest queued or in-flight upload submitted as part of an identical submission by the same user.
+    
+    The running job writes into that user's output directories, so other
+    users' identical submissions are planned per document instead, and get
+    their own copies of the shared result.
+    """
+    for upload in Upload.query.filter(Upload.job_key == key, Upload.user_id == user_id,
+                                      Upload.status.in_(ACTIVE_STATUSES)) \
+            .order_by(Upload.created_at.desc()):
+        if reconcile(upload) in ACTIVE_STATUSES:
+            return upload
+    return None
+
+def find_duplicate(content_hash, version):
+    """
+    Return the best upload of the same content to reuse: a finished one, else one still in flight.
+    """
+    candidates = Upload.query.filter(Upload.content_hash == content_hash,
+                                     Upload.pipeline_version == version,
+                                     Upload.status.in_(ACTIVE_STATUSES + ('complete',))) \
+        .order_by(Upload.created_at.desc())
+    running = None
+    for upload in candidates:
+        status = reconcile(upload)
+        if status == 'complete':
+            return upload
+        if status in ACTIVE_STATUSES and running is None:
+            running = upload
+    return running
+
+def plan_documents(documents, version):
+    """
+    Decide, per document, whether to process it or reuse another upload's output.
+
+    Finished outputs are copied into the document's output directory right
+    away, provided they still match the checksum recorded when they were
+    produced. Documents with a duplicate still in flight wait for its output
+    rather than being processed again.
+
+    :param documents: List of (input_path, output_directory, content_hash) tuples
+    :param version: Pipeline version, from pipeline_version()
+    :return: Tuple of (file_list for process_multiple_documents, per-document statuses)
+    """
+    file_list = []
+    statuses = []
+    for input_path, output_directory, content_hash in documents:
+        duplicate = find_duplicate(content_hash, version)
+        output_pdf_path = None
+        if duplicate is not None and duplicate.status == 'complete':
+            try:
+                output_pdf_path = copy_output(duplicate.output_pdf_path,
+                                              os.path.join(output_directory, 'reconstructed.pdf'),
+                                              duplicate.output_sha256)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not reuse the output of upload {duplicate.id}: {str(e)}")
+                duplicate = None
+        if duplicate is None:
+            file_list.append((input_path, output_directory))
+            statuses.append('queued')
+        elif output_pdf_path is not None:
+            logger.info(f"Reusing the output of upload {duplicate.id} for {input_path}")
+            file_list.append((input_path, output_directory, {'task_id': None, 'output_pdf_path': output_pdf_path}))
+            statuses.append('complete')
+        else:
+            logger.info(f"Attaching {input_path} to task {duplicate.task_id}")
+            file_list.append((input_path, output_directory,
+                              {'task_id': duplicate.task_id, 'output_pdf_path': duplicate.output_pdf_path}))
+            statuses.append(duplicate.status)
+    return file_list, statuses
+
+def record_uploads(user_id, documents, statuses, version, key, task_id):
+    """
+    Record a submission's uploads against the task processing them.
+
+    :param documents: List of (input_path, output_directory, content_hash) tuples
+    :param statuses: Status of each document
+    :return: The new Upload rows
+    """
+    uploads = []
+    for (input_path, output_directory, content_hash), status in zip(documents, statuses):
+        upload = Upload(user_id=user_id, filename=os.path.basename(input_path), file_path=input_path,
+                        content_hash=content_hash, pipeline_version=version, job_key=key,
+                        task_id=task_id, status=status, output_dir=output_directory)
+        if status == 'complete':
+            upload.output_sha256 = file_sha256(upload.output_pdf_path)  # The copy plan_documents just made
+        db.session.add(upload)
+        uploads.append(upload)
+    db.session.commit()
+    return uploads
@@ -1,68 +1,236 @@
+import logging
+import threading
 import cv2
 from skimage.metrics import structural_similarity as ssim
+from skimage.util.dtype import dtype_range
 from config.config import config
 import numpy as np
+from metrics import REPAIR_FRACTION_BUCKETS, repaired_fraction
+from page_context import PageContext, as_page
 
-def compare_images(image1_path, image2_path):
+logger = logging.getLogger(__name__)
+
+SSIM_WINDOW = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+def compare_images(image1_path, image2_path, mode=None, threshold=None):
     """
     Compare two images using Structural Similarity Index (SSIM).
     
-    :param image1_path: Path to the first image
-    :param image2_path: Path to the second image
-    :return: SSIM score (float between -1 and 1, where 1 means perfect similarity)
+    In 'full' mode the SSIM map is computed at full resolution in one pass.
+    In 'multiscale' mode a downsampled pyramid level is scored first; if it
+    is clearly above the threshold the images are accepted without computing
+    the map, otherwise the full-resolution map is computed in float32 strips.
+    
+    :param image1_path: Path to the first image, RGB numpy array or PageContext
+    :param image2_path: Path to the second image, RGB numpy array or PageContext
+    :param mode: 'full' or 'multiscale'; defaults to config.SSIM_MODE
+    :param threshold: Acceptance threshold used for the early exit in 'multiscale' mode
+    :return: Tuple of (SSIM score between -1 and 1, SSIM map or None if accepted early)
+    """
+    # Grayscale views are decoded and converted once per page
+    gray1 = as_page(image1_path).gray
+    gray2 = as_page(image2_path).gray
+    mode = mode or config.SSIM_MODE
+    
+    if mode == 'full':
+        # Compute SSIM between the two images
+        score, diff = ssim(gray1, gray2, full=True)
+        return score, diff
+    
+    if mode != 'multiscale':
+        raise ValueError(f"Unknown SSIM mode: {mode}")
+    if gray1.shape != gray2.shape:
+        raise ValueError("Input images must have the same dimensions.")
+    
+    if threshold is not None:
+        coarse1, coarse2 = gray1, gray2
+        for _ in range(config.SSIM_PYRAMID_LEVELS):
+            coarse1, coarse2 = cv2.pyrDown(coarse1), cv2.pyrDown(coarse2)
+        if min(coarse1.shape) >= SSIM_WINDOW:
+            coarse_score, _ = tiled_ssim(coarse1, coarse2, data_range(gray1))
+            if coarse_score >= threshold + config.SSIM_EARLY_EXIT_MARGIN:
+                return coarse_score, None
+    
+    return tiled_ssim(gray1, gray2, data_range(gray1))
+
+def data_range(image):
+    """
+    Return the value range of an image's dtype, as used by SSIM.
+    """
+    low, high = dtype_range[image.dtype.type]
+    return high - low
+
+def ssim_strip(strip1, strip2, data_range):
+    """
+    Compute the SSIM map of a strip with a uniform window.
+    
+    Matches skimage's structural_similarity defaults (7x7 uniform window,
+    K1=0.01, K2=0.03, sample covariance, reflected borders) in float32.
     """
-    # Read images
-    img1 = cv2.imread(image1_path)
-    img2 = cv2.imread(image2_path)
+    x = strip1.astype(np.float32)
+    y = strip2.astype(np.float32)
+    window = (SSIM_WINDOW, SSIM_WINDOW)
     
-    # Convert images to grayscale
-    gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    def mean(image):
+        return cv2.boxFilter(image, cv2.CV_32F, window, normalize=True, borderType=cv2.BORDER_REFLECT)
     
-    # Compute SSIM between the two images
-    score, diff = ssim(gray1, gray2, full=True)
+    mu_x = mean(x)
+    mu_y = mean(y)
+    covariance_norm = SSIM_WINDOW ** 2 / (SSIM_WINDOW ** 2 - 1)
+    var_x = covariance_norm * (mean(x * x) - mu_x * mu_x)
+    var_y = covariance_norm * (mean(y * y) - mu_y * mu_y)
+    cov_xy = covariance_norm * (mean(x * y) - mu_x * mu_y)
     
-    return score, diff
+    c1 = (SSIM_K1 * data_range) ** 2
+    c2 = (SSIM_K2 * data_range) ** 2
+    numerator = (2 * mu_x * mu_y + c1) * (2 * cov_xy + c2)
+    denominator = (mu_x * mu_x + mu_y * mu_y + c1) * (var_x + var_y + c2)
+    return numerator / denominator
+
+def tiled_ssim(gray1, gray2, data_range, strip_rows=None):
+    """
+    Compute the SSIM score and map in horizontal strips.
+    
+    Each strip is read with a halo of half a window above and below, so the
+    stitched map is identical to a single-pass computation while the float
+    intermediates stay the size of one strip.
+    
+    :param gray1: First grayscale image
+    :param gray2: Second grayscale image, same shape as gray1
+    :param data_range: Value range of the images
+    :param strip_rows: Output rows per strip; defaults to config.SSIM_STRIP_ROWS
+    :return: Tuple of (mean SSIM over the window-cropped interior, float32 SSIM map)
+    """
+    height, width = gray1.shape
+    if min(height, width) < SSIM_WINDOW:
+        raise ValueError(f"Images must be at least {SSIM_WINDOW}x{SSIM_WINDOW} pixels")
+    strip_rows = strip_rows or config.SSIM_STRIP_ROWS
+    pad = (SSIM_WINDOW - 1) // 2
+    
+    ssim_map = np.empty((height, width), dtype=np.float32)
+    interior_sum = 0.0
+    for top in range(0, height, strip_rows):
+        bottom = min(height, top + strip_rows)
+        halo_top = max(0, top - pad)
+        halo_bottom = min(height, bottom + pad)
+        strip = ssim_strip(gray1[halo_top:halo_bottom], gray2[halo_top:halo_bottom], data_range)
+        ssim_map[top:bottom] = strip[top - halo_top:top - halo_top + bottom - top]
+        
+        # The score excludes a window's half-width at the image borders, as skimage does
+        first, last = max(top, pad), min(bottom, height - pad)
+        if last > first:
+            interior_sum += float(ssim_map[first:last, pad:width - pad].sum(dtype=np.float64))
+    
+    interior_size = (height - 2 * pad) * (width - 2 * pad)
+    return interior_sum / interior_size, ssim_map
 
 def refine_image(original_image_path, refined_image_path, threshold=0.95):
     """
     Compare the original and refined images, and perform additional refinement if needed.
     
-    :param original_image_path: Path to the original image
-    :param refined_image_path: Path to the refined image
+    :param original_image_path: Path to the original image, RGB numpy array or PageContext
+    :param refined_image_path: Path to the refined image, or a PageContext for it
     :param threshold: SSIM threshold for accepting the refined image
     :return: Path to the final refined image
     """
-    similarity_score, diff = compare_images(original_image_path, refined_image_path)
+    original = as_page(original_image_path)
+    refined = as_page(refined_image_path)
+    refined_image_path = refined.path
+    
+    if refined.shape != original.shape:
+        # Rendered pages are not laid out at the scan's size; compare on the scan's grid
+        height, width = original.shape
+        refined = PageContext(bgr=cv2.resize(refined.bgr, (width, height), interpolation=cv2.INTER_AREA),
+                              path=refined_image_path)
+    
+    similarity_score, diff = compare_images(original, refined, threshold=threshold)
     
     if similarity_score >= threshold:
+        record_repair(0, original.shape)
         return refined_image_path
     
-    # If similarity is below threshold, perform additional refinement
-    original_img = cv2.imread(original_image_path)
-    refined_img = cv2.imread(refined_image_path)
+    # If similarity is below threshold, restore the regions that differ from the original
+    result, repaired_pixels = repair_regions(original.bgr, refined.bgr, diff)
+    record_repair(repaired_pixels, original.shape)
+    
+    # Save the result
+    final_refined_path = refined_image_path.replace('.png', '_final.png')
+    cv2.imwrite(final_refined_path, result)
     
+    return final_refined_path
+
+def repair_regions(original_img, refined_img, diff, min_area=100):
+    """
+    Copy the regions where the refined image departs from the original back from the original.
+    
+    Dissimilar pixels are found by Otsu thresholding the SSIM map; a single
+    connected-components pass drops regions of min_area pixels or fewer, and
+    the remaining regions are copied over in one masked assignment.
+    
+    :param original_img: Original image as a BGR numpy array
+    :param refined_img: Refined image as a BGR numpy array of the same shape
+    :param diff: SSIM map from compare_images
+    :param min_area: Largest region, in pixels, that is left as refined
+    :return: Tuple of (repaired image, number of repaired pixels)
+    """
     # Convert the difference map to uint8 and apply threshold
-    diff = (diff * 255).astype("uint8")
+    diff = (np.clip(diff, 0, 1) * 255).astype("uint8")
     thresh = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
     
-    # Find contours in the thresholded image
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] > min_area
+    keep[0] = False  # Label 0 is the background
+    mask = keep[labels]
     
-    # Create a mask for the areas that need refinement
-    mask = np.zeros(original_img.shape[:2], dtype="uint8")
-    for contour in contours:
-        if cv2.contourArea(contour) > 100:  # Ignore small contours
-            cv2.drawContours(mask, [contour], 0, 255, -1)
+    result = refined_img.copy()
+    result[mask] = original_img[mask]
+    return result, int(np.count_nonzero(mask))
+
+# Repair statistics for this process: how often the repair path runs and how much it replaces
+_repair_stats = {
+    'comparisons': 0,
+    'repairs': 0,
+    'repaired_pixels': 0,
+    'total_pixels': 0,
+    'fraction_histogram': [0] * len(REPAIR_FRACTION_BUCKETS),
+}
+_repair_lock = threading.Lock()
+
+def record_repair(repaired_pixels, shape):
+    """
+    Record the repaired-area fraction of one refined page.
     
-    # Apply the mask to the original image
-    result = cv2.bitwise_and(original_img, original_img, mask=mask)
-    result = cv2.add(refined_img, result)
+    :param repaired_pixels: Number of pixels restored from the original
+    :param shape: (height, width) of the page
+    """
+    total_pixels = shape[0] * shape[1]
+    fraction = repaired_pixels / total_pixels if total_pixels else 0.0
+    bucket = next(i for i, bound in enumerate(REPAIR_FRACTION_BUCKETS) if fraction <= bound)
+    with _repair_lock:
+        _repair_stats['comparisons'] += 1
+        _repair_stats['repairs'] += 1 if repaired_pixels else 0
+        _repair_stats['repaired_pixels'] += repaired_pixels
+        _repair_stats['total_pixels'] += total_pixels
+        _repair_stats['fraction_histogram'][bucket] += 1
+    repaired_fraction.observe(fraction)
+    if repaired_pixels:
+        logger.info(f"Repaired {fraction:.2%} of the page from the original")
+
+def repair_metrics():
+    """
+    Return repair statistics for this process.
     
-    # Save the result
-    final_refined_path = refined_image_path.replace('.png', '_final.png')
-    cv2.imwrite(final_refined_path, result)
+    fraction_histogram counts pages by repaired-area fraction, bucketed by
+    the upper bounds in REPAIR_FRACTION_BUCKETS.
     
-    return final_refined_path
+    :return: Dictionary of counters
+    """
+    with _repair_lock:
+        metrics = dict(_repair_stats, fraction_histogram=list(_repair_stats['fraction_histogram']))
+    total_pixels = metrics['total_pixels']
+    metrics['repaired_fraction'] = metrics['repaired_pixels'] / total_pixels if total_pixels else 0.0
+    return metrics
 
 # Additional image comparison functions can be added here
\ No newline at end of file
@@ -1,19 +1,21 @@
 from transformers import T5ForConditionalGeneration, T5Tokenizer
-import matplotlib.pyplot as plt
-import io
-from PIL import Image
-import numpy as np
 import subprocess
 import logging
+from config.config import config
+from model_registry import get_model
+from snippet_renderer import escape_text, render_page
+from tex_pool import get_tex_pool
 
-model = None
-tokenizer = None
-
-def load_model():
-    global model, tokenizer
-    if model is None or tokenizer is None:
-        model = T5ForConditionalGeneration.from_pretrained("t5-base")
-        tokenizer = T5Tokenizer.from_pretrained("t5-base")
+def get_latex_model(model_name=None):
+    """
+    Return the text-to-LaTeX model and its tokenizer, loading them once per process.
+    
+    :param model_name: Hugging Face model name or path; defaults to config.LATEX_MODEL
+    :return: Tuple of (model, tokenizer)
+    """
+    model_name = model_name or config.LATEX_MODEL
+    return get_model(('latex', model_name), lambda: (T5ForConditionalGeneration.from_pretrained(model_name),
+                                                     T5Tokenizer.from_pretrained(model_name)))
 
 def text_to_latex(text):
     """
@@ -22,15 +24,48 @@ def text_to_latex(text):
     :param text: Input text to convert
     :return: LaTeX representation of the input text
     """
-    load_model()
+    return texts_to_latex([text])[0]
+
+def texts_to_latex(texts, batch_size=None):
+    """
+    Convert several text segments to LaTeX, running the model on padded batches of similar length.
+    
+    :param texts: List of input texts to convert
+    :param batch_size: Number of sequences per generate call; defaults to config.LATEX_BATCH_SIZE
+    :return: List of LaTeX strings, one per input text, in input order
+    """
+    if not texts:
+        return []
+    
+    model, tokenizer = get_latex_model()
     
-    input_text = f"translate English to LaTeX: {text}"
-    input_ids = tokenizer.encode(input_text, return_tensors="pt")
+    # Identical segments (headers, repeated list items) are only generated once
+    unique_texts = list(dict.fromkeys(texts))
+    input_texts = [f"translate English to LaTeX: {text}" for text in unique_texts]
+    input_ids = tokenizer(input_texts, truncation=True, max_length=512)['input_ids']
     
-    outputs = model.generate(input_ids, max_length=512, num_return_sequences=1)
-    latex_output = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    translations = {}
+    for indices in length_buckets([len(ids) for ids in input_ids], batch_size or config.LATEX_BATCH_SIZE):
+        batch = tokenizer.pad({'input_ids': [input_ids[i] for i in indices]}, return_tensors="pt")
+        outputs = model.generate(batch['input_ids'], attention_mask=batch['attention_mask'],
+                                 max_length=512, num_return_sequences=1)
+        decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        for index, latex_output in zip(indices, decoded):
+            translations[unique_texts[index]] = latex_output
     
-    return latex_output
+    return [translations[text] for text in texts]
+
+def length_buckets(lengths, batch_size):
+    """
+    Group sequence indices into batches of similar length to minimise padding.
+    
+    :param lengths: List of sequence lengths
+    :param batch_size: Maximum number of sequences per batch
+    :return: List of batches, each a list of indices into lengths
+    """
+    batch_size = max(1, batch_size)
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
 
 def convert_layout_to_latex(merged_layout):
     """
@@ -39,36 +74,85 @@ def convert_layout_to_latex(merged_layout):
     :param merged_layout: Merged layout information from OCR and layout analysis
     :return: LaTeX representation of the document
     """
-    latex_output = []
-    
-    for element in merged_layout:
-        if element['type'] == 'Title':
-            latex_output.append(f"\\section{{{element['text']}}}")
-        elif element['type'] == 'Text':
-            latex_output.append(text_to_latex(element['text']))
-        elif element['type'] == 'List':
-            latex_output.append("\\begin{itemize}")
-            for item in element['text'].split('\n'):
-                latex_output.append(f"\\item {text_to_latex(item)}")
-            latex_output.append("\\end{itemize}")
-        elif element['type'] == 'Figure':
-            # Placeholder for figure handling
-            latex_output.append("\\begin{figure}[h]\n\\centering\n\\includegraphics[width=0.8\\textwidth]{placeholder.png}\n\\caption{Figure caption}\n\\end{figure}")
-    
-    return '\n\n'.join(latex_output)
+    return convert_layouts_to_latex([merged_layout])[0]
+
+def convert_layouts_to_latex(merged_layouts):
+    """
+    Convert the merged layouts of several pages to LaTeX.
+    
+    :param merged_layouts: List of merged layouts, one per page
+    :return: List of LaTeX representations, one per page
+    """
+    return [blocks_to_latex(blocks) for blocks in convert_layouts_to_blocks(merged_layouts)]
+
+def blocks_to_latex(blocks):
+    """
+    Join a page's element blocks, from convert_layouts_to_blocks, into the page's LaTeX.
+    """
+    return '\n\n'.join(block['latex'] for block in blocks if block['latex'] is not None)
+
+def convert_layouts_to_blocks(merged_layouts):
+    """
+    Convert the merged layouts of several pages to LaTeX, element by element.
+    
+    Text segments from all pages are translated together so the model runs on
+    full batches, then mapped back to their elements in order.
+    
+    :param merged_layouts: List of merged layouts, one per page
+    :return: List of pages, each a list with one block per layout element, in layout order. A block's
+             'latex' is the element's LaTeX source and its 'snippet' the element's content as text with
+             inline $math$, for drawing over the element; either is None for elements without one.
+    """
+    segments = []
+    for merged_layout in merged_layouts:
+        for element in merged_layout:
+            if element['type'] == 'Text':
+                segments.append(element['text'])
+            elif element['type'] == 'List':
+                segments.extend(element['text'].split('\n'))
+    
+    translations = iter(texts_to_latex(segments))
+    
+    pages = []
+    for merged_layout in merged_layouts:
+        blocks = []
+        
+        for element in merged_layout:
+            latex = snippet = None
+            if element['type'] == 'Title':
+                latex = f"\\section{{{element['text']}}}"
+                snippet = escape_text(element['text'])
+            elif element['type'] == 'Text':
+                translation = next(translations)
+                latex, snippet = translation, f"${translation}$"
+            elif element['type'] == 'List':
+                items = [next(translations) for _ in element['text'].split('\n')]
+                latex = '\n\n'.join(["\\begin{itemize}"] + [f"\\item {item}" for item in items] + ["\\end{itemize}"])
+                snippet = '\n'.join(f"\u2022 ${item}$" for item in items)
+            elif element['type'] == 'Figure':
+                # Placeholder for figure handling
+                latex = "\\begin{figure}[h]\n\\centering\n\\includegraphics[width=0.8\\textwidth]{placeholder.png}\n\\caption{Figure caption}\n\\end{figure}"
+            blocks.append({'latex': latex, 'snippet': snippet})
+        
+        pages.append(blocks)
+    
+    return pages
 
 def render_latex(latex_code, output_path):
-    with open('temp.tex', 'w') as f:
-        f.write(latex_code)
+    """
+    Compile LaTeX to a PDF.
     
+    Compiles run in isolated job directories on the process's TeX pool, so
+    concurrent tasks are safe; identical sources reuse the cached PDF.
+    
+    :param latex_code: LaTeX source; fragments are wrapped in the default preamble
+    :param output_path: Path to save the PDF
+    """
     try:
-        subprocess.run(['pdflatex', '-interaction=nonstopmode', 'temp.tex'], check=True)
-        subprocess.run(['mv', 'temp.pdf', output_path], check=True)
-    except subprocess.CalledProcessError as e:
+        get_tex_pool().render(latex_code, output_path)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
         logging.error(f"LaTeX rendering failed: {e}")
         raise
-    finally:
-        subprocess.run(['rm', 'temp.tex', 'temp.aux', 'temp.log'], check=False)
 
 def latex_to_image(latex_content):
     """
@@ -77,14 +161,4 @@ def latex_to_image(latex_content):
     :param latex_content: LaTeX content to render
     :return: Numpy array representing the rendered image
     """
-    fig = plt.figure(figsize=(8.5, 11))  # Standard letter size
-    plt.axis('off')
-    plt.text(0.5, 0.5, f'${latex_content}$', size=12, ha='center', va='center', wrap=True)
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=300, bbox_inches='tight', pad_inches=0.1)
-    plt.close(fig)
-    
-    buf.seek(0)
-    img = Image.open(buf)
-    return np.array(img)
\ No newline at end of file
+    return render_page(latex_content)
\ No newline at end of file
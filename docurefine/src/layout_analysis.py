@@ -1,49 +1,137 @@
 import layoutparser as lp
-import cv2
+import numpy as np
+import torch
+from config.config import config
+from model_registry import get_model
+from page_context import as_page
+
+def get_layout_model(config_path=None):
+    """
+    Return the layout detection model for the given config, loading it once per process.
+    
+    :param config_path: LayoutParser model config; defaults to config.LAYOUT_MODEL
+    :return: Detectron2LayoutModel instance
+    """
+    config_path = config_path or config.LAYOUT_MODEL
+    return get_model(('layout', config_path), lambda: lp.models.Detectron2LayoutModel(config_path))
+
+def layout_to_elements(layout):
+    """
+    Convert a LayoutParser layout into the element dictionaries used by the pipeline.
+    
+    :param layout: Detected LayoutParser layout
+    :return: List of layout elements
+    """
+    elements = []
+    for element in layout:
+        elements.append({
+            'type': element.type,
+            'coordinates': element.coordinates,
+            'score': element.score
+        })
+    return elements
 
 def analyze_layout(image_path):
     """
     Analyze the layout of a given image using LayoutParser.
     
-    :param image_path: Path to the input image
+    :param image_path: Path to the input image, RGB numpy array or PageContext
     :return: List of detected layout elements
     """
     # Load the image
-    image = cv2.imread(image_path)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image = as_page(image_path).rgb
 
-    # Load a pre-trained model
-    model = lp.models.Detectron2LayoutModel('lp://PubLayNet/mask_rcnn_X_101_32x8d_FPN_3x/config')
+    # Get the pre-trained model resident in this process
+    model = get_layout_model()
 
     # Detect layout elements
     layout = model.detect(image)
 
     # Process and return the detected elements
-    elements = []
-    for element in layout:
-        elements.append({
-            'type': element.type,
-            'coordinates': element.coordinates,
-            'score': element.score
-        })
+    return layout_to_elements(layout)
 
-    return elements
+def analyze_layout_batch(images, batch_size=None):
+    """
+    Analyze the layout of several page images, running detection in mini-batches.
+    
+    :param images: List of image paths, RGB numpy arrays or PageContexts
+    :param batch_size: Number of pages per forward pass; defaults to config.LAYOUT_BATCH_SIZE
+    :return: List with one list of detected layout elements per input image, in input order
+    """
+    batch_size = max(1, batch_size or config.LAYOUT_BATCH_SIZE)
+    model = get_layout_model()
 
-def merge_ocr_and_layout(ocr_result, layout_elements):
+    results = []
+    for start in range(0, len(images), batch_size):
+        batch = [as_page(image).rgb for image in images[start:start + batch_size]]
+        for layout in detect_batch(model, batch):
+            results.append(layout_to_elements(layout))
+    return results
+
+def detect_batch(model, images):
+    """
+    Run the Detectron2 predictor on several images in a single forward pass.
+    
+    Mirrors what DefaultPredictor does for one image, but hands the whole list
+    to the underlying network. Falls back to per-image detection when the model
+    does not expose a Detectron2 predictor.
+    
+    :param model: Detectron2LayoutModel instance
+    :param images: List of RGB numpy arrays
+    :return: List of LayoutParser layouts, one per image
+    """
+    predictor = getattr(model, 'model', None)
+    if len(images) == 1 or not hasattr(predictor, 'aug') or not hasattr(predictor, 'model'):
+        return [model.detect(image) for image in images]
+
+    inputs = []
+    for image in images:
+        original = model.image_preprocess(image) if hasattr(model, 'image_preprocess') else image
+        if predictor.input_format == 'RGB':
+            original = original[:, :, ::-1]
+        height, width = original.shape[:2]
+        resized = predictor.aug.get_transform(original).apply_image(original)
+        tensor = torch.as_tensor(resized.astype('float32').transpose(2, 0, 1))
+        inputs.append({'image': tensor, 'height': height, 'width': width})
+
+    with torch.no_grad():
+        outputs = predictor.model(inputs)
+
+    return [model.gather_output(output) for output in outputs]
+
+MERGE_POLICIES = ('any', 'majority', 'centroid')
+
+def merge_ocr_and_layout(ocr_result, layout_elements, policy=None):
     """
     Merge OCR results with layout analysis.
     
+    Word boxes are held in arrays and tested against every block at once.
+    The assignment policy decides which block(s) a word belongs to:
+    
+    - 'any': every block the word box touches (words can repeat across overlapping blocks)
+    - 'majority': the block covering the largest share of the word, if it covers at least half of it
+    - 'centroid': the smallest block containing the word's centre point
+    
     :param ocr_result: Result from OCR with layout information
     :param layout_elements: Result from layout analysis
+    :param policy: Assignment policy; defaults to config.MERGE_POLICY
     :return: Merged layout information
     """
+    policy = policy or config.MERGE_POLICY
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy: {policy}")
+    
+    words = ocr_result['layout']
+    assignment = assign_words_to_blocks(
+        word_boxes(words),
+        np.array([element['coordinates'] for element in layout_elements], dtype=np.float64).reshape(-1, 4),
+        policy
+    )
+    
     merged_layout = []
     
-    for layout_element in layout_elements:
-        matching_text = []
-        for ocr_element in ocr_result['layout']:
-            if rectangles_overlap(layout_element['coordinates'], ocr_element):
-                matching_text.append(ocr_element['text'])
+    for block_index, layout_element in enumerate(layout_elements):
+        matching_text = [words[i]['text'] for i in np.flatnonzero(assignment[block_index])]
         
         merged_layout.append({
             'type': layout_element['type'],
@@ -53,6 +141,61 @@ def merge_ocr_and_layout(ocr_result, layout_elements):
     
     return merged_layout
 
+def word_boxes(words):
+    """
+    Convert OCR word dictionaries to an array of boxes.
+    
+    :param words: List of OCR words with left, top, width and height
+    :return: Float array of shape (n, 4) holding (x1, y1, x2, y2) per word
+    """
+    boxes = np.array([(word['left'], word['top'], word['width'], word['height']) for word in words],
+                     dtype=np.float64).reshape(-1, 4)
+    boxes[:, 2] += boxes[:, 0]
+    boxes[:, 3] += boxes[:, 1]
+    return boxes
+
+def assign_words_to_blocks(words, blocks, policy='any'):
+    """
+    Assign word boxes to layout blocks with vectorized interval tests.
+    
+    :param words: Array of shape (n, 4) of word boxes (x1, y1, x2, y2)
+    :param blocks: Array of shape (m, 4) of block boxes (x1, y1, x2, y2)
+    :param policy: One of 'any', 'majority' or 'centroid'
+    :return: Boolean array of shape (m, n); entry [b, w] is True if word w belongs to block b
+    """
+    wx1, wy1, wx2, wy2 = (words[:, i][np.newaxis, :] for i in range(4))
+    bx1, by1, bx2, by2 = (blocks[:, i][:, np.newaxis] for i in range(4))
+    
+    if policy == 'any':
+        # Same closed-interval test as rectangles_overlap
+        return ~((bx2 < wx1) | (bx1 > wx2) | (by2 < wy1) | (by1 > wy2))
+    
+    assignment = np.zeros((len(blocks), len(words)), dtype=bool)
+    if len(blocks) == 0 or len(words) == 0:
+        return assignment
+    columns = np.arange(len(words))
+    
+    if policy == 'majority':
+        overlap_w = np.clip(np.minimum(bx2, wx2) - np.maximum(bx1, wx1), 0, None)
+        overlap_h = np.clip(np.minimum(by2, wy2) - np.maximum(by1, wy1), 0, None)
+        overlap = overlap_w * overlap_h
+        word_area = np.maximum((wx2 - wx1) * (wy2 - wy1), 1e-9)
+        best = overlap.argmax(axis=0)
+        keep = overlap[best, columns] >= 0.5 * word_area[0]
+        assignment[best[keep], columns[keep]] = True
+        return assignment
+    
+    # Centroid: among the blocks containing the centre, pick the smallest
+    cx = (wx1 + wx2) / 2
+    cy = (wy1 + wy2) / 2
+    contains = (bx1 <= cx) & (cx <= bx2) & (by1 <= cy) & (cy <= by2)
+    block_area = (bx2 - bx1) * (by2 - by1)
+    areas = np.where(contains, block_area, np.inf)
+    best = areas.argmin(axis=0)
+    keep = contains[best, columns]
+    assignment[best[keep], columns[keep]] = True
+    return assignment
+
 def rectangles_overlap(rect1, rect2):
     """
     Check if two rectangles overlap.
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from artifact_store import get_artifact_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIRECTORY = '.manifest'
+
+def document_fingerprint(input_path, version):
+    """
+    Compute a hash of a document's content and the pipeline version that processes it.
+
+    :param input_path: Path to the input document
+    :param version: Pipeline version string; a new version invalidates the manifest
+    :return: Hex digest
+    """
+    digest = hashlib.sha256(version.encode() + b'\0')
+    with open(input_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class PageManifest:
+    """
+    Checkpoint of a document's finished pages, kept in its output directory.
+
+    Each finished page is recorded as <output_directory>/.manifest/page_<N>.json
+    holding its processed page dictionary, written atomically as soon as the
+    page is rendered. Retried, redelivered and resubmitted tasks look pages up
+    here and only process the ones without a record. The manifest belongs to
+    one document fingerprint; opening it for different content or a different
+    pipeline version discards the existing records.
+    """
+
+    def __init__(self, output_directory):
+        self.directory = os.path.join(output_directory, MANIFEST_DIRECTORY)
+
+    @classmethod
+    def open(cls, input_path, output_directory, version):
+        """
+        Open a document's manifest, discarding it if it was written for other content.
+
+        :param input_path: Path to the input document
+        :param output_directory: Document output directory
+        :param version: Pipeline version string
+        :return: PageManifest
+        """
+        manifest = cls(output_directory)
+        fingerprint = document_fingerprint(input_path, version)
+        if manifest.fingerprint() != fingerprint:
+            if os.path.isdir(manifest.directory):
+                logger.info(f"Discarding the page manifest in {output_directory}: the document changed")
+            shutil.rmtree(manifest.directory, ignore_errors=True)
+            os.makedirs(manifest.directory, exist_ok=True)
+            manifest._write('document.json', {'fingerprint': fingerprint, 'input_path': input_path})
+        return manifest
+
+    def _write(self, name, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def fingerprint(self):
+        """
+        Return the fingerprint of the document the manifest was written for, or None.
+        """
+        document = self._read('document.json')
+        return document['fingerprint'] if document else None
+
+    def record(self, page):
+        """
+        Record a finished page.
+
+        :param page: Processed page dictionary, as returned by the render stage
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(f"page_{page['page_number']}.json", page)
+
+    def get(self, page_number):
+        """
+        Return a finished page's record, or None if it has to be processed.
+
+        Records whose refined image has gone missing from the artifact store
+        do not count as finished. Blank pages have no image.
+        """
+        page = self._read(f"page_{page_number}.json")
+        if page is None or page.get('blank'):
+            return page
+        if 'image' not in page or not get_artifact_store().exists(page['image']['key']):
+            return None
+        return page
+
+    def pages(self):
+        """
+        Return every finished page's record, in page order.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        page_numbers = sorted(int(name[len('page_'):-len('.json')]) for name in os.listdir(self.directory)
+                              if name.startswith('page_') and name.endswith('.json'))
+        return [page for page in map(self.get, page_numbers) if page is not None]
+
+    def missing(self, page_numbers):
+        """
+        Return the page numbers without a finished record, in order.
+        """
+        return [page_number for page_number in page_numbers if self.get(page_number) is None]
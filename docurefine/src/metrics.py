@@ -0,0 +1,10 @@
+from prometheus_client import Histogram
+
+# Pipeline metrics are defined here, and imported by the modules recording them, so each is
+# registered once however those modules are imported. In Celery workers they are served by
+# the worker's metrics server (see config/celery_config.py).
+
+REPAIR_FRACTION_BUCKETS = (0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+repaired_fraction = Histogram('refine_repaired_fraction', 'Fraction of page area restored from the original',
+                              buckets=REPAIR_FRACTION_BUCKETS[1:])
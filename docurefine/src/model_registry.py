@@ -0,0 +1,102 @@
+import logging
+import os
+import resource
+import threading
+import time
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+# Models loaded in this process, keyed by (kind, name)
+_models = {}
+_metrics = {}
+_lock = threading.Lock()
+
+def _current_rss_bytes():
+    """
+    Return the resident set size of the current process in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def get_model(key, loader):
+    """
+    Return the model registered under key, loading it on first use.
+
+    Each worker process loads a given model at most once; later calls
+    return the same instance.
+
+    :param key: Hashable identifier for the model, e.g. ('layout', config_path)
+    :param loader: Callable taking no arguments that builds the model
+    :return: The loaded model
+    """
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            rss_before = _current_rss_bytes()
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            _models[key] = model
+            _metrics[key] = {
+                'load_seconds': load_seconds,
+                'rss_delta_bytes': _current_rss_bytes() - rss_before,
+                'pid': os.getpid(),
+            }
+            logger.info(f"Loaded model {key} in {load_seconds:.2f}s "
+                        f"(+{_metrics[key]['rss_delta_bytes'] / 2**20:.1f} MB RSS)")
+    return model
+
+def is_loaded(key):
+    """
+    Check whether a model has already been loaded in this process.
+
+    :param key: Model identifier
+    :return: Boolean indicating if the model is resident
+    """
+    return key in _models
+
+def model_metrics():
+    """
+    Return load-time and memory metrics for the models resident in this process.
+
+    :return: Dictionary mapping model keys to their metrics
+    """
+    return {key: dict(metrics) for key, metrics in _metrics.items()}
+
+def clear_models():
+    """
+    Drop every loaded model from the registry.
+    """
+    with _lock:
+        _models.clear()
+        _metrics.clear()
+
+def preload_models(stages=None):
+    """
+    Load the models used by the pipeline into the current process.
+
+    Called from the Celery worker-process-init hook so that tasks only pay
+    for inference.
+
+    :param stages: Pipeline stage queues served by this process; None loads everything
+    """
+    from latex_converter import get_latex_model
+    from layout_analysis import get_layout_model
+    from ocr import get_ocr_pool
+
+    if stages is None or 'layout' in stages:
+        get_layout_model(config.LAYOUT_MODEL)
+    if stages is None or 'ocr' in stages:
+        get_ocr_pool().warm()
+    if stages is None or 'latex' in stages:
+        get_latex_model(config.LATEX_MODEL)
+    return model_metrics()
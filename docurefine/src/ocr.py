@@ -1,42 +1,357 @@
+import logging
+import math
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 import pytesseract
 from PIL import Image
+from functools import lru_cache
+from config.config import config
+from page_context import as_page
+
+try:
+    import tesserocr
+except ImportError:  # The pytesseract backend is used instead
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+class TesserocrEngine:
+    """
+    Tesseract held in-process through its C API.
+
+    The traineddata is loaded once when the engine is created; each call only
+    sets the image and runs recognition.
+    """
+    backend = 'tesserocr'
+
+    def __init__(self, lang='eng'):
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.AUTO)
+
+    def recognize(self, image, psm=None):
+        """
+        Run one recognition pass over an image.
+
+        :param image: PIL image
+        :param psm: Tesseract page segmentation mode; defaults to automatic
+        :return: Dictionary with 'text', 'words' and 'lines'
+        """
+        self.api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+        self.api.SetImage(image)
+        self.api.Recognize()
+
+        return {
+            'text': self.api.GetUTF8Text(),
+            'words': self._collect(tesserocr.RIL.WORD),
+            'lines': self._collect(tesserocr.RIL.TEXTLINE),
+        }
+
+    def _collect(self, level):
+        items = []
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return items
+        for result in tesserocr.iterate_level(iterator, level):
+            text = result.GetUTF8Text(level)
+            box = result.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            items.append({
+                'text': text.strip(),
+                'left': x1,
+                'top': y1,
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'conf': result.Confidence(level)
+            })
+        return items
+
+    def close(self):
+        self.api.End()
+
+class PytesseractEngine:
+    """
+    Fallback engine that drives the tesseract command line through pytesseract.
+
+    Word data and plain text still come from a single tesseract run.
+    """
+    backend = 'pytesseract'
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+
+    def recognize(self, image, psm=None):
+        """
+        Run one recognition pass over an image.
+
+        :param image: PIL image
+        :param psm: Tesseract page segmentation mode; defaults to automatic
+        :return: Dictionary with 'text', 'words' and 'lines'
+        """
+        tesseract_config = f'--psm {psm}' if psm is not None else ''
+        data = pytesseract.image_to_data(image, lang=self.lang, config=tesseract_config,
+                                         output_type=pytesseract.Output.DICT)
+        return result_from_data(data)
+
+    def close(self):
+        pass
+
+def result_from_data(data):
+    """
+    Build words, lines and plain text from pytesseract image_to_data output.
+
+    :param data: Dictionary returned by pytesseract.image_to_data
+    :return: Dictionary with 'text', 'words' and 'lines'
+    """
+    words = []
+    lines = {}
+    for i in range(len(data['text'])):
+        text = str(data['text'][i]).strip()
+        if not text:
+            continue
+        word = {
+            'text': text,
+            'left': data['left'][i],
+            'top': data['top'][i],
+            'width': data['width'][i],
+            'height': data['height'][i],
+            'conf': float(data['conf'][i])
+        }
+        words.append(word)
+        lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+
+    line_items = []
+    for line_words in lines.values():
+        left = min(word['left'] for word in line_words)
+        top = min(word['top'] for word in line_words)
+        right = max(word['left'] + word['width'] for word in line_words)
+        bottom = max(word['top'] + word['height'] for word in line_words)
+        line_items.append({
+            'text': ' '.join(word['text'] for word in line_words),
+            'left': left,
+            'top': top,
+            'width': right - left,
+            'height': bottom - top,
+            'conf': sum(word['conf'] for word in line_words) / len(line_words)
+        })
+
+    return {
+        'text': '\n'.join(line['text'] for line in line_items),
+        'words': words,
+        'lines': line_items,
+    }
+
+class OcrEnginePool:
+    """
+    Pool of persistent OCR engines for one worker process.
+
+    Engines are created on demand, up to size, and handed to one thread at a
+    time; they stay loaded between tasks.
+    """
+
+    def __init__(self, size=None, backend=None, lang=None):
+        self.size = size or config.OCR_POOL_SIZE or os.cpu_count() or 1
+        self.backend = backend or config.OCR_BACKEND
+        self.lang = lang or config.OCR_LANG
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_engine(self):
+        if self.backend == 'tesserocr' or (self.backend == 'auto' and tesserocr is not None):
+            if tesserocr is None:
+                raise RuntimeError("OCR_BACKEND is 'tesserocr' but tesserocr is not installed")
+            return TesserocrEngine(self.lang)
+        return PytesseractEngine(self.lang)
+
+    @contextmanager
+    def engine(self):
+        """
+        Borrow an engine from the pool, creating one if all are busy and the pool is not full.
+        """
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    engine = self._create_engine()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                engine = self._idle.get()
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def recognize(self, image, psm=None):
+        """
+        Run one recognition pass on a pooled engine.
+
+        :param image: PIL image
+        :param psm: Tesseract page segmentation mode; defaults to automatic
+        :return: Dictionary with 'text', 'words' and 'lines'
+        """
+        with self.engine() as engine:
+            return engine.recognize(image, psm)
+
+    def warm(self, count=1):
+        """
+        Create engines ahead of the first task.
+        """
+        with ExitStack() as stack:
+            for _ in range(min(count, self.size)):
+                stack.enter_context(self.engine())
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """
+    Return the OCR engine pool for this process.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OcrEnginePool()
+    return _pool
+
+def ocr_page(image_path, psm=None):
+    """
+    Recognize an image once and return its words, lines, confidences and plain text.
+
+    :param image_path: Path to the input image, RGB numpy array or PageContext
+    :param psm: Tesseract page segmentation mode; defaults to automatic
+    :return: Dictionary with 'text', 'words' and 'lines'
+    """
+    return get_ocr_pool().recognize(as_page(image_path).pil, psm)
 
 def perform_ocr(image_path):
     """
     Perform OCR on the given image.
-    
-    :param image_path: Path to the input image
+
+    :param image_path: Path to the input image, RGB numpy array or PageContext
     :return: Extracted text as a string
     """
-    image = Image.open(image_path)
-    text = pytesseract.image_to_string(image)
-    return text
+    return ocr_page(image_path)['text']
 
 def perform_ocr_with_layout(image_path):
     """
     Perform OCR on the given image and return layout information.
-    
-    :param image_path: Path to the input image
+
+    :param image_path: Path to the input image, RGB numpy array or PageContext
     :return: Dictionary containing extracted text and layout information
     """
-    image = Image.open(image_path)
-    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-    
+    recognized = ocr_page(image_path)
+
     result = {
-        'text': ' '.join(data['text']),
-        'layout': []
+        'text': recognized['text'],
+        'layout': [],
+        'lines': recognized['lines']
     }
-    
-    for i in range(len(data['text'])):
-        if int(data['conf'][i]) > 60:  # Only consider text with confidence > 60%
-            result['layout'].append({
-                'text': data['text'][i],
-                'left': data['left'][i],
-                'top': data['top'][i],
-                'width': data['width'][i],
-                'height': data['height'][i]
-            })
-    
+
+    for word in recognized['words']:
+        if word['conf'] > 60:  # Only consider text with confidence > 60%
+            result['layout'].append(word)
+
     return result
 
+# Page segmentation mode per text-bearing block type; other blocks are never OCR'd
+REGION_PSM = {
+    'Title': 7,  # Single text line
+    'Text': 6,   # Single uniform block of text
+    'List': 4,   # Single column of text of variable sizes
+}
+
+def perform_region_ocr(image_path, layout_elements, max_workers=None):
+    """
+    OCR only the text-bearing layout blocks of a page.
+
+    Each Text, Title and List block is cropped and recognized on its own, with
+    a page segmentation mode suited to its type, on a thread pool backed by
+    the OCR engine pool. Figures, tables and margins are never sent to OCR.
+    The result already has the shape of merge_ocr_and_layout, so no merge
+    step is needed.
+
+    :param image_path: Path to the input image, RGB numpy array or PageContext
+    :param layout_elements: Result from layout analysis
+    :param max_workers: Concurrent crops; defaults to config.REGION_OCR_WORKERS, or the engine pool size
+    :return: Merged layout information, with each block's words in page coordinates under 'words'
+    """
+    image = as_page(image_path).rgb
+    height, width = image.shape[:2]
+    padding = config.REGION_OCR_PADDING
+    pool = get_ocr_pool()
+
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=max_workers or config.REGION_OCR_WORKERS or pool.size) as executor:
+        for index, element in enumerate(layout_elements):
+            psm = REGION_PSM.get(element['type'])
+            if psm is None:
+                continue
+            x1, y1, x2, y2 = element['coordinates']
+            left, top = max(0, int(x1) - padding), max(0, int(y1) - padding)
+            right, bottom = min(width, math.ceil(x2) + padding), min(height, math.ceil(y2) + padding)
+            if right <= left or bottom <= top:
+                continue
+            crop = Image.fromarray(image[top:bottom, left:right])
+            jobs[index] = (left, top, executor.submit(pool.recognize, crop, psm))
+
+    merged_layout = []
+    for index, element in enumerate(layout_elements):
+        words = []
+        lines = []
+        if index in jobs:
+            left, top, future = jobs[index]
+            recognized = future.result()
+            for word in recognized['words']:
+                if word['conf'] > 60:  # Only consider text with confidence > 60%
+                    words.append(dict(word, left=word['left'] + left, top=word['top'] + top))
+            lines = [line['text'] for line in recognized['lines']]
+
+        if element['type'] == 'List':
+            text = '\n'.join(lines)  # One list item per line
+        else:
+            text = ' '.join(word['text'] for word in words)
+
+        merged_layout.append({
+            'type': element['type'],
+            'coordinates': element['coordinates'],
+            'text': text,
+            'words': words
+        })
+
+    return merged_layout
+
+@lru_cache(maxsize=1)
+def ocr_engine_version():
+    """
+    Return the version of the OCR engine, used to key cached OCR results.
+
+    Every worker keys its cache lookups with it, including those without
+    Tesseract installed, so config.OCR_ENGINE_VERSION is used when set and
+    the local engine is only asked otherwise.
+
+    :return: Engine version as a string
+    """
+    if config.OCR_ENGINE_VERSION:
+        return config.OCR_ENGINE_VERSION
+    if config.OCR_BACKEND != 'pytesseract' and tesserocr is not None:
+        return f"tesserocr-{tesserocr.tesseract_version().split()[1]}"
+    try:
+        return f"tesseract-{pytesseract.get_tesseract_version()}"
+    except pytesseract.TesseractNotFoundError:
+        raise RuntimeError("Tesseract is not installed on this worker; set OCR_ENGINE_VERSION to the "
+                           "version the OCR workers run") from None
+
 # Additional OCR-related functions can be added here
\ No newline at end of file
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from config.config import config
+from page_context import as_page
+
+logger = logging.getLogger(__name__)
+
+def page_fingerprint(image):
+    """
+    Compute a content hash of a page's decoded pixels.
+
+    The hash depends only on the pixel data, so the same page uploaded under
+    different paths (or in different documents) maps to the same entry.
+
+    :param image: Path to the page image, RGB numpy array or PageContext
+    :return: Hex digest identifying the page content
+    """
+    return as_page(image).fingerprint
+
+def _json_default(value):
+    """
+    Encode the numpy values stage outputs may hold, such as detection scores, as plain JSON.
+    """
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class PageCache:
+    """
+    Two-tier cache for per-page pipeline artifacts.
+
+    Entries are keyed by (stage, version, page fingerprint). The first tier is
+    an in-process LRU; the second is a directory shared by every worker on the
+    host (or on a shared volume), evicted oldest-first once it exceeds its
+    size budget. Disk entries are stored as JSON rather than pickles, since
+    the directory may be shared and loading a pickle can run arbitrary code;
+    tuples therefore come back from it as lists.
+    """
+
+    def __init__(self, directory=None, max_memory_entries=256, max_disk_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def make_key(stage, fingerprint, version):
+        return hashlib.sha256(f"{stage}:{version}:{fingerprint}".encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, stage, fingerprint, version):
+        """
+        Look up a cached artifact.
+
+        :param stage: Pipeline stage name ('ocr', 'layout', 'merged', 'latex')
+        :param fingerprint: Page fingerprint from page_fingerprint
+        :param version: Engine/model version the artifact was produced with
+        :return: The cached value, or None on a miss
+        """
+        key = self.make_key(stage, fingerprint, version)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if not self.directory:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = json.loads(f.read())
+            os.utime(path)  # Mark as recently used for eviction
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            return None
+
+        self._remember(key, value)
+        return value
+
+    def put(self, stage, fingerprint, version, value):
+        """
+        Store an artifact in both tiers.
+
+        :param stage: Pipeline stage name
+        :param fingerprint: Page fingerprint from page_fingerprint
+        :param version: Engine/model version the artifact was produced with
+        :param value: JSON-serializable artifact; numpy values are stored as plain numbers and lists
+        """
+        key = self.make_key(stage, fingerprint, version)
+        self._remember(key, value)
+
+        if not self.directory:
+            return
+
+        path = self._disk_path(key)
+        data = json.dumps(value, default=_json_default).encode()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)  # Atomic, so concurrent readers never see partial entries
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path}: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - replaced_size
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict()
+
+    def get_or_compute(self, stage, fingerprint, version, compute):
+        """
+        Return the cached artifact, computing and storing it on a miss.
+
+        :param compute: Callable taking no arguments that produces the artifact
+        """
+        value = self.get(stage, fingerprint, version)
+        if value is None:
+            value = compute()
+            self.put(stage, fingerprint, version, value)
+        return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self):
+        """
+        Remove least recently used disk entries until the tier is at 90% of its budget.
+        """
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """
+        Drop every entry from both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            for path, _, _ in list(self._disk_entries()):
+                os.remove(path)
+            with self._lock:
+                self._disk_bytes = 0
+
+_page_cache = None
+
+def get_page_cache():
+    """
+    Return the page cache for this process, configured from config.
+    """
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = PageCache(config.PAGE_CACHE_DIR or None,
+                                max_memory_entries=config.PAGE_CACHE_MEMORY_ENTRIES,
+                                max_disk_bytes=config.PAGE_CACHE_MAX_BYTES)
+    return _page_cache
@@ -0,0 +1,140 @@
+import hashlib
+import cv2
+import numpy as np
+from PIL import Image
+
+class PageContext:
+    """
+    A page image shared by the pipeline stages.
+
+    The page is decoded at most once; grayscale, RGB and BGR views are derived
+    lazily from whichever buffer is available and kept for later stages.
+    """
+
+    def __init__(self, rgb=None, bgr=None, gray=None, path=None, page_number=None):
+        if rgb is None and bgr is None and gray is None and path is None:
+            raise ValueError("PageContext needs pixel data or a path")
+        self.path = path
+        self.page_number = page_number
+        self._rgb = rgb
+        self._bgr = bgr
+        self._gray = gray
+        self._fingerprint = None
+
+    @classmethod
+    def from_path(cls, path, page_number=None):
+        """
+        Create a context for an image file; it is decoded on first access.
+        """
+        return cls(path=path, page_number=page_number)
+
+    @classmethod
+    def from_array(cls, image, page_number=None):
+        """
+        Create a context for an RGB (or single-channel) numpy array.
+        """
+        if image.ndim == 2:
+            return cls(gray=image, page_number=page_number)
+        return cls(rgb=image, page_number=page_number)
+
+    def _decode(self):
+        if self._rgb is None and self._bgr is None and self._gray is None:
+            bgr = cv2.imread(self.path)
+            if bgr is None:
+                raise ValueError(f"Could not read image: {self.path}")
+            self._bgr = bgr
+
+    @property
+    def bgr(self):
+        """
+        The page as a BGR array, as expected by OpenCV.
+        """
+        if self._bgr is None:
+            self._decode()
+        if self._bgr is None:
+            if self._rgb is not None:
+                self._bgr = cv2.cvtColor(self._rgb, cv2.COLOR_RGB2BGR)
+            else:
+                self._bgr = cv2.cvtColor(self._gray, cv2.COLOR_GRAY2BGR)
+        return self._bgr
+
+    @property
+    def rgb(self):
+        """
+        The page as an RGB array, as expected by LayoutParser and Tesseract.
+        """
+        if self._rgb is None:
+            self._decode()
+        if self._rgb is None:
+            if self._bgr is not None:
+                self._rgb = cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB)
+            else:
+                self._rgb = cv2.cvtColor(self._gray, cv2.COLOR_GRAY2RGB)
+        return self._rgb
+
+    @property
+    def gray(self):
+        """
+        The page as a single-channel grayscale array.
+        """
+        if self._gray is None:
+            self._decode()
+        if self._gray is None:
+            if self._bgr is not None:
+                self._gray = cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY)
+            else:
+                self._gray = cv2.cvtColor(self._rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def pil(self):
+        """
+        The page as a PIL image.
+        """
+        return Image.fromarray(self.rgb)
+
+    @property
+    def shape(self):
+        """
+        The (height, width) of the page in pixels.
+        """
+        for image in (self._rgb, self._bgr, self._gray):
+            if image is not None:
+                return image.shape[:2]
+        return self.bgr.shape[:2]
+
+    @property
+    def fingerprint(self):
+        """
+        A SHA-256 of the page's RGB pixels, independent of where the page came from.
+        """
+        if self._fingerprint is None:
+            image = self.rgb
+            digest = hashlib.sha256()
+            digest.update(f"{image.shape}:{image.dtype}".encode())
+            digest.update(np.ascontiguousarray(image).data)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def release(self):
+        """
+        Drop the derived views, keeping one decoded buffer.
+        """
+        if self._rgb is not None:
+            self._bgr = None
+            self._gray = None
+        elif self._bgr is not None:
+            self._gray = None
+
+def as_page(image):
+    """
+    Wrap an image in a PageContext.
+
+    :param image: PageContext, path to an image, or RGB numpy array
+    :return: PageContext for the image
+    """
+    if isinstance(image, PageContext):
+        return image
+    if isinstance(image, np.ndarray):
+        return PageContext.from_array(image)
+    return PageContext.from_path(image)
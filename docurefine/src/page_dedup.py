@@ -0,0 +1,218 @@
+import base64
+import json
+import logging
+import os
+import threading
+import cv2
+import numpy as np
+from config.config import config
+from page_context import as_page
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BLANK_SAMPLE_WIDTH = 256  # Pages are downsampled to this width for the blank test
+THUMBNAIL_WIDTH = 128  # Width of the thumbnails pHash candidates are confirmed against
+
+def is_blank(image, max_ink=None):
+    """
+    Check whether a page is blank or nearly so, from pixel statistics alone.
+
+    Ink is any pixel clearly darker than the page background (its median
+    brightness), so tinted paper and faint scanner noise do not count.
+
+    :param image: Path to the page image, RGB numpy array or PageContext
+    :param max_ink: Largest share of ink pixels a blank page may have; defaults to config.BLANK_MAX_INK
+    :return: True if the page is blank
+    """
+    max_ink = config.BLANK_MAX_INK if max_ink is None else max_ink
+    gray = as_page(image).gray
+    height, width = gray.shape
+    if width > BLANK_SAMPLE_WIDTH:
+        gray = cv2.resize(gray, (BLANK_SAMPLE_WIDTH, max(1, height * BLANK_SAMPLE_WIDTH // width)),
+                          interpolation=cv2.INTER_AREA)
+    background = np.median(gray)
+    ink = np.count_nonzero(gray < background - config.BLANK_INK_CONTRAST)
+    return ink <= max_ink * gray.size
+
+def perceptual_hash(image):
+    """
+    Compute the 64-bit DCT perceptual hash (pHash) of a page.
+
+    The page is reduced to 32x32 grayscale; each bit says whether one of the
+    8x8 lowest-frequency DCT coefficients is above their median. Re-scans,
+    recompression and small shifts change only a few bits.
+
+    :param image: Path to the page image, RGB numpy array or PageContext
+    :return: Hash as a 16-digit hex string
+    """
+    small = cv2.resize(as_page(image).gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # The DC term only measures overall brightness
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+def page_thumbnail(image):
+    """
+    Reduce a page to a small grayscale thumbnail, normalized to zero mean and unit variance.
+
+    :param image: Path to the page image, RGB numpy array or PageContext
+    :return: float32 numpy array THUMBNAIL_WIDTH pixels wide
+    """
+    gray = as_page(image).gray
+    height, width = gray.shape
+    thumbnail = cv2.resize(gray, (THUMBNAIL_WIDTH, max(1, height * THUMBNAIL_WIDTH // width)),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+    return (thumbnail - thumbnail.mean()) / (thumbnail.std() + 1e-6)
+
+def thumbnail_difference(thumbnail1, thumbnail2):
+    """
+    Return the mean absolute difference of two normalized thumbnails; infinite if their shapes differ.
+
+    Rescans of a page stay around 0.1, while different pages with the same
+    layout, whose hashes often match, differ by 0.25 or more.
+    """
+    if thumbnail1.shape != thumbnail2.shape:
+        return float('inf')
+    return float(np.mean(np.abs(thumbnail1 - thumbnail2)))
+
+def encode_thumbnail(thumbnail):
+    data = np.clip(thumbnail * 32 + 128, 0, 255).astype(np.uint8)  # +-4 standard deviations
+    return base64.b64encode(cv2.imencode('.png', data)[1].tobytes()).decode()
+
+def decode_thumbnail(encoded):
+    data = cv2.imdecode(np.frombuffer(base64.b64decode(encoded), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return (data.astype(np.float32) - 128) / 32
+
+def hamming_distance(hash1, hash2):
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count('1')
+
+def hash_bands(page_hash, bands):
+    """
+    Split a hash into bands. Two hashes within bands - 1 bits of each other share at least one band.
+    """
+    width = HASH_BITS // bands
+    value = int(page_hash, 16)
+    return [(i, (value >> (i * width)) & ((1 << width) - 1)) for i in range(bands)]
+
+def dedup_scope(output_directory, scope=None):
+    """
+    Return the index namespace pages of a document are deduplicated in.
+
+    'document' only matches pages within the same document, 'user' within
+    the user's output folder (the parent of the document's output directory),
+    'global' across every document.
+
+    :param output_directory: Document output directory
+    :param scope: 'document', 'user' or 'global'; defaults to config.PAGE_DEDUP_SCOPE
+    """
+    scope = scope or config.PAGE_DEDUP_SCOPE
+    if scope == 'global':
+        return 'global'
+    directory = os.path.abspath(output_directory)
+    return f"user:{os.path.dirname(directory)}" if scope == 'user' else f"document:{directory}"
+
+class PageIndex:
+    """
+    Maps perceptual hashes to the processed result of a canonical page.
+
+    Pages within max_distance bits of an indexed page are only candidates:
+    dense text pages with the same layout hash alike. A candidate's result
+    is reused only if its stored thumbnail is within max_difference of the
+    page's own. Candidates are found through a band index, so a lookup
+    reads a handful of entries whatever the index size. Entries live in
+    Redis, shared by every worker, or in this process only when no Redis is
+    configured.
+    """
+
+    def __init__(self, scope, max_distance=None, use_redis=None, max_difference=None):
+        self.scope = scope
+        self.max_distance = config.PHASH_MAX_DISTANCE if max_distance is None else max_distance
+        self.max_difference = config.PAGE_DEDUP_MAX_DIFFERENCE if max_difference is None else max_difference
+        self.bands = self.max_distance + 1
+        if HASH_BITS % self.bands:
+            raise ValueError(f"PHASH_MAX_DISTANCE + 1 must divide {HASH_BITS}")
+        self.use_redis = bool(config.REDIS_URL) if use_redis is None else use_redis
+
+    def _band_key(self, band, value):
+        return f"dedup:{self.scope}:band:{band}:{value:x}"
+
+    def _results_key(self):
+        return f"dedup:{self.scope}:results"
+
+    def lookup(self, page_hash, image):
+        """
+        Return the processed result of a near-identical page, or None.
+
+        :param page_hash: The page's perceptual hash
+        :param image: The page, as a path, RGB numpy array or PageContext, to confirm candidates against
+        """
+        try:
+            return self._lookup(page_hash, image)
+        except Exception as e:
+            # Deduplication is an optimization; the page is simply processed
+            logger.warning(f"Could not look up page hash {page_hash}: {str(e)}")
+            return None
+
+    def _lookup(self, page_hash, image):
+        bands = hash_bands(page_hash, self.bands)
+        if self.use_redis:
+            client = get_redis()
+            pipeline = client.pipeline()
+            for band, value in bands:
+                pipeline.smembers(self._band_key(band, value))
+            candidates = set().union(*pipeline.execute())
+        else:
+            with _memory_lock:
+                index = _memory_index.setdefault(self.scope, {'bands': {}, 'results': {}})
+                candidates = set().union(*(index['bands'].get((band, value), ()) for band, value in bands))
+
+        matches = sorted((candidate for candidate in candidates
+                          if hamming_distance(candidate, page_hash) <= self.max_distance),
+                         key=lambda candidate: hamming_distance(candidate, page_hash))
+        if not matches:
+            return None
+        if self.use_redis:
+            entries = [json.loads(entry) for entry in get_redis().hmget(self._results_key(), matches) if entry]
+        else:
+            with _memory_lock:
+                results = _memory_index[self.scope]['results']
+                entries = [results[match] for match in matches if match in results]
+
+        thumbnail = page_thumbnail(image)
+        for entry in entries:
+            if 'thumbnail' in entry and \
+                    thumbnail_difference(thumbnail, decode_thumbnail(entry['thumbnail'])) <= self.max_difference:
+                return entry['result']
+        return None
+
+    def add(self, page_hash, result, image):
+        """
+        Index a processed page as the canonical result for its hash.
+
+        :param image: The page, as a path, RGB numpy array or PageContext; its thumbnail is stored with the result
+        """
+        try:
+            self._add(page_hash, {'result': result, 'thumbnail': encode_thumbnail(page_thumbnail(image))})
+        except Exception as e:
+            logger.warning(f"Could not index page hash {page_hash}: {str(e)}")
+
+    def _add(self, page_hash, entry):
+        bands = hash_bands(page_hash, self.bands)
+        if self.use_redis:
+            pipeline = get_redis().pipeline()
+            pipeline.hset(self._results_key(), page_hash, json.dumps(entry))
+            pipeline.expire(self._results_key(), config.PAGE_DEDUP_TTL)
+            for band, value in bands:
+                pipeline.sadd(self._band_key(band, value), page_hash)
+                pipeline.expire(self._band_key(band, value), config.PAGE_DEDUP_TTL)
+            pipeline.execute()
+        else:
+            with _memory_lock:
+                index = _memory_index.setdefault(self.scope, {'bands': {}, 'results': {}})
+                index['results'][page_hash] = entry
+                for band in bands:
+                    index['bands'].setdefault(band, set()).add(page_hash)
+
+_memory_index = {}
+_memory_lock = threading.Lock()
@@ -1,10 +1,21 @@
 import PyPDF2
+import logging
 import os
-from PyPDF2 import PdfWriter, PdfReader
+import queue
+import re
+import tempfile
+import threading
+import unicodedata
 from PIL import Image
 import docx2pdf
-import io
-import pdfkit
+import fitz  # PyMuPDF
+import numpy as np
+import zlib
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from config.config import config
+from page_context import as_page
+
+logger = logging.getLogger(__name__)
 
 def split_document(input_path, output_directory):
     """
@@ -51,6 +62,247 @@ def split_pdf(input_path, output_directory):
     
     return output_paths
 
+def count_pages(input_path):
+    """
+    Count the pages of a PDF file.
+    
+    :param input_path: Path to the input PDF file
+    :return: Number of pages
+    """
+    with fitz.open(input_path) as document:
+        return document.page_count
+
+def page_ranges(page_count, range_size):
+    """
+    Split a page count into consecutive inclusive page ranges.
+    
+    :param page_count: Number of pages in the document
+    :param range_size: Maximum number of pages per range
+    :return: List of (first_page, last_page) tuples, 1-based
+    """
+    range_size = max(1, range_size)
+    return [(first, min(first + range_size - 1, page_count)) for first in range(1, page_count + 1, range_size)]
+
+def contiguous_ranges(page_numbers, range_size):
+    """
+    Split page numbers into inclusive ranges of consecutive pages.
+    
+    :param page_numbers: Sorted page numbers, e.g. the pages still to process
+    :param range_size: Maximum number of pages per range
+    :return: List of (first_page, last_page) tuples
+    """
+    range_size = max(1, range_size)
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and page_number == ranges[-1][1] + 1 and page_number - ranges[-1][0] < range_size:
+            ranges[-1] = (ranges[-1][0], page_number)
+        else:
+            ranges.append((page_number, page_number))
+    return ranges
+
+def rasterize_pdf(input_path, first_page=1, last_page=None, dpi=None, pages=None):
+    """
+    Rasterize a range of PDF pages in memory, one page at a time.
+    
+    No intermediate files are written; each page is decoded straight into an
+    RGB buffer when the generator is advanced.
+    
+    :param input_path: Path to the input PDF file
+    :param first_page: First page to rasterize (1-based)
+    :param last_page: Last page to rasterize (inclusive); defaults to the last page
+    :param dpi: Rasterization resolution; defaults to config.RASTER_DPI
+    :param pages: Page numbers within the range to rasterize; defaults to every page
+    :return: Generator of (page_number, RGB numpy array) tuples
+    """
+    dpi = dpi or config.RASTER_DPI
+    with fitz.open(input_path) as document:
+        last_page = min(last_page or document.page_count, document.page_count)
+        for page_number in range(first_page, last_page + 1):
+            if pages is not None and page_number not in pages:
+                continue
+            pixmap = document.load_page(page_number - 1).get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+            image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, 3)
+            yield page_number, image
+
+def prefetch(iterable, depth=1):
+    """
+    Advance an iterable on a background thread, keeping up to depth items ready.
+    
+    Used to rasterize the next pages while the current ones are in OCR.
+    
+    :param iterable: Iterable to consume, e.g. rasterize_pdf(...)
+    :param depth: Number of items to buffer ahead of the consumer
+    :return: Generator yielding the items of iterable in order
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except Exception as e:
+            put((done, e))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+# Leading markers of list items in a native text block
+LIST_MARKER = re.compile(r'^([\u2022\u25e6\u2023\u2043*-]|\(?\d{1,3}[.)]|\(?[a-z][.)])$')
+
+def native_text_quality(text):
+    """
+    Return the share of characters in extracted text that decoded to real characters.
+    
+    Fonts without a usable encoding extract as replacement, private-use or
+    control characters, which makes the text layer useless for the fast path.
+    """
+    characters = [c for c in text if not c.isspace()]
+    if not characters:
+        return 0.0
+    good = sum(1 for c in characters
+               if c != '\ufffd' and unicodedata.category(c) not in ('Co', 'Cc', 'Cn', 'Cs'))
+    return good / len(characters)
+
+def classify_pdf_page(page, dpi=None):
+    """
+    Decide whether a PDF page is born-digital, with a text layer good enough to skip OCR and layout analysis.
+    
+    The page's native words are scored on coverage (share of the page area
+    under word boxes) and quality (share of cleanly decoded characters).
+    Pages dominated by an image, or whose text is mostly invisible (the
+    OCR layer of a scan), are treated as scanned whatever their text.
+    
+    :param page: PyMuPDF page
+    :param dpi: Resolution the page is rasterized at; defaults to config.RASTER_DPI
+    :return: Dictionary with 'born_digital', 'coverage', 'quality' and, for born-digital
+             pages, 'words' and 'merged_layout' in pixel coordinates
+    """
+    dpi = dpi or config.RASTER_DPI
+    page_area = max(1.0, page.rect.width * page.rect.height)
+    words = page.get_text('words')
+    text = ''.join(word[4] for word in words)
+    
+    coverage = min(1.0, sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1, *_ in words) / page_area)
+    quality = native_text_quality(text)
+    image_area = min(1.0, sum(fitz.Rect(image['bbox']).get_area() for image in page.get_image_info()) / page_area)
+    spans = page.get_texttrace()
+    visible = sum(len(span['chars']) for span in spans if span['type'] != 3)
+    invisible = sum(len(span['chars']) for span in spans if span['type'] == 3)
+    
+    born_digital = (len(text) >= config.NATIVE_TEXT_MIN_CHARS
+                    and coverage >= config.NATIVE_TEXT_MIN_COVERAGE
+                    and quality >= config.NATIVE_TEXT_MIN_QUALITY
+                    and image_area < config.NATIVE_TEXT_MAX_IMAGE_AREA
+                    and invisible <= visible)
+    result = {'born_digital': born_digital, 'coverage': round(coverage, 4), 'quality': round(quality, 4)}
+    if born_digital:
+        # Words in the coordinates of the rasterized page: rotated like the pixmap, scaled to dpi
+        transform = page.rotation_matrix * fitz.Matrix(dpi / 72, dpi / 72)
+        pixel_words = []
+        for x0, y0, x1, y1, word, block, line, _ in words:
+            rect = fitz.Rect(x0, y0, x1, y1) * transform
+            pixel_words.append({
+                'text': word,
+                'left': int(rect.x0),
+                'top': int(rect.y0),
+                'width': int(round(rect.width)),
+                'height': int(round(rect.height)),
+                'conf': 100.0,
+                'block': block,
+                'line': line
+            })
+        result['words'] = pixel_words
+        result['merged_layout'] = native_layout(pixel_words)
+    return result
+
+def native_layout(words):
+    """
+    Build a merged layout from native words, in the shape produced by OCR and layout analysis.
+    
+    Each text block of the PDF becomes one element. Blocks set noticeably
+    larger than the page's body text are titles, and blocks whose every line
+    starts with a bullet or number are lists.
+    
+    :param words: Native words in pixel coordinates, with their 'block' and 'line' numbers
+    :return: List of layout elements with 'type', 'coordinates', 'text' and 'words'
+    """
+    if not words:
+        return []
+    body_height = float(np.median([word['height'] for word in words]))
+    
+    blocks = {}
+    for word in words:
+        blocks.setdefault(word['block'], []).append(word)
+    
+    layout = []
+    for block_words in blocks.values():
+        lines = {}
+        for word in block_words:
+            lines.setdefault(word['line'], []).append(word)
+        line_texts = [' '.join(word['text'] for word in line_words) for line_words in lines.values()]
+        
+        block_height = float(np.median([word['height'] for word in block_words]))
+        if block_height >= 1.3 * body_height and len(lines) <= 2:
+            block_type = 'Title'
+        elif len(lines) > 1 and all(LIST_MARKER.match(line_words[0]['text']) for line_words in lines.values()):
+            block_type = 'List'
+        else:
+            block_type = 'Text'
+        
+        layout.append({
+            'type': block_type,
+            'coordinates': [
+                min(word['left'] for word in block_words),
+                min(word['top'] for word in block_words),
+                max(word['left'] + word['width'] for word in block_words),
+                max(word['top'] + word['height'] for word in block_words)
+            ],
+            'text': '\n'.join(line_texts) if block_type == 'List' else ' '.join(line_texts),
+            'words': [{key: word[key] for key in ('text', 'left', 'top', 'width', 'height', 'conf')}
+                      for word in block_words]
+        })
+    return layout
+
+def classify_pdf_pages(input_path, page_numbers, dpi=None):
+    """
+    Classify PDF pages as born-digital or scanned.
+    
+    :param input_path: Path to the input PDF file
+    :param page_numbers: Page numbers to classify (1-based)
+    :param dpi: Resolution the pages are rasterized at; defaults to config.RASTER_DPI
+    :return: Dictionary mapping page numbers to classify_pdf_page results
+    """
+    with fitz.open(input_path) as document:
+        return {page_number: classify_pdf_page(document.load_page(page_number - 1), dpi)
+                for page_number in page_numbers}
+
 def split_docx(input_path, output_directory):
     # Convert DOCX to PDF
     pdf_path = os.path.join(output_directory, 'temp.pdf')
@@ -84,32 +336,202 @@ def reconstruct_pdf(processed_pages, output_path):
     """
     Reconstruct the final PDF from processed pages.
     
+    Pages are streamed to disk one at a time, each as its refined image with
+    the OCR words laid over it as an invisible, searchable text layer. Blank
+    pages are written as empty pages of the original size.
+    
     :param processed_pages: List of dictionaries containing processed page data
     :param output_path: Path to save the reconstructed PDF
     """
-    pdf_writer = PdfWriter()
+    with StreamingPdfWriter(output_path) as pdf_writer:
+        for page_data in processed_pages:
+            if page_data.get('blank'):
+                pdf_writer.add_blank_page(*page_data['page_size'])
+                continue
+            pdf_writer.add_page(page_data['refined_image_path'],
+                                words=page_data.get('words'),
+                                source_size=page_data.get('page_size'))
+
+    logger.info(f"Reconstructed PDF saved to: {output_path}")
+
+class StreamingPdfWriter:
+    """
+    Incremental PDF writer for image-based pages.
+    
+    Each page embeds its image directly as an image XObject (JPEG files are
+    copied without re-encoding) and can carry an invisible text layer. Page
+    objects are written and flushed as soon as the page is added, so memory
+    stays bounded by one page regardless of document length.
+    
+    The PDF is written to a temporary file next to output_path and only
+    moved there, atomically, once it is complete; a writer left by an
+    exception removes its temporary file and leaves output_path untouched.
+    """
+    CATALOG = 1
+    PAGES = 2
+    FONT = 3
+
+    def __init__(self, output_path, dpi=None):
+        self.dpi = dpi or config.RASTER_DPI
+        self.output_path = output_path
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.offsets = {}
+        self.page_objects = []
+        self.next_object = 4
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                      b'/Encoding /WinAnsiEncoding >>')
+
+    def __enter__(self):
+        return self
 
-    for page_data in processed_pages:
-        refined_image_path = page_data['refined_image_path']
-        pdf_page = convert_image_to_pdf_page(refined_image_path)
-        pdf_writer.add_page(pdf_page)
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
-    with open(output_path, 'wb') as output_file:
-        pdf_writer.write(output_file)
+    def _allocate(self):
+        number = self.next_object
+        self.next_object += 1
+        return number
 
-    print(f"Reconstructed PDF saved to: {output_path}")
+    def _write_object(self, number, dictionary, stream=None):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f'{number} 0 obj\n'.encode())
+        self.file.write(dictionary)
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
 
-def convert_image_to_pdf_page(image_path):
+    def _write_image(self, image):
+        """
+        Write a page image as an XObject.
+        
+        :return: Tuple of (object number, width in pixels, height in pixels)
+        """
+        if isinstance(image, str) and image.lower().endswith(('.jpg', '.jpeg')):
+            with Image.open(image) as jpeg:
+                width, height = jpeg.size
+                mode = jpeg.mode
+            if mode in ('RGB', 'L'):
+                with open(image, 'rb') as f:
+                    data = f.read()
+                return self._write_image_object(data, width, height, mode, b'/DCTDecode'), width, height
+
+        pixels = as_page(image).rgb
+        height, width = pixels.shape[:2]
+        data = zlib.compress(np.ascontiguousarray(pixels).tobytes(), 6)
+        return self._write_image_object(data, width, height, 'RGB', b'/FlateDecode'), width, height
+
+    def _write_image_object(self, data, width, height, mode, image_filter):
+        number = self._allocate()
+        colorspace = b'/DeviceGray' if mode == 'L' else b'/DeviceRGB'
+        self._write_object(number, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+                                   b'/BitsPerComponent 8 /Filter %s /Length %d >>'
+                           % (width, height, colorspace, image_filter, len(data)), data)
+        return number
+
+    def add_page(self, image, words=None, source_size=None):
+        """
+        Append a page to the PDF.
+        
+        :param image: Path to the page image, RGB numpy array or PageContext
+        :param words: OCR words (text, left, top, width, height) for the invisible text layer
+        :param source_size: (width, height) of the image the word boxes refer to; defaults to the page image size
+        """
+        image_object, width_px, height_px = self._write_image(image)
+        width_pt = width_px * 72 / self.dpi
+        height_pt = height_px * 72 / self.dpi
+
+        content = [f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q']
+        if words:
+            source_width, source_height = source_size or (width_px, height_px)
+            content.append(text_layer(words, width_pt / source_width, height_pt / source_height, height_pt))
+        stream = zlib.compress('\n'.join(content).encode('latin-1'))
+
+        content_object = self._allocate()
+        self._write_object(content_object, b'<< /Filter /FlateDecode /Length %d >>' % len(stream), stream)
+
+        page_object = self._allocate()
+        self._write_object(page_object, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_object} 0 R >> /Font << /F1 {self.FONT} 0 R >> >> '
+            f'/Contents {content_object} 0 R >>'
+        ).encode())
+        self.page_objects.append(page_object)
+        self.file.flush()
+
+    def add_blank_page(self, width_px, height_px):
+        """
+        Append an empty page the size of a width_px x height_px image.
+        """
+        width_pt = width_px * 72 / self.dpi
+        height_pt = height_px * 72 / self.dpi
+        page_object = self._allocate()
+        self._write_object(page_object, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+            f'/Resources << >> >>'
+        ).encode())
+        self.page_objects.append(page_object)
+        self.file.flush()
+
+    def close(self):
+        """
+        Write the page tree, cross-reference table and trailer, and move the finished PDF into place.
+        """
+        kids = ' '.join(f'{number} 0 R' for number in self.page_objects)
+        self._write_object(self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_objects)} >>'.encode())
+        self._write_object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode())
+
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {self.next_object}\n'.encode())
+        self.file.write(b'0000000000 65535 f \n')
+        for number in range(1, self.next_object):
+            self.file.write(f'{self.offsets[number]:010d} 00000 n \n'.encode())
+        self.file.write(f'trailer\n<< /Size {self.next_object} /Root {self.CATALOG} 0 R >>\n'
+                        f'startxref\n{xref_offset}\n%%EOF\n'.encode())
+        self.file.close()
+        os.replace(self.temp_path, self.output_path)  # A new file, so links to the old output keep their contents
+
+    def abort(self):
+        """
+        Close and remove the unfinished PDF.
+        """
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def text_layer(words, scale_x, scale_y, page_height):
     """
-    Convert an image to a PDF page.
+    Build a content stream fragment drawing words as invisible text.
+    
+    Each word is placed on its OCR box and stretched horizontally to the box
+    width, so searches and selections line up with the image.
     
-    :param image_path: Path to the image file
-    :return: A PDF page object
+    :param words: OCR words (text, left, top, width, height) in pixel coordinates
+    :param scale_x: Points per pixel horizontally
+    :param scale_y: Points per pixel vertically
+    :param page_height: Page height in points
+    :return: Content stream operators as a string
     """
-    image = Image.open(image_path)
-    pdf_bytes = io.BytesIO()
-    image.save(pdf_bytes, format='PDF')
-    pdf_bytes.seek(0)
-    return PdfReader(pdf_bytes).pages[0]
+    operators = ['BT', '3 Tr']  # Render mode 3: neither fill nor stroke
+    for word in words:
+        text = word['text'].encode('cp1252', errors='replace').decode('latin-1')
+        if not text.strip() or word['height'] <= 0:
+            continue
+        font_size = word['height'] * scale_y
+        x = word['left'] * scale_x
+        y = page_height - (word['top'] + word['height']) * scale_y
+        text_width = stringWidth(text, 'Helvetica', font_size)
+        horizontal_scale = 100 * word['width'] * scale_x / text_width if text_width else 100
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        operators.append(f'/F1 {font_size:.2f} Tf {horizontal_scale:.2f} Tz '
+                         f'1 0 0 1 {x:.2f} {y:.2f} Tm ({escaped}) Tj')
+    operators.append('ET')
+    return '\n'.join(operators)
 
 # Additional PDF utility functions can be added here
\ No newline at end of file
@@ -0,0 +1,161 @@
+import json
+import logging
+import time
+from celery import current_task
+from config.config import config
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+def progress_channel(task_id):
+    """
+    Return the Redis pub/sub channel carrying a workflow's progress events.
+    """
+    return f"progress:{task_id}"
+
+def progress_key(task_id):
+    """
+    Return the Redis hash holding a workflow's progress counters.
+    """
+    return f"progress:{task_id}:state"
+
+def current_workflow_id():
+    """
+    Return the id of the workflow the current task belongs to.
+
+    This is the root task id, the one returned to the client when the work was
+    submitted; it is None outside a Celery task.
+    """
+    request = getattr(current_task, 'request', None)
+    if request is None or request.id is None:
+        return None
+    return request.root_id or request.id
+
+def start_progress(task_id, total_pages):
+    """
+    Reset a workflow's counters and announce how many pages it will process.
+
+    :param task_id: Workflow (root task) id
+    :param total_pages: Number of pages across every document in the workflow
+    """
+    _publish(task_id, 'started', {'total': total_pages, 'done': 0},
+             state={'total': total_pages, 'done': 0, 'started_at': time.time()})
+
+def page_done(page_number, timings=None):
+    """
+    Count a finished page and publish a progress event with an ETA.
+
+    :param page_number: Page number within its document
+    :param timings: Seconds spent per stage for this page
+    """
+    task_id = current_workflow_id()
+    if task_id is None:
+        return
+    try:
+        client = get_redis()
+        key = progress_key(task_id)
+        pipeline = client.pipeline()
+        pipeline.hincrby(key, 'done', 1)
+        pipeline.hmget(key, 'total', 'started_at')
+        done, (total, started_at) = pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Could not record progress for {task_id}: {str(e)}")
+        return
+
+    event = {'page_number': page_number, 'done': done, 'timings': timings or {}}
+    if total is not None and started_at is not None:
+        total = int(total)
+        elapsed = time.time() - float(started_at)
+        event['total'] = total
+        event['eta_seconds'] = round(elapsed / done * max(0, total - done), 1)
+    _publish(task_id, 'page', event)
+
+def finish_progress(result=None, failed=False, task_id=None):
+    """
+    Publish the final event of a workflow.
+
+    :param result: JSON-serializable result to pass to the client
+    :param failed: Whether the workflow failed
+    :param task_id: Workflow id; defaults to the current task's workflow
+    """
+    task_id = task_id or current_workflow_id()
+    if task_id is not None:
+        _publish(task_id, 'failed' if failed else 'complete', {'result': result})
+
+def progress_snapshot(task_id):
+    """
+    Return a workflow's current counters, for clients that connect late or poll.
+
+    :return: Dictionary with 'total', 'done' and 'eta_seconds', or None if unknown
+    """
+    state = get_redis().hgetall(progress_key(task_id))
+    if not state:
+        return None
+    total, done = int(state.get('total', 0)), int(state.get('done', 0))
+    snapshot = {'total': total, 'done': done}
+    if done and 'started_at' in state:
+        elapsed = time.time() - float(state['started_at'])
+        snapshot['eta_seconds'] = round(elapsed / done * max(0, total - done), 1)
+    if 'final' in state:
+        snapshot['final'] = json.loads(state['final'])
+    return snapshot
+
+def _publish(task_id, event_type, data, state=None):
+    message = json.dumps(dict(data, type=event_type))
+    try:
+        client = get_redis()
+        pipeline = client.pipeline()
+        key = progress_key(task_id)
+        if state is not None:
+            pipeline.delete(key)
+            pipeline.hset(key, mapping=state)
+        if event_type in ('complete', 'failed'):
+            pipeline.hset(key, 'final', message)
+        pipeline.expire(key, config.PROGRESS_TTL)
+        pipeline.publish(progress_channel(task_id), message)
+        pipeline.execute()
+    except Exception as e:
+        # Progress is informational; never fail a task over it
+        logger.warning(f"Could not publish progress for {task_id}: {str(e)}")
+
+def stream_progress(task_id, final_event=None, heartbeat=None):
+    """
+    Yield a workflow's progress as Server-Sent Events until it completes or fails.
+
+    The current counters are sent first, so a client that connects late
+    starts from the right place. Between events a comment line is sent every
+    heartbeat seconds to keep proxies from closing the connection, and
+    final_event is consulted in case the workflow ended without publishing.
+
+    :param task_id: Workflow (root task) id
+    :param final_event: Callable returning the final event dictionary once the workflow has ended, else None
+    :param heartbeat: Seconds between keep-alive comments; defaults to config.PROGRESS_HEARTBEAT
+    :return: Generator of SSE-formatted strings
+    """
+    heartbeat = heartbeat or config.PROGRESS_HEARTBEAT
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress_channel(task_id))  # Subscribe before reading the snapshot so no event is missed
+    try:
+        snapshot = progress_snapshot(task_id)
+        if snapshot is not None:
+            if 'final' in snapshot:
+                final = snapshot['final']
+                yield f"event: {final['type']}\ndata: {json.dumps(final)}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(dict(snapshot, type='progress'))}\n\n"
+
+        while True:
+            message = pubsub.get_message(timeout=heartbeat)
+            if message is None:
+                final = final_event() if final_event else None
+                if final is not None:
+                    yield f"event: {final['type']}\ndata: {json.dumps(final)}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            event = json.loads(message['data'])
+            yield f"event: {event['type']}\ndata: {message['data']}\n\n"
+            if event['type'] in ('complete', 'failed'):
+                return
+    finally:
+        pubsub.close()
@@ -0,0 +1,19 @@
+import threading
+import redis
+from config.config import config
+
+_client = None
+_lock = threading.Lock()
+
+def get_redis():
+    """
+    Return the Redis client for this process, connected to config.REDIS_URL.
+
+    The client keeps a connection pool, so it is shared by every thread.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(config.REDIS_URL, decode_responses=True)
+    return _client
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from config.config import config
+
+class SnippetRenderer:
+    """
+    Off-screen mathtext renderer that reuses one Agg canvas.
+
+    The figure, canvas and text artist are created once and reconfigured for
+    each snippet, so a render only pays for mathtext layout and rasterization.
+    Matplotlib memoizes parsed mathtext internally, and finished bitmaps are
+    kept in an LRU cache bounded by their total size in bytes. Trimmed
+    renders are cached as trimmed copies, so a full-page canvas is never
+    kept alive by the cache.
+
+    A renderer is not thread-safe; use get_snippet_renderer for one per thread.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = config.SNIPPET_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.text = self.figure.text(0.5, 0.5, '', ha='center', va='center')
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key):
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return image
+
+    def _remember(self, key, image):
+        image.flags.writeable = False  # Cached arrays are shared between callers
+        if image.nbytes > self.max_bytes:
+            return image
+        self._cache[key] = image
+        self._cache_bytes += image.nbytes
+        while self._cache_bytes > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+        return image
+
+    def _draw(self, snippet, width, height, dpi, fontsize, math=True):
+        self.figure.set_dpi(dpi)
+        self.figure.set_size_inches(width / dpi, height / dpi)
+        self.text.set_text(f'${snippet}$' if math else snippet)
+        self.text.set_fontsize(fontsize)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[:height, :width, :3]
+
+    def render(self, snippet, size, dpi=100, fontsize=12, math=True):
+        """
+        Render a LaTeX snippet as mathtext.
+
+        :param snippet: LaTeX content, rendered in math mode
+        :param size: Size of the output image (width, height) in pixels
+        :param dpi: Resolution the font size is interpreted at
+        :param fontsize: Font size in points
+        :param math: Whether the snippet is math; if not, it is text with inline $math$
+        :return: Read-only RGB numpy array of shape (height, width, 3)
+        """
+        width, height = int(size[0]), int(size[1])
+        key = (snippet, width, height, dpi, fontsize, math)
+        image = self._cached(key)
+        if image is not None:
+            return image
+        return self._remember(key, self._draw(snippet, width, height, dpi, fontsize, math).copy())
+
+    def render_trimmed(self, snippet, size, dpi=100, fontsize=12, padding=0):
+        """
+        Render a snippet and crop the result to its ink plus padding.
+
+        :param padding: Margin kept around the ink, in pixels
+        :return: Read-only RGB numpy array
+        """
+        width, height = int(size[0]), int(size[1])
+        key = ('trimmed', snippet, width, height, dpi, fontsize, padding)
+        image = self._cached(key)
+        if image is not None:
+            return image
+
+        image = self._draw(snippet, width, height, dpi, fontsize)
+        rows, columns = np.nonzero((image < 255).any(axis=2))
+        if len(rows):
+            top, bottom = max(0, rows.min() - padding), min(image.shape[0], rows.max() + 1 + padding)
+            left, right = max(0, columns.min() - padding), min(image.shape[1], columns.max() + 1 + padding)
+            image = image[top:bottom, left:right]
+        return self._remember(key, image.copy())  # A copy, so the canvas buffer is not kept alive
+
+    def clear(self):
+        """
+        Drop every cached bitmap.
+        """
+        self._cache.clear()
+        self._cache_bytes = 0
+
+_local = threading.local()
+
+def get_snippet_renderer():
+    """
+    Return the snippet renderer for the current thread.
+    """
+    renderer = getattr(_local, 'renderer', None)
+    if renderer is None:
+        renderer = _local.renderer = SnippetRenderer()
+    return renderer
+
+def render_snippet(snippet, size, dpi=100, fontsize=12, math=True):
+    """
+    Render a LaTeX snippet to an RGB array of exactly the requested size.
+
+    :param snippet: LaTeX content, rendered in math mode
+    :param size: Size of the output image (width, height) in pixels
+    :param math: Whether the snippet is math; if not, it is text with inline $math$
+    :return: Read-only RGB numpy array of shape (height, width, 3)
+    """
+    return get_snippet_renderer().render(snippet, size, dpi, fontsize, math)
+
+def escape_text(text):
+    """
+    Escape plain text so a text-mode snippet draws it literally.
+    """
+    return text.replace('$', '\\$')
+
+def render_page(latex_content, dpi=300, padding=0.1):
+    """
+    Render LaTeX content centered on a letter-size page, cropped to its ink.
+
+    :param latex_content: LaTeX content, rendered in math mode
+    :param dpi: Output resolution
+    :param padding: Margin kept around the ink, in inches
+    :return: Read-only RGB numpy array
+    """
+    size = (int(8.5 * dpi), int(11 * dpi))  # Standard letter size
+    return get_snippet_renderer().render_trimmed(latex_content, size, dpi, padding=int(padding * dpi))
@@ -31,50 +31,136 @@ function updateStartButton() {
     startButton.disabled = files.length === 0;
 }
 
-function uploadFiles() {
-    const formData = new FormData();
-    files.forEach(file => formData.append('files[]', file));
+const CHUNK_RETRIES = 5;
 
+function uploadFiles() {
     const progressBar = document.getElementById('progress-bar');
     const progressBarContainer = document.getElementById('progress-bar-container');
     progressBarContainer.style.display = 'block';
 
-    $.ajax({
+    const totalBytes = files.reduce((total, file) => total + file.size, 0);
+    let uploadedBytes = 0;
+    const uploadIds = [];
+
+    // Upload the files one after another in resumable chunks, then start processing
+    let uploads = $.Deferred().resolve().promise();
+    files.forEach(file => {
+        uploads = uploads.then(() => uploadFile(file, function(offset) {
+            const percent = totalBytes ? ((uploadedBytes + offset) / totalBytes) * 100 : 100;
+            progressBar.style.width = percent + '%';
+        })).then(upload => {
+            uploadedBytes += file.size;
+            uploadIds.push(upload.upload_id);
+        });
+    });
+
+    uploads.then(() => $.ajax({
         url: '/process',
         type: 'POST',
-        data: formData,
+        data: JSON.stringify({upload_ids: uploadIds}),
+        contentType: 'application/json'
+    })).then(function(data) {
+        progressBar.style.width = '0%';
+        watchProgress(data.task_id);
+    }, function() {
+        alert('An error occurred while processing the files.');
+        progressBarContainer.style.display = 'none';
+    });
+}
+
+function uploadFile(file, onProgress) {
+    return $.ajax({
+        url: '/api/uploads',
+        type: 'POST',
+        data: JSON.stringify({filename: file.name, size: file.size}),
+        contentType: 'application/json'
+    }).then(upload => sendChunks(file, upload, onProgress, CHUNK_RETRIES))
+      .then(upload => $.post(`/api/uploads/${upload.upload_id}/commit`));
+}
+
+function sendChunks(file, upload, onProgress, retries) {
+    if (upload.offset >= upload.size) {
+        return $.Deferred().resolve(upload).promise();
+    }
+    const end = Math.min(upload.offset + upload.chunk_size, upload.size);
+    return $.ajax({
+        url: `/api/uploads/${upload.upload_id}?offset=${upload.offset}`,
+        type: 'PUT',
+        data: file.slice(upload.offset, end),
         processData: false,
-        contentType: false,
-        xhr: function() {
-            const xhr = new window.XMLHttpRequest();
-            xhr.upload.addEventListener('progress', function(e) {
-                if (e.lengthComputable) {
-                    const percent = (e.loaded / e.total) * 100;
-                    progressBar.style.width = percent + '%';
-                }
-            }, false);
-            return xhr;
-        },
-        success: function(data) {
-            checkStatus(data.task_id);
-        },
-        error: function() {
-            alert('An error occurred while processing the files.');
-            progressBarContainer.style.display = 'none';
+        contentType: 'application/octet-stream'
+    }).then(function(state) {
+        onProgress(state.offset);
+        return sendChunks(file, state, onProgress, CHUNK_RETRIES);
+    }, function() {
+        if (retries === 0) {
+            return $.Deferred().reject().promise();
         }
+        // Ask the server where to resume; the chunk may have landed before the connection dropped
+        const retry = $.Deferred();
+        setTimeout(function() {
+            $.get(`/api/uploads/${upload.upload_id}`)
+                .then(state => sendChunks(file, state, onProgress, retries - 1))
+                .then(retry.resolve, retry.reject);
+        }, 1000);
+        return retry.promise();
+    });
+}
+
+function showProgress(progress) {
+    if (!progress || !progress.total) {
+        return;
+    }
+    const progressBar = document.getElementById('progress-bar');
+    progressBar.style.width = (progress.done / progress.total) * 100 + '%';
+    let label = `${progress.done} / ${progress.total} pages`;
+    if (progress.eta_seconds !== undefined && progress.done < progress.total) {
+        label += ` (about ${Math.ceil(progress.eta_seconds)}s left)`;
+    }
+    progressBar.title = label;
+}
+
+function processingComplete(taskId) {
+    document.getElementById('progress-bar').style.width = '100%';
+    alert('Processing complete! You can now download the result.');
+    window.location.href = '/download/' + taskId;
+}
+
+function watchProgress(taskId) {
+    if (!window.EventSource) {
+        checkStatus(taskId);
+        return;
+    }
+
+    // Progress is pushed by the workers; fall back to polling if the stream drops
+    const source = new EventSource('/stream/' + taskId);
+    ['started', 'progress', 'page'].forEach(eventName => {
+        source.addEventListener(eventName, function(e) {
+            showProgress(JSON.parse(e.data));
+        });
+    });
+    source.addEventListener('complete', function() {
+        source.close();
+        processingComplete(taskId);
+    });
+    source.addEventListener('failed', function() {
+        source.close();
+        alert('An error occurred during processing.');
     });
+    source.onerror = function() {
+        source.close();
+        checkStatus(taskId);
+    };
 }
 
 function checkStatus(taskId) {
     $.get('/status/' + taskId, function(data) {
-        const progressBar = document.getElementById('progress-bar');
         if (data.state === 'SUCCESS') {
-            progressBar.style.width = '100%';
-            alert('Processing complete! You can now download the result.');
-            window.location.href = '/download/' + taskId;
+            processingComplete(taskId);
         } else if (data.state === 'FAILURE') {
             alert('An error occurred during processing.');
         } else {
+            showProgress(data.progress);
             setTimeout(function() {
                 checkStatus(taskId);
             }, 1000);
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = 'docurefine'
+
+def document_parts(latex_code):
+    """
+    Split a LaTeX source into its preamble and document body.
+
+    :param latex_code: Full document, or a fragment without \\documentclass
+    :return: Tuple of (preamble, body); preamble is None for fragments
+    """
+    if '\\documentclass' not in latex_code:
+        return None, latex_code
+    preamble, marker, rest = latex_code.partition('\\begin{document}')
+    if not marker:
+        return latex_code, ''
+    body, _, _ = rest.rpartition('\\end{document}')
+    return preamble, body
+
+class TexRenderPool:
+    """
+    Runs pdflatex jobs concurrently and safely within one worker process.
+
+    Every job compiles in its own temporary directory, and at most
+    max_processes compilers run at once. The default preamble is compiled
+    once into a format file, so jobs that use it skip loading packages.
+    Output PDFs are cached on disk by a hash of the source, and concurrent
+    requests for the same source share a single compile.
+    """
+
+    def __init__(self, max_processes=None, cache_dir=None, preamble=None, timeout=None):
+        self.max_processes = max_processes or config.TEX_MAX_PROCESSES or os.cpu_count() or 1
+        self.cache_dir = config.TEX_CACHE_DIR if cache_dir is None else cache_dir
+        self.preamble = preamble or config.TEX_PREAMBLE
+        self.timeout = timeout or config.TEX_TIMEOUT
+        self._slots = threading.BoundedSemaphore(self.max_processes)
+        self._format_dir = None
+        self._format_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def source_key(self, latex_code):
+        """
+        Return the cache key for a source: a hash of its full preamble and body.
+        """
+        preamble, body = document_parts(latex_code)
+        digest = hashlib.sha256()
+        digest.update((self.preamble if preamble is None else preamble).strip().encode())
+        digest.update(b'\0')
+        digest.update(body.strip().encode())
+        return digest.hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _run_pdflatex(self, arguments, cwd, env=None):
+        with self._slots:
+            subprocess.run(['pdflatex', '-interaction=nonstopmode', '-halt-on-error'] + arguments,
+                           cwd=cwd, env=env, check=True, timeout=self.timeout,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def format_dir(self):
+        """
+        Return the directory holding the precompiled preamble, building it on first use.
+
+        :return: Directory path, or None if the format could not be built
+        """
+        with self._format_lock:
+            if self._format_dir is None:
+                directory = tempfile.mkdtemp(prefix='docurefine-fmt-')
+                with open(os.path.join(directory, f"{FORMAT_NAME}.tex"), 'w') as f:
+                    f.write(self.preamble.rstrip() + '\n\\dump\n')
+                try:
+                    self._run_pdflatex(['-ini', f'-jobname={FORMAT_NAME}', '&pdflatex', f"{FORMAT_NAME}.tex"],
+                                       cwd=directory)
+                    self._format_dir = directory
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                    logger.warning(f"Could not precompile the LaTeX preamble, compiling without it: {e}")
+                    shutil.rmtree(directory, ignore_errors=True)
+                    self._format_dir = ''
+            return self._format_dir or None
+
+    def _compile(self, latex_code, cache_path):
+        preamble, body = document_parts(latex_code)
+        uses_format = preamble is None or preamble.strip() == self.preamble.strip()
+        format_dir = self.format_dir() if uses_format else None
+
+        job_dir = tempfile.mkdtemp(prefix='docurefine-tex-')
+        try:
+            env = None
+            if format_dir:
+                source = f"\\begin{{document}}\n{body}\n\\end{{document}}\n"
+                arguments = [f'-fmt={FORMAT_NAME}', 'job.tex']
+                env = dict(os.environ, TEXFORMATS=f"{format_dir}{os.pathsep}")
+            elif preamble is None:
+                source = f"{self.preamble}\n\\begin{{document}}\n{body}\n\\end{{document}}\n"
+                arguments = ['job.tex']
+            else:
+                source = latex_code
+                arguments = ['job.tex']
+
+            with open(os.path.join(job_dir, 'job.tex'), 'w') as f:
+                f.write(source)
+            self._run_pdflatex(arguments, cwd=job_dir, env=env)
+
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.move(os.path.join(job_dir, 'job.pdf'), temp_path)
+            os.replace(temp_path, cache_path)  # Atomic, so readers never see a partial PDF
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def compile(self, latex_code):
+        """
+        Compile a LaTeX source, reusing the cached PDF if it was compiled before.
+
+        Sources without \\documentclass are wrapped in the default preamble.
+
+        :param latex_code: LaTeX source
+        :return: Path to the PDF in the cache
+        """
+        key = self.source_key(latex_code)
+        cache_path = self._cache_path(key)
+        if os.path.exists(cache_path):
+            return cache_path
+
+        with self._inflight_lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                if not os.path.exists(cache_path):
+                    self._compile(latex_code, cache_path)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+        return cache_path
+
+    def render(self, latex_code, output_path):
+        """
+        Compile a LaTeX source and copy the PDF to output_path.
+
+        :param latex_code: LaTeX source
+        :param output_path: Path to save the PDF
+        :return: output_path
+        """
+        shutil.copyfile(self.compile(latex_code), output_path)
+        return output_path
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_tex_pool():
+    """
+    Return the TeX rendering pool for this process.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = TexRenderPool()
+    return _pool
@@ -0,0 +1,240 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from config.config import config
+
+STREAM_BLOCK_SIZE = 64 * 1024  # Bytes read from the request stream at a time
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class UploadError(Exception):
+    """
+    A resumable upload request that cannot be honoured.
+
+    :param status: HTTP status code to answer with
+    :param offset: Current upload offset, for errors the client can resume from
+    """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+def chain_hash(previous, chunk):
+    """
+    Extend the rolling content hash with the next chunk.
+
+    The hash is sha256(previous digest || chunk) per chunk. Because chunks have
+    a fixed size, it identifies the content and can be carried between
+    requests as a hex string, unlike a hashlib object.
+
+    :param previous: Hex digest so far ('' before the first chunk)
+    :param chunk: Bytes of the next chunk
+    :return: Hex digest including the chunk
+    """
+    return hashlib.sha256(bytes.fromhex(previous) + chunk).hexdigest()
+
+def file_chain_hash(path, chunk_size=None):
+    """
+    Compute the rolling content hash of a complete file, as an upload of it would.
+    """
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    digest = ''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest = chain_hash(digest, chunk)
+    return digest
+
+def file_sha256(path):
+    """
+    Compute the sha256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def copy_output(source_path, output_path, sha256=None):
+    """
+    Copy an existing output to output_path, replacing any file there.
+
+    Outputs are copied rather than hard linked: a link would share the
+    source's file, and with it anything later written to the source's path.
+    The copy is verified and moved into place atomically.
+
+    :param source_path: Path of the existing output
+    :param output_path: Path to place it at
+    :param sha256: Expected sha256 of the output; None to copy whatever is there
+    :return: output_path
+    :raises ValueError: If the source no longer has the expected contents
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if os.path.exists(output_path) and os.path.samefile(source_path, output_path):
+        if sha256 is not None and file_sha256(output_path) != sha256:
+            raise ValueError(f"{output_path} has changed since it was produced")
+        return output_path
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix='.tmp')
+    try:
+        with open(source_path, 'rb') as source, os.fdopen(fd, 'wb') as output:
+            for block in iter(lambda: source.read(STREAM_BLOCK_SIZE), b''):
+                digest.update(block)
+                output.write(block)
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise ValueError(f"{source_path} has changed since it was produced")
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads for one user's upload folder.
+
+    Each upload is a sparse .part file plus a JSON sidecar recording the
+    declared size, the confirmed offset and the rolling hash, both under
+    <folder>/.uploads. Chunks are streamed from the request to the .part
+    file in small blocks, so a web worker never holds a whole chunk, let
+    alone the file, in memory. Committing moves the file into the folder.
+    """
+
+    def __init__(self, folder, chunk_size=None, max_size=None):
+        self.folder = folder
+        self.directory = os.path.join(folder, '.uploads')
+        self.chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+        self.max_size = max_size or config.MAX_UPLOAD_SIZE
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, upload_id, suffix):
+        if not _UPLOAD_ID.match(upload_id):
+            raise UploadError("Unknown upload", status=404)
+        return os.path.join(self.directory, f"{upload_id}{suffix}")
+
+    def _write_state(self, state):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self._path(state['upload_id'], '.json'))
+
+    @contextmanager
+    def _locked(self, upload_id):
+        # Serializes writers of one upload across threads and worker processes
+        with open(self._path(upload_id, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def create(self, filename, size):
+        """
+        Start an upload.
+
+        :param filename: Sanitized name the file will be committed under
+        :param size: Total size in bytes, as declared by the client
+        :return: Upload state dictionary
+        """
+        if size < 0 or size > self.max_size:
+            raise UploadError(f"Upload size must be between 0 and {self.max_size} bytes", status=413)
+
+        state = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'offset': 0,
+            'hash': '',
+            'committed': False,
+            'created_at': time.time(),
+        }
+        with open(self._path(state['upload_id'], '.part'), 'wb') as f:
+            f.truncate(size)
+        self._write_state(state)
+        return state
+
+    def get(self, upload_id):
+        """
+        Return an upload's state, including the offset to resume from.
+        """
+        try:
+            with open(self._path(upload_id, '.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Unknown upload", status=404)
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """
+        Append the next chunk, streaming it from a file-like object.
+
+        :param upload_id: Upload id
+        :param offset: Offset the chunk starts at; must equal the confirmed offset
+        :param stream: File-like object to read the chunk from, e.g. the request stream
+        :param length: Chunk length in bytes; must be chunk_size, or the remainder for the last chunk
+        :return: Updated upload state
+        """
+        with self._locked(upload_id):
+            state = self.get(upload_id)
+            if state['committed']:
+                raise UploadError("Upload already committed", status=409, offset=state['offset'])
+            if offset != state['offset']:
+                raise UploadError("Chunk does not start at the upload offset", status=409, offset=state['offset'])
+            expected = min(state['chunk_size'], state['size'] - offset)
+            if length != expected:
+                raise UploadError(f"Chunk must be {expected} bytes", offset=state['offset'])
+
+            chunk_digest = hashlib.sha256(bytes.fromhex(state['hash']))
+            received = 0
+            with open(self._path(upload_id, '.part'), 'r+b') as f:
+                f.seek(offset)
+                while received < length:
+                    block = stream.read(min(STREAM_BLOCK_SIZE, length - received))
+                    if not block:
+                        break
+                    f.write(block)
+                    chunk_digest.update(block)
+                    received += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+            if received != length:
+                # Connection dropped mid-chunk; the offset is unchanged so the client resends it
+                raise UploadError("Incomplete chunk", offset=state['offset'])
+
+            state['offset'] = offset + length
+            state['hash'] = chunk_digest.hexdigest()
+            self._write_state(state)
+            return state
+
+    def commit(self, upload_id):
+        """
+        Finish an upload and move it into the user's folder.
+
+        :return: Upload state with 'path' and 'content_hash'
+        """
+        with self._locked(upload_id):
+            state = self.get(upload_id)
+            if state['committed']:
+                return state
+            if state['offset'] != state['size']:
+                raise UploadError("Upload is incomplete", status=409, offset=state['offset'])
+
+            path = os.path.join(self.folder, state['filename'])
+            os.replace(self._path(upload_id, '.part'), path)
+            state.update(committed=True, path=path, content_hash=state['hash'])
+            self._write_state(state)
+            return state
+
+    def committed_path(self, upload_id):
+        """
+        Return the path of a committed upload.
+        """
+        state = self.get(upload_id)
+        if not state['committed']:
+            raise UploadError("Upload is not committed", status=409, offset=state['offset'])
+        return state['path']
@@ -1,3 +1,5 @@
+import os
+from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
@@ -14,4 +16,27 @@ class User(UserMixin, db.Model):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
\ No newline at end of file
+        return check_password_hash(self.password_hash, password)
+
+class Upload(db.Model):
+    """
+    A submitted document, fingerprinted by content so identical resubmissions reuse the work.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(512))
+    content_hash = db.Column(db.String(64), index=True)
+    pipeline_version = db.Column(db.String(255))
+    job_key = db.Column(db.String(64), index=True)  # Identifies the whole submission the upload was part of
+    task_id = db.Column(db.String(155), index=True)
+    status = db.Column(db.String(16), default='queued')  # queued, processing, complete or failed
+    output_dir = db.Column(db.String(512))
+    output_sha256 = db.Column(db.String(64))  # Checksum of the finished output, to tell if it was replaced since
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('uploads', lazy='dynamic'))
+
+    @property
+    def output_pdf_path(self):
+        return os.path.join(self.output_dir, 'reconstructed.pdf')
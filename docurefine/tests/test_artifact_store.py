@@ -0,0 +1,85 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from src.artifact_store import ArtifactStore, LocalArtifactStore, S3ArtifactStore, ArtifactError, artifact_key
+
+class LocalS3Client:
+    """
+    In-memory stand-in for the subset of the boto3 S3 client the store uses.
+    """
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+        class ClientError(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError(Key)
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.test_dir, 'page.png')
+        with open(self.image_path, 'wb') as f:
+            f.write(b'\x89PNG' + bytes(range(256)))
+        self.page = {'latex_content': '\\section{Results} ' * 200, 'words': [], 'page_size': [100, 200]}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def check_store(self, store):
+        ref = store.put_json('page/ab/abc.json.z', self.page)
+        self.assertLess(ref['size'], len(self.page['latex_content']))  # Compressed
+        self.assertEqual(set(ref), {'key', 'sha256', 'size'})
+        self.assertEqual(store.get_json(ref), self.page)
+        self.assertTrue(store.exists(ref['key']))
+        self.assertFalse(store.exists('page/ab/missing.json.z'))
+        
+        image_ref = store.put_file('image/ab/abc.png', self.image_path)
+        with store.local_path(image_ref, suffix='.png') as path, open(path, 'rb') as f, \
+                open(self.image_path, 'rb') as original:
+            self.assertEqual(f.read(), original.read())
+        
+        with self.assertRaises(ArtifactError):
+            store.get_json(dict(ref, sha256='0' * 64))
+        with self.assertRaises(ArtifactError):
+            store.get_json({'key': 'page/ab/missing.json.z', 'sha256': '', 'size': 0})
+
+    def test_local_store(self):
+        self.check_store(LocalArtifactStore(os.path.join(self.test_dir, 'artifacts')))
+
+    def test_s3_store(self):
+        client = LocalS3Client()
+        self.check_store(S3ArtifactStore('bucket', prefix='docurefine/', client=client))
+        self.assertIn(('bucket', 'docurefine/page/ab/abc.json.z'), client.objects)
+
+    def test_backends_must_implement_storage(self):
+        class Incomplete(ArtifactStore):
+            def put_bytes(self, key, data):
+                pass
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_artifact_key(self):
+        key = artifact_key('page', 'abcdef', 'v1', 'json.z')
+        self.assertTrue(key.startswith('page/ab/abcdef-'))
+        self.assertNotEqual(key, artifact_key('page', 'abcdef', 'v2', 'json.z'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from benchmarks.corpus import PAGE_KINDS, generate_corpus, synthetic_page
+from benchmarks.report import compare_reports, summarize
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_corpus_is_deterministic(self):
+        first = generate_corpus(os.path.join(self.test_dir, 'first'), pages=4, seed=7, dpi=50)
+        second = generate_corpus(os.path.join(self.test_dir, 'second'), pages=4, seed=7, dpi=50)
+        other = generate_corpus(os.path.join(self.test_dir, 'other'), pages=4, seed=8, dpi=50)
+
+        self.assertEqual(first['digest'], second['digest'])
+        self.assertNotEqual(first['digest'], other['digest'])
+        self.assertEqual([page['kind'] for page in first['pages']], list(PAGE_KINDS))
+        with open(first['pdf_path'], 'rb') as f1, open(second['pdf_path'], 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_page_truth_matches_drawing(self):
+        image, truth = synthetic_page('figures', seed=1, dpi=50)
+        self.assertEqual(image.shape, (550, 425, 3))
+        self.assertIn('Figure', [element['type'] for element in truth['layout']])
+        for word in truth['words']:
+            box = image[word['top']:word['top'] + word['height'], word['left']:word['left'] + word['width']]
+            self.assertLess(box.min(), 128)  # Every word box has ink in it
+
+    def test_summarize(self):
+        summary = summarize([0.1] * 19 + [1.1], peak_rss=512 * 1024 ** 2, engine='stub')
+        self.assertEqual(summary['pages'], 20)
+        self.assertEqual(summary['pages_per_sec'], 6.667)
+        self.assertEqual(summary['p50_ms'], 100.0)
+        self.assertTrue(np.isclose(summary['p95_ms'], 150.0))
+        self.assertEqual(summary['peak_rss_mb'], 512.0)
+        self.assertEqual(summary['engine'], 'stub')
+
+    def test_compare_reports(self):
+        baseline = {'stages': {'ocr': {'pages_per_sec': 2.0}}, 'pipeline': None}
+        report = {'stages': {'ocr': {'pages_per_sec': 3.0}, 'render': {'pages_per_sec': 1.0}}, 'pipeline': None}
+        self.assertEqual(compare_reports(baseline, report),
+                         [('stage:ocr', 'pages_per_sec', 2.0, 3.0, 0.5),
+                          ('stage:ocr', 'p50_ms', None, None, None),
+                          ('stage:ocr', 'p95_ms', None, None, None),
+                          ('stage:ocr', 'peak_rss_mb', None, None, None)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+from celery.app.routes import Router, prepare
+from config.celery_config import STAGE_ROUTES, app, worker_argv, start_metrics_server
+from config.config import config
+
+class TestCeleryConfig(unittest.TestCase):
+    def test_stage_routes(self):
+        router = Router(prepare([STAGE_ROUTES]), app.amqp.queues, create_missing=True, app=app)
+        self.assertEqual(router.route({}, 'src.celery_tasks.ocr_stage')['queue'].name, 'ocr')
+        self.assertEqual(router.route({}, 'celery_tasks.reconstruct_pdf')['queue'].name, 'assemble')
+        self.assertEqual(router.route({}, 'src.celery_tasks.process_document')['queue'].name, 'celery')
+
+    def test_worker_argv(self):
+        argv = worker_argv('layout')
+        self.assertEqual(argv[0], 'worker')
+        self.assertIn('--queues=layout', argv)
+        self.assertIn(f"--concurrency={config.WORKER_POOLS['layout']['concurrency']}", argv)
+        self.assertIn(f"--max-memory-per-child={config.WORKER_POOLS['layout']['max_memory_per_child']}", argv)
+
+    @patch('config.celery_config.config.WORKER_METRICS_PORT', 9100)
+    @patch('prometheus_client.start_http_server')
+    def test_start_metrics_server(self, mock_start_http_server):
+        with tempfile.TemporaryDirectory() as directory:
+            stale = os.path.join(directory, 'histogram_123.db')
+            open(stale, 'wb').close()
+            with patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                start_metrics_server()
+            self.assertFalse(os.path.exists(stale))
+        self.assertEqual(mock_start_http_server.call_args.args, (9100,))
+        
+        mock_start_http_server.reset_mock()
+        with patch.dict(os.environ, {}, clear=True):
+            start_metrics_server()  # Without the multiprocess directory there is nothing to serve
+        mock_start_http_server.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
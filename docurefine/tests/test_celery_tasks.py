@@ -1,25 +1,277 @@
 import unittest
+import hashlib
+import os
+import tempfile
+import time
 from unittest.mock import patch, MagicMock
-from src.celery_tasks import process_document
+import numpy as np
+from src.celery_tasks import process_document, page_signatures, flatten_page_results
+from src.celery_tasks import documents_workflow, merge_documents, screen_pages
+from src.celery_tasks import refine_image_with_latex, refine_image_tiled, tile_windows, tile_elements
+from src.celery_tasks import run_latex_stage, run_render_stage, reuse_document, start_pages, stage_versions
+from src.page_cache import PageCache, page_fingerprint
+from src.page_context import PageContext
 
 class TestCeleryTasks(unittest.TestCase):
-    @patch('src.celery_tasks.split_pdf')
-    @patch('src.celery_tasks.process_page')
+    @patch('src.celery_tasks.pending_pages')
+    @patch('src.celery_tasks.process_page_range')
     @patch('src.celery_tasks.reconstruct_pdf')
-    def test_process_document(self, mock_reconstruct_pdf, mock_process_page, mock_split_pdf):
+    def test_process_document(self, mock_reconstruct_pdf, mock_process_page_range, mock_pending_pages):
         # Set up mock return values
-        mock_split_pdf.return_value = ["page1.png", "page2.png"]
-        mock_process_page.return_value = MagicMock()
+        mock_pending_pages.return_value = [1, 2]
+        mock_process_page_range.return_value = MagicMock()
         mock_reconstruct_pdf.return_value = {"output_pdf_path": "output.pdf"}
 
         # Call the function
-        result = process_document("input.pdf", "output_dir")
+        with patch.object(process_document, 'replace') as mock_replace:
+            result = process_document("input.pdf", "output_dir")
 
-        # Assert the result
+        # Assert the task hands its result to the workflow instead of waiting on it
         self.assertIsNotNone(result)
-        self.assertEqual(mock_split_pdf.call_count, 1)
-        self.assertEqual(mock_process_page.call_count, 2)  # Called for each page
-        self.assertEqual(mock_reconstruct_pdf.call_count, 1)
+        self.assertEqual(mock_replace.call_count, 1)
+        mock_pending_pages.assert_called_once_with("input.pdf", "output_dir")
+        self.assertEqual(mock_process_page_range.s.call_count, 1)  # Both pages fit in one range
+        self.assertEqual(mock_reconstruct_pdf.s.call_count, 1)
+
+    @patch('src.celery_tasks.count_pages')
+    @patch('src.celery_tasks.process_page_range')
+    def test_page_signatures_splits_pdf_into_ranges(self, mock_process_page_range, mock_count_pages):
+        mock_count_pages.return_value = 3
+        signatures = page_signatures("input.pdf", "output_dir", batch_size=2)
+        self.assertEqual(len(signatures), 2)
+        mock_process_page_range.s.assert_any_call("input.pdf", 1, 2, "output_dir")
+        mock_process_page_range.s.assert_any_call("input.pdf", 3, 3, "output_dir")
+
+    @patch('src.celery_tasks.process_page_range')
+    def test_page_signatures_skips_checkpointed_pages(self, mock_process_page_range):
+        signatures = page_signatures("input.pdf", "output_dir", batch_size=2, pages=[2, 3, 4, 7])
+        self.assertEqual(len(signatures), 3)
+        mock_process_page_range.s.assert_any_call("input.pdf", 2, 3, "output_dir")
+        mock_process_page_range.s.assert_any_call("input.pdf", 7, 7, "output_dir")
+        self.assertEqual(page_signatures("scan.png", "output_dir", pages=[]), [])
+
+    @patch('src.celery_tasks.config.PIPELINE_MODE', 'staged')
+    @patch('src.celery_tasks.count_pages')
+    def test_page_signatures_staged(self, mock_count_pages):
+        mock_count_pages.return_value = 3
+        signatures = page_signatures("input.pdf", "output_dir", batch_size=2)
+        self.assertEqual(len(signatures), 2)
+        stages = [task.task.rsplit('.', 1)[-1] for task in signatures[0].tasks]
+        self.assertEqual(stages, ['rasterize_stage', 'layout_stage', 'ocr_stage', 'latex_stage', 'render_stage'])
+        self.assertEqual(signatures[1].tasks[0].args, ("input.pdf", 3, 3, "output_dir"))
+
+    @patch('src.celery_tasks.process_page')
+    def test_page_signatures_single_image(self, mock_process_page):
+        signatures = page_signatures("scan.png", "output_dir")
+        self.assertEqual(len(signatures), 1)
+        mock_process_page.s.assert_called_once_with("scan.png", "output_dir")
+
+    def test_flatten_page_results(self):
+        results = [[{'page_path': 'a'}, {'page_path': 'b'}], {'page_path': 'c'}]
+        self.assertEqual([page['page_path'] for page in flatten_page_results(results)], ['a', 'b', 'c'])
+
+    @patch('src.celery_tasks.document_workflow')
+    @patch('src.celery_tasks.merge_documents')
+    @patch('src.celery_tasks.chord')
+    def test_documents_workflow(self, mock_chord, mock_merge_documents, mock_document_workflow):
+        documents_workflow([("a.pdf", "out_a"), ("b.png", "out_b")], pages=[[1, 2], [1]])
+
+        mock_document_workflow.assert_any_call("a.pdf", "out_a", pages=[1, 2])
+        mock_document_workflow.assert_any_call("b.png", "out_b", pages=[1])
+        header, callback = mock_chord.call_args.args
+        self.assertEqual(len(header), 2)
+        self.assertIs(callback, mock_merge_documents.s.return_value)
+
+    @patch('src.celery_tasks.document_workflow')
+    @patch('src.celery_tasks.reuse_document')
+    @patch('src.celery_tasks.merge_documents')
+    @patch('src.celery_tasks.chord')
+    def test_documents_workflow_reuses_duplicates(self, mock_chord, mock_merge_documents, mock_reuse_document,
+                                                 mock_document_workflow):
+        source = {'task_id': 'other-task', 'output_pdf_path': 'other/reconstructed.pdf'}
+        documents_workflow([("a.pdf", "out_a"), ("b.pdf", "out_b", source)], pages=[[1], []])
+
+        mock_document_workflow.assert_called_once_with("a.pdf", "out_a", pages=[1])
+        mock_reuse_document.si.assert_called_once_with(source, "b.pdf", "out_b")
+        header, _ = mock_chord.call_args.args
+        self.assertEqual(len(header), 2)
+
+    @patch('src.celery_tasks.pending_pages')
+    @patch('src.celery_tasks.document_workflow')
+    @patch('src.celery_tasks.app')
+    def test_reuse_document_processes_after_timeout(self, mock_app, mock_document_workflow, mock_pending_pages):
+        mock_app.AsyncResult.return_value.failed.return_value = False
+        mock_app.AsyncResult.return_value.successful.return_value = False
+        mock_pending_pages.return_value = [1, 2]
+        source = {'task_id': 'other-task', 'output_pdf_path': 'other/reconstructed.pdf'}
+
+        with patch.object(reuse_document, 'replace') as mock_replace, \
+                patch.object(reuse_document, 'retry', side_effect=RuntimeError) as mock_retry:
+            with self.assertRaises(RuntimeError):
+                reuse_document(source, "b.pdf", "out_b", deadline=time.time() + 60)
+            mock_retry.assert_called_once()
+            mock_replace.assert_not_called()
+
+            reuse_document(source, "b.pdf", "out_b", deadline=time.time() - 1)
+        mock_document_workflow.assert_called_once_with("b.pdf", "out_b", pages=[1, 2])
+        mock_replace.assert_called_once_with(mock_document_workflow.return_value)
+
+    @patch('src.celery_tasks.pending_pages', return_value=[1])
+    @patch('src.celery_tasks.document_workflow')
+    @patch('src.celery_tasks.app')
+    def test_reuse_document_copies_verified_output(self, mock_app, mock_document_workflow, mock_pending_pages):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'a', 'reconstructed.pdf')
+            os.makedirs(os.path.dirname(source_path))
+            with open(source_path, 'wb') as f:
+                f.write(b'%PDF')
+            mock_app.AsyncResult.return_value.failed.return_value = False
+            mock_app.AsyncResult.return_value.successful.return_value = True
+            mock_app.AsyncResult.return_value.result = [
+                {'output_pdf_path': source_path, 'artifact': {'sha256': hashlib.sha256(b'%PDF').hexdigest()}}]
+            source = {'task_id': 'other-task', 'output_pdf_path': source_path}
+            output_directory = os.path.join(directory, 'b')
+            
+            with patch.object(reuse_document, 'replace') as mock_replace:
+                result = reuse_document(source, "b.pdf", output_directory)
+                with open(result['output_pdf_path'], 'rb') as f:
+                    self.assertEqual(f.read(), b'%PDF')
+                mock_replace.assert_not_called()
+                
+                with open(source_path, 'wb') as f:
+                    f.write(b'%PDF of another document')  # The source path was reused since
+                reuse_document(source, "b.pdf", os.path.join(directory, 'c'))
+            mock_replace.assert_called_once_with(mock_document_workflow.return_value)
+
+    @patch('src.celery_tasks.merge_pdfs')
+    @patch('src.celery_tasks.get_artifact_store')
+    def test_merge_documents(self, mock_get_artifact_store, mock_merge_pdfs):
+        mock_merge_pdfs.return_value = "merged_output.pdf"
+        mock_get_artifact_store.return_value.put_file.return_value = {'key': 'merged.pdf'}
+        results = [{'output_pdf_path': 'a.pdf'}, {'output_pdf_path': 'b.pdf'}]
+
+        merged = merge_documents(results)
+
+        mock_merge_pdfs.assert_called_once_with(['a.pdf', 'b.pdf'])
+        self.assertEqual(merged[-1], {'output_pdf_path': 'merged_output.pdf', 'artifact': {'key': 'merged.pdf'}})
+        self.assertEqual(merge_documents([]), [])
+
+    @patch('src.celery_tasks.page_done')
+    @patch('src.celery_tasks.page_index')
+    @patch('src.celery_tasks.PageManifest')
+    def test_screen_pages_skips_blank_and_duplicate_pages(self, mock_manifest, mock_page_index, mock_page_done):
+        canonical = {'page_number': 1, 'refined_image_path': 'refined_page_1.png', 'image': {'key': 'image'}}
+        mock_page_index.return_value.lookup.side_effect = [None, canonical]
+        blank = np.full((100, 80, 3), 255, dtype=np.uint8)
+        page = blank.copy()
+        page[20:80:10, 10:70] = 0
+        
+        remaining, screened, hashes = screen_pages([(1, page), (2, blank), (3, page)], "output_dir")
+        
+        self.assertEqual([page_number for page_number, _ in remaining], [1])
+        self.assertEqual(screened, [{'page_number': 2, 'blank': True, 'page_size': [80, 100]},
+                                    dict(canonical, page_number=3, duplicate=True)])
+        self.assertEqual(set(hashes), {1, 3})
+        self.assertEqual(mock_manifest.return_value.record.call_count, 2)
+        self.assertEqual(mock_page_done.call_count, 2)
+
+    def test_tile_windows(self):
+        self.assertEqual(tile_windows(10, 4), [(0, 4), (4, 8), (8, 10)])
+
+    @patch('src.celery_tasks.config.TILE_MIN_PIXELS', 0)
+    def test_refine_image_tiled_matches_single_pass(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (300, 120, 3), dtype=np.uint8)
+        elements = [
+            {'type': 'Figure', 'coordinates': (10, 40, 100, 200)},
+            {'type': 'text', 'coordinates': (5, 95, 80, 30), 'text_index': 0},
+        ]
+
+        expected = refine_image_with_latex(image, ['x^2'], elements)
+        refined = refine_image_tiled(image, ['x^2'], elements, tile_rows=64, processes=2)
+
+        np.testing.assert_array_equal(refined, expected)
+
+    def test_tile_elements(self):
+        merged_layout = [
+            {'type': 'Title', 'coordinates': (0, 0, 30, 5), 'text': 'A'},
+            {'type': 'Table', 'coordinates': (0, 5, 30, 10), 'text': ''},
+            {'type': 'Text', 'coordinates': (0, 10, 30, 20), 'text': 'b'},
+        ]
+        snippets, elements = tile_elements(merged_layout, ['A', None, '$b^2$'])
+        self.assertEqual(snippets, ['A', '$b^2$'])
+        self.assertEqual(elements, [{'type': 'Text', 'coordinates': (0, 0, 30, 5), 'text_index': 0, 'math': False},
+                                    {'type': 'Text', 'coordinates': (0, 10, 30, 10), 'text_index': 1, 'math': False}])
+        
+        snippets, _ = tile_elements(merged_layout)  # No snippets cached; draw the plain text
+        self.assertEqual(snippets, ['A', 'b'])
+
+    @patch('src.celery_tasks.stage_versions', return_value={'latex': 'l'})
+    @patch('src.celery_tasks.get_page_cache')
+    @patch('latex_converter.texts_to_latex', side_effect=lambda texts: [f"{text}^2" for text in texts])
+    def test_tiles_pages_with_titles_and_lists(self, mock_texts_to_latex, mock_get_page_cache, mock_stage_versions):
+        merged_layout = [
+            {'type': 'Title', 'coordinates': (0, 0, 120, 20), 'text': 'Intro'},
+            {'type': 'List', 'coordinates': (0, 20, 120, 60), 'text': 'a\nb'},
+            {'type': 'Text', 'coordinates': (0, 60, 120, 80), 'text': 'c'},
+        ]
+        state = {'fingerprint': 'f', 'merged_layout': merged_layout}
+        run_latex_stage([state])
+        self.assertIn('\\section{Intro}', state['latex_content'])
+        self.assertIn('\\begin{itemize}', state['latex_content'])
+        
+        snippets, elements = tile_elements(merged_layout, state['latex_snippets'])
+        self.assertEqual(snippets, ['Intro', '\u2022 $a^2$\n\u2022 $b^2$', '$c^2$'])
+        refined = refine_image_with_latex(np.full((80, 120, 3), 255, dtype=np.uint8), snippets, elements)
+        for top, bottom in [(0, 20), (20, 60), (60, 80)]:
+            self.assertLess(refined[top:bottom].min(), 128)  # Every block is drawn
+
+    @patch('src.celery_tasks.config.TILE_MIN_PIXELS', 0)
+    @patch('src.celery_tasks.stage_versions', return_value={'merged': 'm', 'latex': 'l'})
+    @patch('src.celery_tasks.get_artifact_store')
+    @patch('src.celery_tasks.PageManifest')
+    @patch('src.celery_tasks.page_done')
+    @patch('src.celery_tasks.generate_image_from_latex')
+    @patch('src.celery_tasks.refine_image_tiled')
+    def test_render_stage_tiles_oversized_pages(self, mock_refine_image_tiled, mock_generate_image_from_latex,
+                                                mock_page_done, mock_manifest, mock_get_artifact_store,
+                                                mock_stage_versions):
+        mock_refine_image_tiled.return_value = np.zeros((20, 30, 3), dtype=np.uint8)
+        state = {'page_number': 1, 'fingerprint': 'f', 'latex_content': 'b', 'words': [], 'timings': {},
+                 'merged_layout': [{'type': 'Text', 'coordinates': (0, 5, 30, 20), 'text': 'b'}]}
+        image = PageContext(rgb=np.full((20, 30, 3), 255, dtype=np.uint8), path='page.png')
+        
+        with tempfile.TemporaryDirectory() as output_directory:
+            results = run_render_stage([state], [image], output_directory)
+        
+        mock_generate_image_from_latex.assert_not_called()
+        snippets, elements = mock_refine_image_tiled.call_args.args[1:]
+        self.assertEqual((snippets, elements),
+                         (['b'], [{'type': 'Text', 'coordinates': (0, 5, 30, 15), 'text_index': 0, 'math': False}]))
+        self.assertTrue(results[0]['refined_image_path'].endswith('refined_page_1.png'))
+
+    @patch('src.celery_tasks.ocr_engine_version', return_value='tesseract-5')
+    def test_native_pages_are_cached_apart_from_ocr_pages(self, mock_ocr_engine_version):
+        cache = PageCache(None)
+        image = np.full((20, 30, 3), 255, dtype=np.uint8)
+        fingerprint = page_fingerprint(image)
+        classification = {'merged_layout': [{'type': 'Text', 'coordinates': (0, 0, 30, 20), 'text': 'a'}],
+                          'words': [{'text': 'a'}]}
+        self.assertNotEqual(stage_versions(native=True)['latex'], stage_versions()['latex'])
+        
+        with patch('src.celery_tasks.get_page_cache', return_value=cache):
+            cache.put('latex', fingerprint, stage_versions()['latex'], 'from OCR')
+            (state,), _ = start_pages([(1, image)], native={1: classification})
+            self.assertTrue(state['native_text'])
+            self.assertNotIn('latex_content', state)
+            self.assertEqual(state['merged_layout'], classification['merged_layout'])
+            
+            cache.put('latex', fingerprint, stage_versions(native=True)['latex'], 'from native text')
+            (state,), _ = start_pages([(1, image)], native={1: classification})
+            self.assertEqual(state['latex_content'], 'from native text')
+            self.assertEqual(state['words'], classification['words'])
+            (state,), _ = start_pages([(1, image)])  # Native text detection turned off
+            self.assertEqual(state['latex_content'], 'from OCR')
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
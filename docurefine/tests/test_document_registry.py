@@ -0,0 +1,125 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
+from flask import Flask
+from src.document_registry import db, Upload, pipeline_version, job_key, find_duplicate, find_running_job, plan_documents, record_uploads
+
+VERSION = 'test-version'
+
+class TestDocumentRegistry(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+        
+        self.task_state = 'PENDING'
+        async_result = patch('src.document_registry.celery_app.AsyncResult',
+                             side_effect=lambda task_id: MagicMock(state=self.task_state))
+        async_result.start()
+        self.addCleanup(async_result.stop)
+        snapshot = patch('src.document_registry.progress_snapshot', return_value=None)
+        snapshot.start()
+        self.addCleanup(snapshot.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        shutil.rmtree(self.test_dir)
+
+    def add_upload(self, status, task_id='task-1', content_hash='abc', key='job'):
+        output_dir = os.path.join(self.test_dir, task_id)
+        os.makedirs(output_dir, exist_ok=True)
+        upload = Upload(user_id=1, filename='doc.pdf', content_hash=content_hash, pipeline_version=VERSION,
+                        job_key=key, task_id=task_id, status=status, output_dir=output_dir)
+        db.session.add(upload)
+        db.session.commit()
+        return upload
+
+    def test_job_key(self):
+        self.assertEqual(job_key(['a', 'b'], VERSION), job_key(['a', 'b'], VERSION))
+        self.assertNotEqual(job_key(['a', 'b'], VERSION), job_key(['b', 'a'], VERSION))
+        self.assertNotEqual(job_key(['a'], VERSION), job_key(['a'], 'other-version'))
+
+    def test_pipeline_version_covers_output_settings(self):
+        version = pipeline_version()
+        for name, value in [('PHASH_MAX_DISTANCE', 7), ('SSIM_EARLY_EXIT_MARGIN', 0.5),
+                            ('NATIVE_TEXT_DETECTION', False), ('PIPELINE_VERSION', 'next')]:
+            with patch(f'src.document_registry.config.{name}', value):
+                self.assertNotEqual(pipeline_version(), version, name)
+        with patch('src.document_registry.config.SSIM_STRIP_ROWS', 7):
+            self.assertEqual(pipeline_version(), version)
+
+    def test_reuses_finished_output(self):
+        source = self.add_upload('complete')
+        with open(source.output_pdf_path, 'wb') as f:
+            f.write(b'%PDF')
+        output_dir = os.path.join(self.test_dir, 'requester')
+        
+        file_list, statuses = plan_documents([('doc.pdf', output_dir, 'abc')], VERSION)
+        
+        self.assertEqual(statuses, ['complete'])
+        input_path, output_directory, reuse = file_list[0]
+        self.assertIsNone(reuse['task_id'])
+        self.assertFalse(os.path.samefile(reuse['output_pdf_path'], source.output_pdf_path))
+        with open(reuse['output_pdf_path'], 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF')
+
+    def test_overwritten_output_is_not_reused(self):
+        upload = self.add_upload('queued')
+        with open(upload.output_pdf_path, 'wb') as f:
+            f.write(b'%PDF')
+        self.task_state = 'SUCCESS'
+        self.assertEqual(find_duplicate('abc', VERSION).id, upload.id)
+        
+        with open(upload.output_pdf_path, 'wb') as f:
+            f.write(b'%PDF of a later upload with the same name')
+        file_list, statuses = plan_documents([('doc.pdf', os.path.join(self.test_dir, 'requester'), 'abc')], VERSION)
+        self.assertEqual(statuses, ['queued'])
+        self.assertEqual(len(file_list[0]), 2)
+        self.assertEqual(upload.status, 'failed')
+
+    def test_attaches_to_inflight_duplicate(self):
+        self.add_upload('queued', task_id='running')
+        
+        file_list, statuses = plan_documents([('doc.pdf', 'out', 'abc'), ('new.pdf', 'out_new', 'def')], VERSION)
+        
+        self.assertEqual(statuses, ['queued', 'queued'])
+        self.assertEqual(file_list[0][2]['task_id'], 'running')
+        self.assertEqual(file_list[1], ('new.pdf', 'out_new'))
+
+    def test_reconciles_finished_and_failed_jobs(self):
+        upload = self.add_upload('processing')
+        
+        self.task_state = 'FAILURE'
+        self.assertIsNone(find_duplicate('abc', VERSION))
+        self.assertEqual(db.session.get(Upload, upload.id).status, 'failed')
+        
+        upload = self.add_upload('queued', task_id='task-2')
+        with open(upload.output_pdf_path, 'wb') as f:
+            f.write(b'%PDF')
+        self.task_state = 'SUCCESS'
+        self.assertEqual(find_duplicate('abc', VERSION).id, upload.id)
+        self.assertEqual(upload.status, 'complete')
+
+    def test_lost_jobs_are_not_attached_to(self):
+        upload = self.add_upload('queued')
+        upload.created_at = datetime.utcnow() - timedelta(days=30)
+        db.session.commit()
+        self.assertIsNone(find_running_job('job', 1))
+
+    def test_identical_submission_attaches_to_running_job(self):
+        record_uploads(1, [('doc.pdf', 'out', 'abc')], ['queued'], VERSION, 'job', 'task-1')
+        self.assertEqual(find_running_job('job', 1).task_id, 'task-1')
+        self.assertIsNone(find_running_job('other-job', 1))
+        self.assertIsNone(find_running_job('job', 2))  # Another user's submission gets its own outputs
+
+if __name__ == '__main__':
+    unittest.main()
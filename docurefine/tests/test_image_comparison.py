@@ -3,7 +3,8 @@ import os
 import tempfile
 import cv2
 import numpy as np
-from src.image_comparison import compare_images, refine_image
+from skimage.metrics import structural_similarity
+from src.image_comparison import compare_images, refine_image, tiled_ssim, repair_regions, repair_metrics
 
 class TestImageComparison(unittest.TestCase):
     def setUp(self):
@@ -32,6 +33,52 @@ class TestImageComparison(unittest.TestCase):
         self.assertLess(score, 1)
         self.assertIsInstance(diff, np.ndarray)
     
+    def test_tiled_ssim_matches_single_pass(self):
+        rng = np.random.default_rng(0)
+        img1 = rng.integers(0, 256, (203, 157), dtype=np.uint8)
+        img2 = np.clip(img1.astype(int) + rng.integers(-40, 40, img1.shape), 0, 255).astype(np.uint8)
+        
+        expected_score, expected_map = structural_similarity(img1, img2, full=True)
+        score, ssim_map = tiled_ssim(img1, img2, 255, strip_rows=50)
+        
+        self.assertAlmostEqual(score, expected_score, places=5)
+        self.assertEqual(ssim_map.dtype, np.float32)
+        np.testing.assert_allclose(ssim_map, expected_map, atol=1e-4)
+    
+    def test_multiscale_early_exit(self):
+        img = np.ones((400, 400), dtype=np.uint8) * 255
+        img[100:300, 100:300] = 0
+        
+        score, diff = compare_images(img, img.copy(), mode='multiscale', threshold=0.9)
+        self.assertAlmostEqual(score, 1.0)
+        self.assertIsNone(diff)
+        
+        # Without a threshold there is no early exit and the full map is returned
+        score, diff = compare_images(self.image1_path, self.image2_path, mode='multiscale')
+        self.assertLess(score, 1)
+        self.assertEqual(diff.shape, (100, 100))
+    
+    def test_repair_regions(self):
+        original = np.full((200, 200, 3), 255, dtype=np.uint8)
+        original[50:100, 50:100] = (10, 20, 30)
+        original[150:153, 150:153] = 0  # Too small to repair
+        refined = np.full((200, 200, 3), 200, dtype=np.uint8)
+        _, diff = compare_images(original, refined, mode='full')
+        
+        result, repaired_pixels = repair_regions(original, refined, diff)
+        
+        np.testing.assert_array_equal(result[60:90, 60:90], original[60:90, 60:90])
+        np.testing.assert_array_equal(result[150:153, 150:153], refined[150:153, 150:153])
+        self.assertGreater(repaired_pixels, 50 * 50)
+        self.assertLess(repaired_pixels, 200 * 200)
+    
+    def test_repair_metrics(self):
+        before = repair_metrics()
+        refine_image(self.image1_path, self.image1_path, threshold=0.9)
+        after = repair_metrics()
+        self.assertEqual(after['comparisons'], before['comparisons'] + 1)
+        self.assertEqual(after['fraction_histogram'][0], before['fraction_histogram'][0] + 1)
+    
     def test_refine_image(self):
         refined_path = refine_image(self.image1_path, self.image2_path, threshold=0.9)
         self.assertTrue(os.path.exists(refined_path))
@@ -41,5 +88,10 @@ class TestImageComparison(unittest.TestCase):
         identical_refined_path = refine_image(self.image1_path, self.image1_path, threshold=0.9)
         self.assertEqual(identical_refined_path, self.image1_path)
 
+    def test_module_imports_under_both_names(self):
+        import image_comparison  # As the pipeline modules import it
+        import src.image_comparison
+        self.assertIs(image_comparison.repaired_fraction, src.image_comparison.repaired_fraction)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,8 +1,12 @@
 import unittest
 import os
 import tempfile
+from unittest.mock import patch
 import numpy as np
-from src.latex_converter import text_to_latex, convert_layout_to_latex, render_latex, latex_to_image
+from src.latex_converter import (text_to_latex, convert_layout_to_latex, convert_layouts_to_latex,
+                                  length_buckets, render_latex, latex_to_image, get_latex_model,
+                                  convert_layouts_to_blocks)
+from src.model_registry import clear_models
 
 class TestLatexConverter(unittest.TestCase):
     def setUp(self):
@@ -34,6 +38,49 @@ class TestLatexConverter(unittest.TestCase):
         self.assertIn("\\item", result)
         self.assertIn("\\begin{figure}", result)
 
+    @patch('src.latex_converter.T5Tokenizer')
+    @patch('src.latex_converter.T5ForConditionalGeneration')
+    @patch('src.latex_converter.config.LATEX_MODEL', 'org/latex-model')
+    def test_get_latex_model_uses_configured_model(self, mock_model_class, mock_tokenizer_class):
+        clear_models()
+        self.addCleanup(clear_models)
+        model, tokenizer = get_latex_model()
+        self.assertIs(get_latex_model(), get_latex_model())
+        mock_model_class.from_pretrained.assert_called_once_with('org/latex-model')
+        mock_tokenizer_class.from_pretrained.assert_called_once_with('org/latex-model')
+        self.assertIs(model, mock_model_class.from_pretrained.return_value)
+
+    @patch('src.latex_converter.texts_to_latex', side_effect=lambda texts: [f"{text}^2" for text in texts])
+    def test_convert_layouts_to_blocks(self, mock_texts_to_latex):
+        merged_layout = [
+            {'type': 'Title', 'text': 'Cost in $'},
+            {'type': 'List', 'text': 'a\nb'},
+            {'type': 'Table', 'text': ''},
+        ]
+        blocks = convert_layouts_to_blocks([merged_layout])[0]
+        self.assertEqual(blocks, [
+            {'latex': '\\section{Cost in $}', 'snippet': 'Cost in \\$'},
+            {'latex': '\\begin{itemize}\n\n\\item a^2\n\n\\item b^2\n\n\\end{itemize}',
+             'snippet': '\u2022 $a^2$\n\u2022 $b^2$'},
+            {'latex': None, 'snippet': None},
+        ])
+
+    def test_length_buckets(self):
+        buckets = length_buckets([5, 1, 9, 3, 7], batch_size=2)
+        self.assertEqual(buckets, [[1, 3], [0, 4], [2]])
+
+    @patch('src.latex_converter.texts_to_latex')
+    def test_convert_layouts_to_latex_maps_segments_in_order(self, mock_texts_to_latex):
+        mock_texts_to_latex.side_effect = lambda texts: [f"<{text}>" for text in texts]
+        merged_layouts = [
+            [{'type': 'Text', 'text': 'first'}, {'type': 'List', 'text': 'a\nb'}],
+            [{'type': 'Title', 'text': 'Heading'}, {'type': 'Text', 'text': 'second'}]
+        ]
+        result = convert_layouts_to_latex(merged_layouts)
+        self.assertEqual(mock_texts_to_latex.call_count, 1)
+        self.assertEqual(result[0], "<first>\n\n\\begin{itemize}\n\n\\item <a>\n\n\\item <b>\n\n\\end{itemize}")
+        self.assertEqual(result[1], "\\section{Heading}\n\n<second>")
+
     def test_render_latex(self):
         latex_content = "$x^2 + y^2 = z^2$"
         output_path = os.path.join(self.test_dir, "output.png")
@@ -1,8 +1,10 @@
 import unittest
 import os
 import tempfile
+from unittest.mock import patch, MagicMock
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
-from src.layout_analysis import analyze_layout, merge_ocr_and_layout
+from src.layout_analysis import analyze_layout, analyze_layout_batch, merge_ocr_and_layout
 
 class TestLayoutAnalysis(unittest.TestCase):
     def setUp(self):
@@ -30,6 +32,20 @@ class TestLayoutAnalysis(unittest.TestCase):
         self.assertIn('coordinates', result[0])
         self.assertIn('score', result[0])
 
+    @patch('src.layout_analysis.get_layout_model')
+    def test_analyze_layout_batch(self, mock_get_layout_model):
+        block = MagicMock(type='Text', coordinates=(1, 2, 3, 4), score=0.9)
+        model = MagicMock(spec=['detect'])
+        model.detect.return_value = [block]
+        mock_get_layout_model.return_value = model
+
+        images = [self.sample_image_path, np.zeros((100, 300, 3), dtype=np.uint8), self.sample_image_path]
+        result = analyze_layout_batch(images, batch_size=2)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(model.detect.call_count, 3)
+        for elements in result:
+            self.assertEqual(elements, [{'type': 'Text', 'coordinates': (1, 2, 3, 4), 'score': 0.9}])
+
     def test_merge_ocr_and_layout(self):
         ocr_result = {
             'text': 'Title Content',
@@ -49,5 +65,40 @@ class TestLayoutAnalysis(unittest.TestCase):
         self.assertEqual(result[1]['type'], 'Text')
         self.assertEqual(result[1]['text'], 'Content')
 
+class TestMergePolicies(unittest.TestCase):
+    def setUp(self):
+        self.ocr_result = {
+            'text': 'Title Content',
+            'layout': [
+                {'text': 'Title', 'left': 10, 'top': 10, 'width': 50, 'height': 20},
+                {'text': 'Content', 'left': 10, 'top': 50, 'width': 70, 'height': 20}
+            ]
+        }
+        # The second block overlaps the first, which covers the whole page
+        self.layout_elements = [
+            {'type': 'Text', 'coordinates': (0, 0, 100, 100), 'score': 0.9},
+            {'type': 'Text', 'coordinates': (0, 40, 100, 80), 'score': 0.8}
+        ]
+
+    def merged_text(self, policy):
+        return [element['text'] for element in merge_ocr_and_layout(self.ocr_result, self.layout_elements, policy)]
+
+    def test_any_overlap(self):
+        self.assertEqual(self.merged_text('any'), ['Title Content', 'Content'])
+
+    def test_majority_area(self):
+        self.assertEqual(self.merged_text('majority'), ['Title Content', ''])
+
+    def test_centroid(self):
+        self.assertEqual(self.merged_text('centroid'), ['Title', 'Content'])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            merge_ocr_and_layout(self.ocr_result, self.layout_elements, 'nearest')
+
+    def test_no_words(self):
+        result = merge_ocr_and_layout({'text': '', 'layout': []}, self.layout_elements, 'majority')
+        self.assertEqual([element['text'] for element in result], ['', ''])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
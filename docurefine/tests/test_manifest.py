@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+from src.artifact_store import LocalArtifactStore
+from src.manifest import PageManifest, document_fingerprint
+
+class TestPageManifest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.test_dir, 'input.pdf')
+        with open(self.input_path, 'wb') as f:
+            f.write(b'%PDF-1.4 first version')
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        self.store = LocalArtifactStore(os.path.join(self.test_dir, 'artifacts'))
+        store_patch = patch('src.manifest.get_artifact_store', return_value=self.store)
+        store_patch.start()
+        self.addCleanup(store_patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def record_page(self, manifest, page_number):
+        refined_image_path = os.path.join(self.test_dir, f'refined_page_{page_number}.png')
+        with open(refined_image_path, 'wb') as f:
+            f.write(b'PNG')
+        page = {'page_number': page_number, 'refined_image_path': refined_image_path,
+                'image': self.store.put_file(f'image/page_{page_number}.png', refined_image_path)}
+        manifest.record(page)
+        return page
+
+    def test_records_and_skips_finished_pages(self):
+        manifest = PageManifest.open(self.input_path, self.output_dir, 'v1')
+        page = self.record_page(manifest, 2)
+        
+        reopened = PageManifest.open(self.input_path, self.output_dir, 'v1')
+        self.assertEqual(reopened.get(2), page)
+        self.assertEqual(reopened.missing(range(1, 4)), [1, 3])
+        self.assertEqual(reopened.pages(), [page])
+
+    def test_missing_artifact_is_not_finished(self):
+        manifest = PageManifest.open(self.input_path, self.output_dir, 'v1')
+        page = self.record_page(manifest, 1)
+        os.remove(self.store._path(page['image']['key']))
+        self.assertIsNone(manifest.get(1))
+        self.assertEqual(manifest.missing([1]), [1])
+
+    def test_blank_page_is_finished_without_image(self):
+        manifest = PageManifest.open(self.input_path, self.output_dir, 'v1')
+        page = {'page_number': 1, 'blank': True, 'page_size': [200, 300]}
+        manifest.record(page)
+        self.assertEqual(manifest.get(1), page)
+        self.assertEqual(manifest.missing([1, 2]), [2])
+
+    def test_changed_document_discards_manifest(self):
+        manifest = PageManifest.open(self.input_path, self.output_dir, 'v1')
+        self.record_page(manifest, 1)
+        
+        self.assertEqual(PageManifest.open(self.input_path, self.output_dir, 'v2').pages(), [])
+        
+        with open(self.input_path, 'wb') as f:
+            f.write(b'%PDF-1.4 second version')
+        manifest = PageManifest.open(self.input_path, self.output_dir, 'v2')
+        self.assertEqual(manifest.fingerprint(), document_fingerprint(self.input_path, 'v2'))
+        self.assertEqual(manifest.missing([1]), [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from unittest.mock import MagicMock
+from src.model_registry import get_model, is_loaded, model_metrics, clear_models
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        clear_models()
+
+    def tearDown(self):
+        clear_models()
+
+    def test_get_model_loads_once(self):
+        loader = MagicMock(return_value=object())
+        first = get_model(('layout', 'test'), loader)
+        second = get_model(('layout', 'test'), loader)
+        self.assertIs(first, second)
+        self.assertEqual(loader.call_count, 1)
+        self.assertTrue(is_loaded(('layout', 'test')))
+
+    def test_model_metrics(self):
+        get_model(('layout', 'test'), lambda: object())
+        metrics = model_metrics()
+        self.assertIn(('layout', 'test'), metrics)
+        self.assertIn('load_seconds', metrics[('layout', 'test')])
+        self.assertIn('rss_delta_bytes', metrics[('layout', 'test')])
+        self.assertGreaterEqual(metrics[('layout', 'test')]['load_seconds'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import unittest
 import os
 import tempfile
+from unittest.mock import patch
 from PIL import Image, ImageDraw, ImageFont
-from src.ocr import perform_ocr, perform_ocr_with_layout
+from src.ocr import perform_ocr, perform_ocr_with_layout, ocr_engine_version
 
 class TestOCR(unittest.TestCase):
     def setUp(self):
@@ -33,5 +34,13 @@ class TestOCR(unittest.TestCase):
         self.assertIn("Hello, World!", result['text'])
         self.assertTrue(len(result['layout']) > 0)
 
+    @patch('src.ocr.pytesseract.get_tesseract_version')
+    @patch('src.ocr.config.OCR_ENGINE_VERSION', 'tesseract-5.3.0')
+    def test_ocr_engine_version_from_config(self, mock_get_version):
+        ocr_engine_version.cache_clear()
+        self.addCleanup(ocr_engine_version.cache_clear)
+        self.assertEqual(ocr_engine_version(), 'tesseract-5.3.0')
+        mock_get_version.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
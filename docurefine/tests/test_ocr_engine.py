@@ -0,0 +1,99 @@
+import unittest
+import threading
+from unittest.mock import patch, MagicMock
+import numpy as np
+from src.ocr import OcrEnginePool, PytesseractEngine, result_from_data, perform_ocr_with_layout, perform_region_ocr
+
+class TestOcrEngine(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'text': ['', 'Hello,', 'World!', 'Bye'],
+            'conf': ['-1', '95.5', '91', '40'],
+            'left': [0, 10, 60, 10],
+            'top': [0, 10, 10, 40],
+            'width': [300, 45, 50, 30],
+            'height': [100, 12, 12, 12],
+            'block_num': [1, 1, 1, 1],
+            'par_num': [1, 1, 1, 1],
+            'line_num': [0, 1, 1, 2],
+        }
+
+    def test_result_from_data(self):
+        result = result_from_data(self.data)
+        self.assertEqual(result['text'], 'Hello, World!\nBye')
+        self.assertEqual([word['text'] for word in result['words']], ['Hello,', 'World!', 'Bye'])
+        self.assertEqual(len(result['lines']), 2)
+        self.assertEqual(result['lines'][0]['width'], 100)
+
+    @patch('src.ocr.pytesseract.image_to_data')
+    def test_pytesseract_engine_runs_once(self, mock_image_to_data):
+        mock_image_to_data.return_value = self.data
+        engine = PytesseractEngine()
+        engine.recognize(MagicMock(), psm=6)
+        self.assertEqual(mock_image_to_data.call_count, 1)
+        self.assertIn('--psm 6', mock_image_to_data.call_args.kwargs['config'])
+
+    def test_pool_reuses_engines(self):
+        pool = OcrEnginePool(size=2, backend='pytesseract')
+        with pool.engine() as first:
+            pass
+        with pool.engine() as second:
+            pass
+        self.assertIs(first, second)
+
+    def test_pool_is_bounded(self):
+        pool = OcrEnginePool(size=2, backend='pytesseract')
+        seen = set()
+        barrier = threading.Barrier(4, timeout=5)
+
+        def borrow():
+            with pool.engine() as engine:
+                seen.add(id(engine))
+            barrier.wait()
+
+        threads = [threading.Thread(target=borrow) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(len(seen), 2)
+
+    @patch('src.ocr.ocr_page')
+    def test_perform_ocr_with_layout_filters_confidence(self, mock_ocr_page):
+        mock_ocr_page.return_value = result_from_data(self.data)
+        result = perform_ocr_with_layout('page.png')
+        self.assertEqual([word['text'] for word in result['layout']], ['Hello,', 'World!'])
+        self.assertIn('Hello, World!', result['text'])
+        self.assertEqual(mock_ocr_page.call_count, 1)
+
+    @patch('src.ocr.get_ocr_pool')
+    def test_perform_region_ocr(self, mock_get_ocr_pool):
+        pool = MagicMock(size=2)
+        pool.recognize.side_effect = lambda crop, psm: {
+            'text': 'a\nb',
+            'words': [{'text': 'a', 'left': 1, 'top': 2, 'width': 5, 'height': 5, 'conf': 90.0},
+                      {'text': 'b', 'left': 1, 'top': 9, 'width': 5, 'height': 5, 'conf': 90.0}],
+            'lines': [{'text': 'a', 'conf': 90.0}, {'text': 'b', 'conf': 90.0}]
+        }
+        mock_get_ocr_pool.return_value = pool
+        image = np.full((200, 200, 3), 255, dtype=np.uint8)
+        layout_elements = [
+            {'type': 'Title', 'coordinates': (10, 10, 100, 30), 'score': 0.9},
+            {'type': 'Figure', 'coordinates': (10, 40, 190, 120), 'score': 0.9},
+            {'type': 'List', 'coordinates': (10, 130, 100, 190), 'score': 0.9}
+        ]
+
+        result = perform_region_ocr(image, layout_elements)
+
+        self.assertEqual(pool.recognize.call_count, 2)  # The figure is never OCR'd
+        self.assertEqual(sorted(call.args[1] for call in pool.recognize.call_args_list), [4, 7])
+        self.assertEqual([element['type'] for element in result], ['Title', 'Figure', 'List'])
+        self.assertEqual(result[0]['text'], 'a b')
+        self.assertEqual(result[1]['text'], '')
+        self.assertEqual(result[2]['text'], 'a\nb')
+        # Word boxes are shifted back to page coordinates (crop origin is the padded block corner)
+        self.assertEqual((result[0]['words'][0]['left'], result[0]['words'][0]['top']), (7, 8))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from src.page_cache import PageCache, page_fingerprint
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_page_fingerprint_ignores_path(self):
+        image = np.zeros((50, 40, 3), dtype=np.uint8)
+        image[10:20, 10:20] = 255
+        first_path = os.path.join(self.test_dir, "first.png")
+        second_path = os.path.join(self.test_dir, "second.png")
+        cv2.imwrite(first_path, image)
+        cv2.imwrite(second_path, image)
+
+        self.assertEqual(page_fingerprint(first_path), page_fingerprint(second_path))
+        self.assertEqual(page_fingerprint(first_path), page_fingerprint(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+        image[0, 0] = 1
+        cv2.imwrite(second_path, image)
+        self.assertNotEqual(page_fingerprint(first_path), page_fingerprint(second_path))
+
+    def test_get_put_across_instances(self):
+        cache = PageCache(self.cache_dir)
+        self.assertIsNone(cache.get('ocr', 'abc', 'v1'))
+        cache.put('ocr', 'abc', 'v1', {'text': 'Hello', 'layout': []})
+        self.assertEqual(cache.get('ocr', 'abc', 'v1'), {'text': 'Hello', 'layout': []})
+
+        # A fresh process only sees the shared disk tier
+        other = PageCache(self.cache_dir)
+        self.assertEqual(other.get('ocr', 'abc', 'v1'), {'text': 'Hello', 'layout': []})
+        self.assertIsNone(other.get('ocr', 'abc', 'v2'))
+        self.assertIsNone(other.get('layout', 'abc', 'v1'))
+
+    def test_get_or_compute(self):
+        cache = PageCache(None)
+        calls = []
+        compute = lambda: calls.append(1) or []
+        self.assertEqual(cache.get_or_compute('layout', 'abc', 'v1', compute), [])
+        self.assertEqual(cache.get_or_compute('layout', 'abc', 'v1', compute), [])
+        self.assertEqual(len(calls), 1)
+
+    def test_memory_tier_is_bounded(self):
+        cache = PageCache(None, max_memory_entries=2)
+        for i in range(3):
+            cache.put('latex', str(i), 'v1', f"page {i}")
+        self.assertIsNone(cache.get('latex', '0', 'v1'))
+        self.assertEqual(cache.get('latex', '2', 'v1'), "page 2")
+
+    def test_disk_tier_is_bounded(self):
+        cache = PageCache(self.cache_dir, max_memory_entries=1, max_disk_bytes=20000)
+        for i in range(10):
+            cache.put('latex', str(i), 'v1', 'x' * 5000)
+        total = sum(os.path.getsize(os.path.join(root, name))
+                    for root, _, files in os.walk(self.cache_dir) for name in files)
+        self.assertLessEqual(total, 20000)
+        self.assertEqual(cache.get('latex', '9', 'v1'), 'x' * 5000)
+
+    def test_disk_tier_stores_json(self):
+        cache = PageCache(self.cache_dir)
+        layout = [{'type': 'Text', 'coordinates': (1.0, 2.0, 3.0, 4.0), 'score': np.float32(0.5)}]
+        cache.put('layout', 'abc', 'v1', layout)
+
+        other = PageCache(self.cache_dir)
+        self.assertEqual(other.get('layout', 'abc', 'v1'),
+                         [{'type': 'Text', 'coordinates': [1.0, 2.0, 3.0, 4.0], 'score': 0.5}])
+        files = [name for _, _, names in os.walk(self.cache_dir) for name in names]
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.json'))
+
+    def test_replacing_an_entry_keeps_the_size_accurate(self):
+        cache = PageCache(self.cache_dir)
+        for _ in range(5):
+            cache.put('latex', 'abc', 'v1', 'x' * 5000)
+        self.assertEqual(cache._disk_bytes, sum(size for _, size, _ in cache._disk_entries()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+import cv2
+import numpy as np
+from src.page_context import PageContext, as_page
+
+class TestPageContext(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.test_dir, "page.png")
+        self.bgr = np.zeros((40, 60, 3), dtype=np.uint8)
+        self.bgr[:, :, 0] = 255  # Blue in OpenCV channel order
+        cv2.imwrite(self.image_path, self.bgr)
+
+    def tearDown(self):
+        for file in os.listdir(self.test_dir):
+            os.remove(os.path.join(self.test_dir, file))
+        os.rmdir(self.test_dir)
+
+    def test_path_is_decoded_once(self):
+        page = PageContext.from_path(self.image_path)
+        with patch('src.page_context.cv2.imread', wraps=cv2.imread) as mock_imread:
+            page.gray
+            page.rgb
+            page.bgr
+            page.gray
+        self.assertEqual(mock_imread.call_count, 1)
+        self.assertEqual(page.shape, (40, 60))
+        self.assertTrue((page.rgb[:, :, 2] == 255).all())
+
+    def test_views_are_cached(self):
+        page = PageContext.from_array(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+        self.assertIs(page.gray, page.gray)
+        self.assertIs(page.bgr, page.bgr)
+        np.testing.assert_array_equal(page.bgr, self.bgr)
+
+    def test_as_page(self):
+        page = as_page(self.image_path)
+        self.assertIs(as_page(page), page)
+        self.assertEqual(as_page(np.zeros((10, 10), dtype=np.uint8)).rgb.shape, (10, 10, 3))
+        with self.assertRaises(ValueError):
+            as_page(os.path.join(self.test_dir, "missing.png")).rgb
+
+    def test_fingerprint_matches_across_sources(self):
+        from_path = PageContext.from_path(self.image_path)
+        from_array = PageContext.from_array(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+        self.assertEqual(from_path.fingerprint, from_array.fingerprint)
+
+if __name__ == '__main__':
+    unittest.main()
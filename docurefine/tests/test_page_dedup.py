@@ -0,0 +1,89 @@
+import unittest
+import cv2
+import numpy as np
+from unittest.mock import patch
+from src.page_dedup import PageIndex, dedup_scope, hamming_distance, is_blank, perceptual_hash
+
+def text_page(seed, size=(1100, 850)):
+    rng = np.random.default_rng(seed)
+    page = np.full(size + (3,), 250, dtype=np.uint8)
+    for _ in range(40):
+        top, left = rng.integers(50, size[0] - 50), rng.integers(50, size[1] - 300)
+        cv2.rectangle(page, (int(left), int(top)), (int(left) + int(rng.integers(50, 250)), int(top) + 12),
+                      (20, 20, 20), -1)
+    return page
+
+WORDS = ('revenue', 'quarter', 'region', 'growth', 'results', 'model', 'report', 'market', 'share', 'cost')
+
+def layout_page(seed, size=(1100, 850)):
+    """
+    A text page with a fixed layout: the same lines in the same places, filled with different words per seed.
+    """
+    rng = np.random.default_rng(seed)
+    page = np.full(size + (3,), 255, dtype=np.uint8)
+    for line in range(30):
+        x = 80
+        while x < size[1] - 200:
+            word = WORDS[rng.integers(len(WORDS))]
+            cv2.putText(page, word, (x, 100 + line * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (20, 20, 20), 2)
+            x += cv2.getTextSize(word + ' ', cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0][0]
+    return page
+
+def rescan(page):
+    page = cv2.GaussianBlur(page, (3, 3), 0)
+    _, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+class TestPageDedup(unittest.TestCase):
+    def test_blank_page_detection(self):
+        rng = np.random.default_rng(0)
+        noisy = np.clip(235 + rng.normal(0, 6, (1100, 850, 3)), 0, 255).astype(np.uint8)  # Tinted paper, scanner noise
+        self.assertTrue(is_blank(noisy))
+        self.assertFalse(is_blank(text_page(0)))
+
+        speck = noisy.copy()
+        speck[500:503, 400:403] = 0  # A dust speck is not content
+        self.assertTrue(is_blank(speck))
+
+    def test_rescanned_page_has_close_hash(self):
+        page = text_page(1)
+        self.assertLessEqual(hamming_distance(perceptual_hash(page), perceptual_hash(rescan(page))), 3)
+        self.assertGreater(hamming_distance(perceptual_hash(page), perceptual_hash(text_page(2))), 3)
+
+    def test_index_matches_near_identical_hashes(self):
+        page = text_page(3)
+        index = PageIndex('document:/tmp/test-index', max_distance=3, use_redis=False)
+        index.add('00000000000000ff', {'page_number': 1}, page)
+
+        self.assertEqual(index.lookup('00000000000000fe', page), {'page_number': 1})  # One bit apart
+        self.assertEqual(index.lookup('00000000000100ff', rescan(page)), {'page_number': 1})  # Different band
+        self.assertIsNone(index.lookup('0000000000000f00', page))  # Eight bits apart
+        self.assertIsNone(PageIndex('document:/tmp/other-index', use_redis=False).lookup('00000000000000ff', page))
+
+    def test_pages_sharing_a_layout_are_not_duplicates(self):
+        first, second = layout_page(1), layout_page(2)
+        index = PageIndex('document:/tmp/test-layout-index', max_distance=3, use_redis=False)
+        index.add(perceptual_hash(first), {'page_number': 1}, first)
+
+        # Even with identical hashes, a different page does not reuse the result
+        self.assertIsNone(index.lookup(perceptual_hash(first), second))
+        self.assertIsNone(index.lookup(perceptual_hash(second), second))
+        self.assertEqual(index.lookup(perceptual_hash(first), rescan(first)), {'page_number': 1})
+
+    def test_index_rejects_distance_that_does_not_divide_hash(self):
+        with self.assertRaises(ValueError):
+            PageIndex('global', max_distance=4, use_redis=False)
+
+    def test_lookup_errors_are_misses(self):
+        index = PageIndex('global', use_redis=True)
+        with patch('src.page_dedup.get_redis', side_effect=ConnectionError("Redis is down")):
+            self.assertIsNone(index.lookup('00000000000000ff', text_page(4)))
+            index.add('00000000000000ff', {'page_number': 1}, text_page(4))
+
+    def test_dedup_scope(self):
+        self.assertEqual(dedup_scope('/data/output/alice/doc1', 'document'), 'document:/data/output/alice/doc1')
+        self.assertEqual(dedup_scope('/data/output/alice/doc1', 'user'), 'user:/data/output/alice')
+        self.assertEqual(dedup_scope('/data/output/alice/doc1', 'global'), 'global')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 import os
 import tempfile
-from src.pdf_utils import split_document, split_pdf, reconstruct_pdf
+import numpy as np
+from src.pdf_utils import split_document, split_pdf, reconstruct_pdf, count_pages, page_ranges, rasterize_pdf, prefetch
+from src.pdf_utils import contiguous_ranges, classify_pdf_pages, native_text_quality
+from src.pdf_utils import StreamingPdfWriter
 from PyPDF2 import PdfReader
 
 class TestPdfUtils(unittest.TestCase):
@@ -40,6 +43,40 @@ class TestPdfUtils(unittest.TestCase):
         for path in result:
             self.assertTrue(os.path.exists(path))
 
+    def test_count_pages(self):
+        self.assertEqual(count_pages(self.sample_pdf_path), 2)
+
+    def test_page_ranges(self):
+        self.assertEqual(page_ranges(5, 2), [(1, 2), (3, 4), (5, 5)])
+        self.assertEqual(page_ranges(2, 8), [(1, 2)])
+
+    def test_contiguous_ranges(self):
+        self.assertEqual(contiguous_ranges([1, 2, 3, 5, 6, 9], 2), [(1, 2), (3, 3), (5, 6), (9, 9)])
+        self.assertEqual(contiguous_ranges([], 4), [])
+
+    def test_rasterize_pdf(self):
+        pages = list(rasterize_pdf(self.sample_pdf_path, first_page=2, dpi=72))
+        self.assertEqual([page_number for page_number, _ in pages], [2])
+        image = pages[0][1]
+        self.assertIsInstance(image, np.ndarray)
+        self.assertEqual(image.dtype, np.uint8)
+        self.assertEqual(image.shape[2], 3)
+        self.assertLess(image.min(), 255)  # The page text was drawn
+        self.assertEqual(os.listdir(self.test_dir), ["sample.pdf"])  # Nothing written to disk
+        
+        pages = list(rasterize_pdf(self.sample_pdf_path, dpi=72, pages={2}))
+        self.assertEqual([page_number for page_number, _ in pages], [2])
+
+    def test_prefetch(self):
+        self.assertEqual(list(prefetch(iter(range(10)), depth=3)), list(range(10)))
+
+        def failing():
+            yield 1
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            list(prefetch(failing()))
+
     def test_reconstruct_pdf(self):
         output_dir = os.path.join(self.test_dir, "output")
         os.makedirs(output_dir, exist_ok=True)
@@ -54,5 +91,91 @@ class TestPdfUtils(unittest.TestCase):
             pdf = PdfReader(f)
             self.assertEqual(len(pdf.pages), 2)
 
+    def test_streaming_pdf_writer(self):
+        output_path = os.path.join(self.test_dir, "streamed.pdf")
+        page = np.full((300, 200, 3), 255, dtype=np.uint8)
+        words = [{'text': 'Refined', 'left': 20, 'top': 30, 'width': 80, 'height': 20}]
+        
+        with StreamingPdfWriter(output_path, dpi=72) as pdf_writer:
+            pdf_writer.add_page(page, words=words)
+            pdf_writer.add_page(page)
+            pdf_writer.add_blank_page(200, 300)
+        
+        with open(output_path, 'rb') as f:
+            pdf = PdfReader(f)
+            self.assertEqual(len(pdf.pages), 3)
+            self.assertEqual(float(pdf.pages[0].mediabox.width), 200)
+            self.assertIn('Refined', pdf.pages[0].extract_text())
+            self.assertEqual(float(pdf.pages[2].mediabox.height), 300)
+
+    def test_streaming_pdf_writer_replaces_output_only_when_complete(self):
+        output_path = os.path.join(self.test_dir, "streamed.pdf")
+        link_path = os.path.join(self.test_dir, "linked.pdf")
+        page = np.full((300, 200, 3), 255, dtype=np.uint8)
+        with StreamingPdfWriter(output_path, dpi=72) as pdf_writer:
+            pdf_writer.add_page(page)
+        os.link(output_path, link_path)
+        with open(output_path, 'rb') as f:
+            original = f.read()
+        
+        with self.assertRaises(RuntimeError):
+            with StreamingPdfWriter(output_path, dpi=72) as pdf_writer:
+                pdf_writer.add_page(page)
+                raise RuntimeError("page failed")
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['linked.pdf', 'sample.pdf', 'streamed.pdf'])
+        
+        with StreamingPdfWriter(output_path, dpi=72) as pdf_writer:
+            pdf_writer.add_blank_page(100, 100)
+        with open(link_path, 'rb') as f:
+            self.assertEqual(f.read(), original)  # Rewriting the output leaves links to it alone
+
+    def create_classification_pdf(self, path):
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.utils import ImageReader
+        from PIL import Image
+        c = canvas.Canvas(path, pagesize=(612, 792))
+        # Page 1: born-digital, a title, a paragraph and a list
+        c.setFont('Helvetica-Bold', 20)
+        c.drawString(72, 700, "Quarterly Results")
+        c.setFont('Helvetica', 11)
+        for i in range(8):
+            c.drawString(72, 660 - 14 * i, f"Revenue grew in region {i} compared with the previous quarter.")
+        for i in range(3):
+            c.drawString(72, 500 - 14 * i, f"- Action item {i}")
+        c.showPage()
+        # Page 2: a scan, a full-page image with an invisible OCR text layer
+        c.drawImage(ImageReader(Image.new('RGB', (85, 110), 'white')), 0, 0, width=612, height=792)
+        text = c.beginText(72, 700)
+        text.setTextRenderMode(3)
+        text.setFont('Helvetica', 11)
+        for i in range(8):
+            text.textLine(f"Revenue grew in region {i} compared with the previous quarter.")
+        c.drawText(text)
+        c.showPage()
+        c.save()
+
+    def test_classify_pdf_pages(self):
+        path = os.path.join(self.test_dir, "mixed.pdf")
+        self.create_classification_pdf(path)
+        
+        pages = classify_pdf_pages(path, [1, 2], dpi=72)
+        
+        self.assertTrue(pages[1]['born_digital'])
+        self.assertFalse(pages[2]['born_digital'])
+        self.assertNotIn('merged_layout', pages[2])
+        
+        layout = pages[1]['merged_layout']
+        self.assertEqual([element['type'] for element in layout], ['Title', 'Text', 'List'])
+        self.assertEqual(layout[0]['text'], "Quarterly Results")
+        self.assertEqual(layout[2]['text'].split('\n')[0], "- Action item 0")
+        title_word = layout[0]['words'][0]
+        self.assertEqual((title_word['left'], title_word['text']), (72, "Quarterly"))
+        self.assertLess(title_word['top'], 100)  # Top-left origin, like the rasterized page
+
+    def test_native_text_quality(self):
+        self.assertEqual(native_text_quality("Plain text"), 1.0)
+        self.assertLess(native_text_quality("\ufffd\ufffd\ue000ab"), 0.5)
+        self.assertEqual(native_text_quality("   "), 0.0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import unittest
+import json
+import time
+from unittest.mock import patch, MagicMock
+from src.progress import stream_progress, page_done, progress_snapshot
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        patcher = patch('src.progress.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_page_done_publishes_eta(self):
+        pipeline = self.redis.pipeline.return_value
+        pipeline.execute.side_effect = [[3, ['10', str(time.time() - 30)]], []]
+
+        with patch('src.progress.current_workflow_id', return_value='task-1'):
+            page_done(4, {'ocr': 1.5})
+
+        channel, message = pipeline.publish.call_args.args
+        event = json.loads(message)
+        self.assertEqual(channel, 'progress:task-1')
+        self.assertEqual(event['type'], 'page')
+        self.assertEqual((event['done'], event['total']), (3, 10))
+        self.assertAlmostEqual(event['eta_seconds'], 70, delta=1)
+        self.assertEqual(event['timings'], {'ocr': 1.5})
+
+    def test_page_done_outside_a_task(self):
+        with patch('src.progress.current_workflow_id', return_value=None):
+            page_done(1)
+        self.redis.pipeline.assert_not_called()
+
+    def test_stream_sends_snapshot_then_events(self):
+        self.redis.hgetall.return_value = {'total': '2', 'done': '1', 'started_at': str(time.time())}
+        pubsub = self.redis.pubsub.return_value
+        pubsub.get_message.side_effect = [
+            None,
+            {'data': json.dumps({'type': 'page', 'done': 2, 'total': 2})},
+            {'data': json.dumps({'type': 'complete', 'result': []})},
+        ]
+
+        events = list(stream_progress('task-1', heartbeat=1))
+
+        self.assertTrue(events[0].startswith('event: progress\n'))
+        self.assertEqual(events[1], ': keep-alive\n\n')
+        self.assertTrue(events[2].startswith('event: page\n'))
+        self.assertTrue(events[3].startswith('event: complete\n'))
+        pubsub.subscribe.assert_called_once_with('progress:task-1')
+        pubsub.close.assert_called_once()
+
+    def test_stream_ends_when_task_finished_without_event(self):
+        self.redis.hgetall.return_value = {}
+        self.redis.pubsub.return_value.get_message.return_value = None
+
+        events = list(stream_progress('task-1', final_event=lambda: {'type': 'failed', 'result': 'boom'},
+                                      heartbeat=1))
+
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].startswith('event: failed\n'))
+
+    def test_snapshot_of_finished_workflow(self):
+        final = json.dumps({'type': 'complete', 'result': {'output_pdf_path': 'out.pdf'}})
+        self.redis.hgetall.return_value = {'total': '1', 'done': '1', 'started_at': '0', 'final': final}
+        self.assertEqual(progress_snapshot('task-1')['final']['type'], 'complete')
+
+if __name__ == '__main__':
+    unittest.main()
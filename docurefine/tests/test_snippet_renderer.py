@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+from src.snippet_renderer import SnippetRenderer, render_page
+
+class TestSnippetRenderer(unittest.TestCase):
+    def setUp(self):
+        self.renderer = SnippetRenderer(max_bytes=2 * 50 * 30 * 3)  # Two 50x30 bitmaps
+
+    def test_render_exact_size(self):
+        image = self.renderer.render('x^2 + y^2 = z^2', (320, 80))
+        self.assertEqual(image.shape, (80, 320, 3))
+        self.assertEqual(image.dtype, np.uint8)
+        self.assertTrue((image < 255).any())
+        self.assertFalse(image.flags.writeable)
+
+    def test_cache_hits_and_eviction(self):
+        first = self.renderer.render('a', (50, 30))
+        self.assertIs(self.renderer.render('a', (50, 30)), first)
+        self.assertEqual(self.renderer.hits, 1)
+
+        self.renderer.render('b', (50, 30))
+        self.renderer.render('c', (50, 30))
+        self.assertIsNot(self.renderer.render('a', (50, 30)), first)
+        self.assertEqual(self.renderer.misses, 4)
+        self.assertLessEqual(self.renderer._cache_bytes, self.renderer.max_bytes)
+
+    def test_trimmed_renders_are_cached_as_copies(self):
+        renderer = SnippetRenderer(max_bytes=1024 * 1024)
+        image = renderer.render_trimmed('x', (2000, 2000), dpi=100)
+        self.assertIs(renderer.render_trimmed('x', (2000, 2000), dpi=100), image)
+        self.assertIsNone(image.base)  # Not a view of the full canvas
+        self.assertEqual(renderer._cache_bytes, image.nbytes)
+
+    def test_render_page_is_trimmed(self):
+        image = render_page('x^2', dpi=100)
+        self.assertLess(image.shape[0], 1100)
+        self.assertLess(image.shape[1], 850)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from src.tex_pool import TexRenderPool, document_parts
+
+PREAMBLE = "\\documentclass{article}\n\\usepackage{amsmath}"
+
+def fake_pdflatex(arguments, cwd, env=None):
+    if 'job.tex' in arguments:
+        with open(os.path.join(cwd, 'job.tex')) as source, open(os.path.join(cwd, 'job.pdf'), 'w') as pdf:
+            pdf.write(source.read())
+
+class TestTexPool(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.pool = TexRenderPool(max_processes=2, cache_dir=os.path.join(self.test_dir, 'cache'),
+                                  preamble=PREAMBLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_document_parts(self):
+        self.assertEqual(document_parts("$x^2$"), (None, "$x^2$"))
+        preamble, body = document_parts(f"{PREAMBLE}\n\\begin{{document}}\nHello\n\\end{{document}}")
+        self.assertEqual(preamble.strip(), PREAMBLE)
+        self.assertEqual(body.strip(), "Hello")
+
+    def test_fragment_and_full_document_share_a_key(self):
+        full = f"{PREAMBLE}\n\\begin{{document}}Hello\\end{{document}}"
+        self.assertEqual(self.pool.source_key("Hello"), self.pool.source_key(full))
+        self.assertNotEqual(self.pool.source_key("Hello"), self.pool.source_key("World"))
+
+    def test_render_is_cached_and_isolated(self):
+        with patch.object(self.pool, '_run_pdflatex', side_effect=fake_pdflatex) as mock_run:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                outputs = [os.path.join(self.test_dir, f"out_{i}.pdf") for i in range(4)]
+                list(executor.map(lambda path: self.pool.render("$x^2$", path), outputs))
+
+            compiles = [call for call in mock_run.call_args_list if 'job.tex' in call.args[0]]
+            self.assertEqual(len(compiles), 1)
+            self.assertIn('-fmt=docurefine', compiles[0].args[0])
+            for path in outputs:
+                with open(path) as f:
+                    self.assertIn("$x^2$", f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from src.uploads import ChunkedUploadStore, UploadError, file_chain_hash, copy_output, file_sha256
+
+class TestChunkedUploads(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = ChunkedUploadStore(self.test_dir, chunk_size=4, max_size=64)
+        self.content = b'0123456789'
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def upload(self, state, start=0):
+        for offset in range(start, len(self.content), 4):
+            chunk = self.content[offset:offset + 4]
+            state = self.store.write_chunk(state['upload_id'], offset, io.BytesIO(chunk), len(chunk))
+        return state
+
+    def test_upload_and_commit(self):
+        state = self.upload(self.store.create('doc.pdf', len(self.content)))
+        self.assertEqual(state['offset'], len(self.content))
+        
+        committed = self.store.commit(state['upload_id'])
+        self.assertEqual(committed['path'], os.path.join(self.test_dir, 'doc.pdf'))
+        with open(committed['path'], 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(committed['content_hash'], file_chain_hash(committed['path'], chunk_size=4))
+        self.assertEqual(self.store.committed_path(state['upload_id']), committed['path'])
+
+    def test_resume_after_interrupted_chunk(self):
+        state = self.store.create('doc.pdf', len(self.content))
+        state = self.store.write_chunk(state['upload_id'], 0, io.BytesIO(b'0123'), 4)
+        
+        # The connection drops halfway through the second chunk
+        with self.assertRaises(UploadError) as error:
+            self.store.write_chunk(state['upload_id'], 4, io.BytesIO(b'45'), 4)
+        self.assertEqual(error.exception.offset, 4)
+        
+        resumed = self.store.get(state['upload_id'])
+        self.assertEqual(resumed['offset'], 4)
+        committed = self.store.commit(self.upload(resumed, start=4)['upload_id'])
+        self.assertEqual(committed['content_hash'], file_chain_hash(committed['path'], chunk_size=4))
+
+    def test_rejects_chunk_at_wrong_offset(self):
+        state = self.store.create('doc.pdf', len(self.content))
+        with self.assertRaises(UploadError) as error:
+            self.store.write_chunk(state['upload_id'], 4, io.BytesIO(b'4567'), 4)
+        self.assertEqual(error.exception.status, 409)
+        self.assertEqual(error.exception.offset, 0)
+
+    def test_rejects_short_chunk(self):
+        state = self.store.create('doc.pdf', len(self.content))
+        with self.assertRaises(UploadError):
+            self.store.write_chunk(state['upload_id'], 0, io.BytesIO(b'01'), 2)
+
+    def test_commit_incomplete_upload(self):
+        state = self.store.create('doc.pdf', len(self.content))
+        self.store.write_chunk(state['upload_id'], 0, io.BytesIO(b'0123'), 4)
+        with self.assertRaises(UploadError) as error:
+            self.store.commit(state['upload_id'])
+        self.assertEqual(error.exception.status, 409)
+        with self.assertRaises(UploadError):
+            self.store.committed_path(state['upload_id'])
+
+    def test_rejects_oversized_and_unknown_uploads(self):
+        with self.assertRaises(UploadError) as error:
+            self.store.create('doc.pdf', 65)
+        self.assertEqual(error.exception.status, 413)
+        with self.assertRaises(UploadError) as error:
+            self.store.get('../../etc/passwd')
+        self.assertEqual(error.exception.status, 404)
+    def test_copy_output(self):
+        source = os.path.join(self.test_dir, 'source.pdf')
+        with open(source, 'wb') as f:
+            f.write(self.content)
+        sha256 = file_sha256(source)
+        output = copy_output(source, os.path.join(self.test_dir, 'reused', 'reconstructed.pdf'), sha256)
+        self.assertFalse(os.path.samefile(source, output))
+        self.assertEqual(copy_output(output, output, sha256), output)
+        
+        with open(source, 'wb') as f:
+            f.write(b'another document')
+        with self.assertRaises(ValueError):
+            copy_output(source, output, sha256)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), self.content)  # A failed copy leaves the earlier output alone
+        self.assertEqual(os.listdir(os.path.dirname(output)), ['reconstructed.pdf'])
+
+if __name__ == '__main__':
+    unittest.main()